@@ -6,8 +6,107 @@ load_dotenv()
 # --- Telegram Bot Settings ---
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+# --- Update delivery ---
+# 'polling' (default) or 'webhook' (see app/core/webhook.py); webhook falls back to polling if it can't start
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL')              # public https URL, e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')                  # random per start if empty
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))  # updates waiting; 503 to Telegram when full
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '16'))          # updates processed concurrently
+
+# --- FSM storage (see app/core/storage.py) ---
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite').lower()        # 'sqlite' or 'memory'
+FSM_DB_PATH = os.getenv('FSM_DB_PATH', 'data/fsm.sqlite3')
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '0.5'))  # seconds writes are coalesced
+FSM_TTL = float(os.getenv('FSM_TTL', str(30 * 24 * 3600)))          # seconds of inactivity before a session is dropped
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '5000'))           # sessions kept in memory
+
+# --- Concurrency limits (see app/utils/backends.py, app/middlewares/serialization.py) ---
+SHEETS_CONCURRENCY = int(os.getenv('SHEETS_CONCURRENCY', '8'))         # Google Sheets calls in flight
+EXODE_CONCURRENCY = int(os.getenv('EXODE_CONCURRENCY', '8'))           # Exode calls in flight
+BACKEND_MAX_WAITING = int(os.getenv('BACKEND_MAX_WAITING', '100'))     # callers queued per backend before rejecting
+BACKEND_WAIT_TIMEOUT = float(os.getenv('BACKEND_WAIT_TIMEOUT', '10'))  # seconds to wait for a free slot
+USER_MAX_PENDING = int(os.getenv('USER_MAX_PENDING', '3'))             # updates per user waiting their turn
+
+# --- Staged startup (see app/core/startup.py) ---
+SHEETS_INIT_WAIT = float(os.getenv('SHEETS_INIT_WAIT', '20'))            # seconds a handler waits for its sheet to connect
+SHEETS_INIT_RETRY = float(os.getenv('SHEETS_INIT_RETRY', '5'))           # seconds before retrying a failed connect, doubled up to 5 min
+
+# --- Message cleanup (see app/utils/message_cleanup.py) ---
+CLEANUP_CONCURRENCY = int(os.getenv('CLEANUP_CONCURRENCY', '5'))                  # single deletes in flight when bulk delete fails
+CLEANUP_IN_BACKGROUND = os.getenv('CLEANUP_IN_BACKGROUND', 'true').lower() == 'true'  # don't block the next prompt
+
+# --- Metrics (see app/utils/metrics.py, app/core/metrics_server.py) ---
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9101'))                    # Prometheus /metrics, 0 disables
+METRICS_LOG_INTERVAL = float(os.getenv('METRICS_LOG_INTERVAL', '300'))   # seconds between log dumps, 0 disables
+
+# --- Admins and broadcasts (see app/utils/broadcast.py, app/handlers/admin.py) ---
+ADMIN_IDS = {int(x) for x in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if x}  # Telegram IDs allowed to use admin commands
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))                # messages per second across all chats
+BROADCAST_CHAT_INTERVAL = float(os.getenv('BROADCAST_CHAT_INTERVAL', '1'))  # seconds between messages to one chat
+BROADCAST_CHUNK_ROWS = int(os.getenv('BROADCAST_CHUNK_ROWS', '500'))     # recipients read per sheet request
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '25'))      # sends between checkpoints
+BROADCAST_CHECKPOINT_PATH = os.getenv('BROADCAST_CHECKPOINT_PATH', 'data/broadcast_checkpoint.json')
+
+# --- Catalog snapshots (see app/utils/catalog.py) ---
+CATALOG_MAX_SNAPSHOTS = int(os.getenv('CATALOG_MAX_SNAPSHOTS', '256'))
+
+# --- Callback data IDs (see app/utils/callback_ids.py) ---
+CALLBACK_IDS_MAX = int(os.getenv('CALLBACK_IDS_MAX', '50000'))   # names kept for decoding button presses
+
+# --- University search (see app/utils/search.py, app/utils/university_catalog.py, app/utils/university_overview.py) ---
+UNIVERSITY_CATALOG_REFRESH = float(os.getenv('UNIVERSITY_CATALOG_REFRESH', '900'))  # seconds between sheet checks, 0 loads once
+UNIVERSITY_CATALOG_CONCURRENCY = int(os.getenv('UNIVERSITY_CATALOG_CONCURRENCY', '4'))  # spreadsheets fetched at once per refresh
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '10'))                     # buttons in one results message
+
+# --- Inline mode (see app/utils/content_catalog.py, app/utils/inline_search.py) ---
+CONTENT_CATALOG_REFRESH = float(os.getenv('CONTENT_CATALOG_REFRESH', '900'))  # seconds between professions/courses checks, 0 loads once
+INLINE_CACHE_TTL = float(os.getenv('INLINE_CACHE_TTL', '600'))             # seconds a query's results are reused
+INLINE_CACHE_SIZE = int(os.getenv('INLINE_CACHE_SIZE', '2000'))            # distinct queries kept
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))             # cache_time hint for Telegram's own cache
+INLINE_PAGE_SIZE = int(os.getenv('INLINE_PAGE_SIZE', '20'))                # results per inline answer (Telegram allows 50)
+INLINE_MAX_RESULTS = int(os.getenv('INLINE_MAX_RESULTS', '60'))            # results per query across all pages
+
+# --- AI recommendations (see app/utils/ai_helpers.py) ---
+AI_BACKEND = os.getenv('AI_BACKEND', 'local')                      # model behind the results screen; 'local' is the deterministic stand-in
+AI_WORKERS = int(os.getenv('AI_WORKERS', '4'))                     # generations in flight
+AI_MAX_QUEUED = int(os.getenv('AI_MAX_QUEUED', '50'))              # requests waiting for a worker before rejecting
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT', '30'))                  # seconds per generation, and max wait in the queue
+AI_CACHE_SIZE = int(os.getenv('AI_CACHE_SIZE', '5000'))            # distinct answer sets kept
+AI_CACHE_TTL = float(os.getenv('AI_CACHE_TTL', str(24 * 3600)))    # seconds a recommendation is reused
+AI_STREAM_INTERVAL = float(os.getenv('AI_STREAM_INTERVAL', '1'))   # seconds between edits of the results message while streaming
+AI_LOCAL_DELAY = float(os.getenv('AI_LOCAL_DELAY', '0.3'))         # seconds between chunks of the local stand-in
+
+# --- Profession matching (see app/utils/profession_matcher.py) ---
+PROFESSION_MATCHES = int(os.getenv('PROFESSION_MATCHES', '5'))    # closest professions shown with the test results
+
+# --- Test attempts log (see app/utils/test_attempts.py) ---
+TEST_ATTEMPTS_PATH = os.getenv('TEST_ATTEMPTS_PATH', 'data/test_attempts.jsonl')            # append-only, one JSON line per finished test
+TEST_ATTEMPTS_FLUSH_INTERVAL = float(os.getenv('TEST_ATTEMPTS_FLUSH_INTERVAL', '5'))      # seconds attempts are queued before writing
+
 # --- Exode API Settings ---
-EXODE_API_BASE_URL = "https://api.exode.biz/saas/v2" 
+# Can be pointed at the local stand-in (python -m app.utils.exode_stub),
+# e.g. EXODE_API_BASE_URL=http://127.0.0.1:8081/saas/v2
+EXODE_API_BASE_URL = os.getenv('EXODE_API_BASE_URL', "https://api.exode.biz/saas/v2").rstrip('/')
+# Resilience policy shared by all Exode calls (see app/utils/resilience.py)
+EXODE_CALL_DEADLINE = float(os.getenv('EXODE_CALL_DEADLINE', '15'))       # seconds, whole call incl. retries
+EXODE_ATTEMPT_TIMEOUT = float(os.getenv('EXODE_ATTEMPT_TIMEOUT', '10'))   # seconds, single HTTP attempt
+EXODE_RETRY_ATTEMPTS = int(os.getenv('EXODE_RETRY_ATTEMPTS', '3'))        # idempotent calls only
+EXODE_CIRCUIT_FAILURES = int(os.getenv('EXODE_CIRCUIT_FAILURES', '5'))
+EXODE_CIRCUIT_RESET = float(os.getenv('EXODE_CIRCUIT_RESET', '30'))       # seconds in open state
+# User state cache (see app/utils/exode_state_cache.py)
+EXODE_STATE_FLUSH_DELAY = float(os.getenv('EXODE_STATE_FLUSH_DELAY', '0.5'))  # seconds writes are coalesced
+EXODE_STATE_CACHE_TTL = float(os.getenv('EXODE_STATE_CACHE_TTL', '300'))      # seconds a read is trusted
+# Sheets <-> Exode reconciliation job (see app/utils/reconciliation.py)
+RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', '21600'))     # seconds between runs, 0 disables
+RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', '4'))     # Exode lookups in flight
+RECONCILE_CHUNK_ROWS = int(os.getenv('RECONCILE_CHUNK_ROWS', '200'))     # rows read per sheet request
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '100'))     # cells per batch_update
+RECONCILE_CHECKPOINT_PATH = os.getenv('RECONCILE_CHECKPOINT_PATH', 'data/reconcile_checkpoint.json')
 SELLER_ID = os.getenv('SELLER_ID')
 EXODE_TOKEN = os.getenv('EXODE_TOKEN')
 SCHOOL_ID = os.getenv('SCHOOL_ID')
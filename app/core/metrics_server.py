@@ -0,0 +1,89 @@
+"""
+Metrics export: a Prometheus scrape endpoint and/or a periodic log dump.
+
+Works in both polling and webhook mode. The endpoint listens on its own port
+(METRICS_PORT, 0 disables it) so it is not exposed next to the public webhook;
+the log dump (METRICS_LOG_INTERVAL, 0 disables it) writes the slowest handlers
+and external calls by p95 for deployments without a Prometheus server.
+"""
+
+import asyncio
+import logging
+from typing import Iterable, Optional, Tuple
+
+from aiohttp import web
+
+from app.core.config import METRICS_HOST, METRICS_PORT, METRICS_LOG_INTERVAL
+from app.utils.backends import get_backend_stats
+from app.utils.exode_api import get_exode_stats
+from app.utils.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def collect_backends() -> Iterable[Tuple[str, str, dict, float]]:
+    """Current load of the Sheets/Exode pools and the Exode circuit state."""
+    for name, snapshot in get_backend_stats().items():
+        labels = {'backend': name}
+        yield 'bot_backend_in_flight', 'gauge', labels, snapshot['in_flight']
+        yield 'bot_backend_waiting', 'gauge', labels, snapshot['waiting']
+        yield 'bot_backend_limit', 'gauge', labels, snapshot['limit']
+    state = get_exode_stats()['circuit']['state']
+    yield 'bot_exode_circuit_state', 'gauge', {}, CIRCUIT_STATES.get(state, -1)
+
+
+class MetricsServer:
+    """Serves REGISTRY at /metrics and/or logs its summary periodically."""
+
+    def __init__(
+        self,
+        registry: MetricsRegistry = REGISTRY,
+        host: str = METRICS_HOST,
+        port: int = METRICS_PORT,
+        log_interval: float = METRICS_LOG_INTERVAL
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+        self._runner: Optional[web.AppRunner] = None
+        self._log_task: Optional[asyncio.Task] = None
+        registry.add_collector('backends', collect_backends)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        if self.port:
+            app = web.Application()
+            app.router.add_get('/metrics', self.handle_metrics)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logger.info(f"Metrics endpoint listening on {self.host}:{self.port}/metrics")
+        if self.log_interval > 0:
+            self._log_task = asyncio.create_task(self._log_loop())
+
+    async def stop(self):
+        if self._log_task:
+            self._log_task.cancel()
+            await asyncio.gather(self._log_task, return_exceptions=True)
+            self._log_task = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _log_loop(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            self.log_summary()
+
+    def log_summary(self, top: int = 5):
+        for metric_name, rows in self.registry.summary(top).items():
+            lines = ', '.join(
+                f"{row['labels']} p95={row['p95'] * 1000:.0f}ms mean={row['mean'] * 1000:.0f}ms n={row['count']}"
+                for row in rows
+            )
+            logger.info(f"{metric_name}: {lines}")
@@ -0,0 +1,158 @@
+"""
+Staged startup: Telegram first, Google Sheets in the background.
+
+Connecting the sheet managers (OAuth plus one open_by_key per spreadsheet)
+used to run serially before polling started. BackendInitializer connects them
+concurrently on the Sheets pool while the dispatcher is already receiving
+updates; a manager that fails to connect is retried with backoff instead of
+aborting the start. Handlers that need a manager which is not connected yet
+wait for it in app.middlewares.backend_ready. Background jobs that read the
+sheets (broadcast resume, reconciliation) are started through defer() once
+their manager is ready. StartupTimer logs when each phase finished and
+exports the timings as metrics.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app.core.config import SHEETS_INIT_RETRY
+from app.utils.backends import run_blocking, SHEETS
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 300.0
+
+STARTUP_SECONDS = REGISTRY.gauge(
+    'bot_startup_seconds', 'Seconds from process start to the end of a startup phase', ('phase',)
+)
+
+
+class StartupTimer:
+    """Cumulative timings of startup phases."""
+
+    def __init__(self, started: Optional[float] = None):
+        """
+        Args:
+            started: time.perf_counter() value of the process start (default: now)
+        """
+        self.started = time.perf_counter() if started is None else started
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """Record that `phase` has finished; returns seconds since start."""
+        elapsed = time.perf_counter() - self.started
+        self.phases[phase] = elapsed
+        STARTUP_SECONDS.set(phase, value=elapsed)
+        logger.info(f"Startup phase '{phase}' done at {elapsed:.3f}s")
+        return elapsed
+
+
+class BackendInitializer:
+    """Connects sheet managers concurrently in the background."""
+
+    def __init__(self, timer: Optional[StartupTimer] = None, retry_delay: float = SHEETS_INIT_RETRY):
+        """
+        Args:
+            timer: Startup timer to report '<name>_ready' / 'sheets_ready' phases to
+            retry_delay: Seconds before the first retry of a failed connection
+        """
+        self.timer = timer
+        self.retry_delay = retry_delay
+        self._managers: Dict[str, Any] = {}
+        self._ready: Dict[str, asyncio.Event] = {}
+        self._errors: Dict[str, str] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, name: str, manager: Any):
+        """Register a manager with a connect() method under its dispatcher key."""
+        self._managers[name] = manager
+        self._ready[name] = asyncio.Event()
+
+    @property
+    def names(self) -> Set[str]:
+        return set(self._managers)
+
+    def is_ready(self, name: str) -> bool:
+        event = self._ready.get(name)
+        return event is None or event.is_set()
+
+    def status(self) -> Dict[str, str]:
+        """'ready', 'connecting' or the last connection error per manager."""
+        return {
+            name: 'ready' if self.is_ready(name) else self._errors.get(name, 'connecting')
+            for name in self._managers
+        }
+
+    async def start(self):
+        """Start connecting all managers; registered on dispatcher startup, returns immediately."""
+        for name in self._managers:
+            self._spawn(self._connect(name))
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def wait(self, *names: str, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the given managers (all if none given) are connected.
+
+        Returns:
+            False if `timeout` expired first
+        """
+        pending = [self._ready[n].wait() for n in (names or self._managers) if not self.is_ready(n)]
+        if not pending:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.gather(*pending), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def defer(self, callback: Callable[[], Awaitable[Any]], *names: str) -> Callable[[], Awaitable[None]]:
+        """
+        Wrap `callback` into a startup hook that runs it in the background
+        once the given managers are connected (right away if none given).
+        """
+        async def run():
+            await self.wait(*names)
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Deferred startup task {getattr(callback, '__qualname__', callback)} failed: {e}",
+                             exc_info=True)
+
+        async def hook():
+            self._spawn(run())
+        return hook
+
+    def _spawn(self, coro: Awaitable[Any]):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _connect(self, name: str):
+        manager = self._managers[name]
+        delay = self.retry_delay
+        while True:
+            started = time.perf_counter()
+            try:
+                await run_blocking(SHEETS, manager.connect)
+                break
+            except Exception as e:
+                self._errors[name] = f"{type(e).__name__}: {e}"
+                logger.error(f"Failed to connect {name}, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+        self._errors.pop(name, None)
+        self._ready[name].set()
+        logger.info(f"{name} connected in {time.perf_counter() - started:.2f}s")
+        if self.timer:
+            self.timer.mark(f"{name}_ready")
+            if all(event.is_set() for event in self._ready.values()):
+                self.timer.mark('sheets_ready')
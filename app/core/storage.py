@@ -0,0 +1,316 @@
+"""
+Persistent FSM storage backed by SQLite (WAL mode).
+
+Reads and writes go to an in-memory cache; dirty keys are written to SQLite in
+one transaction by a background flush task every `flush_interval` seconds, so
+a burst of update_data() calls from one handler costs a single row write.
+Every key expires `ttl` seconds after its last activity: expired rows are
+treated as empty on load and removed by a periodic sweeper, and idle entries
+are evicted from the cache, so neither memory nor the database grow without
+bound. All SQLite work runs on one dedicated thread.
+
+State survives restarts; on shutdown the dispatcher calls close(), which
+flushes whatever is still pending.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.core.config import FSM_FLUSH_INTERVAL, FSM_TTL, FSM_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fsm_updated_at ON fsm (updated_at);
+"""
+
+
+class _Entry:
+    __slots__ = ('state', 'data', 'touched_at')
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], touched_at: float):
+        self.state = state
+        self.data = data
+        self.touched_at = touched_at
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage: write-coalescing cache in front of SQLite."""
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        ttl: float = FSM_TTL,
+        cache_size: int = FSM_CACHE_SIZE,
+        sweep_interval: float = 3600.0
+    ):
+        """
+        Args:
+            path: SQLite database file (':memory:' is allowed for tests/benchmarks)
+            flush_interval: Seconds dirty keys are held before being written
+            ttl: Seconds of inactivity after which a key is dropped (0 = never)
+            cache_size: Max keys kept in memory; only clean keys are evicted
+            sweep_interval: Seconds between removals of expired rows
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.sweep_interval = sweep_interval
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fsm-sqlite')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Ключи, которые нужно записать целиком / у которых нужно только продлить TTL
+        self._dirty: set = set()
+        self._touched: set = set()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'flushes': 0, 'rows_written': 0, 'expired': 0}
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(self._key(key), entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = dict(data)
+        self._mark_dirty(self._key(key), entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def close(self) -> None:
+        """Flush pending writes and close the database."""
+        if self._closed:
+            return
+        self._closed = True
+        for task in (self._flush_task, self._sweep_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await self.flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+    # --- Кэш ---
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id,
+            getattr(key, 'thread_id', None), getattr(key, 'business_connection_id', None),
+            key.destiny
+        ))
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        str_key = self._key(key)
+        now = time.time()
+        entry = self._cache.get(str_key)
+        if entry is not None:
+            if not self._expired(entry.touched_at, now):
+                self.stats['hits'] += 1
+                self._cache.move_to_end(str_key)
+                entry.touched_at = now
+                if str_key not in self._dirty:
+                    self._touched.add(str_key)
+                    self._ensure_tasks()
+                return entry
+            self.stats['expired'] += 1
+            del self._cache[str_key]
+            self._dirty.discard(str_key)
+
+        # Параллельные промахи по одному ключу читают базу один раз
+        if str_key in self._loading:
+            return await asyncio.shield(self._loading[str_key])
+        future = asyncio.get_running_loop().create_future()
+        self._loading[str_key] = future
+        try:
+            self.stats['misses'] += 1
+            row = await self._run(self._load, str_key)
+            if row is None or self._expired(row[2], now):
+                if row is not None:
+                    self.stats['expired'] += 1
+                entry = _Entry(None, {}, now)
+            else:
+                entry = _Entry(row[0], row[1], now)
+                self._touched.add(str_key)
+                self._ensure_tasks()
+            # Пока шло чтение, ключ мог быть записан
+            entry = self._cache.setdefault(str_key, entry)
+            self._cache.move_to_end(str_key)
+            self._evict()
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(str_key, None)
+
+    def _mark_dirty(self, str_key: str, entry: _Entry):
+        self.stats['writes'] += 1
+        entry.touched_at = time.time()
+        self._dirty.add(str_key)
+        self._touched.discard(str_key)
+        if self._closed:
+            logger.warning("FSM storage is closed, write will not be persisted")
+            return
+        self._ensure_tasks()
+
+    def _expired(self, touched_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - touched_at > self.ttl
+
+    def _evict(self):
+        while len(self._cache) > self.cache_size:
+            for str_key in self._cache:
+                if str_key not in self._dirty:
+                    del self._cache[str_key]
+                    self._touched.discard(str_key)
+                    break
+            else:
+                return
+
+    # --- Фоновые задачи ---
+
+    def _ensure_tasks(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if self.ttl and (self._sweep_task is None or self._sweep_task.done()):
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"FSM flush failed: {e}", exc_info=True)
+            if not self._dirty and not self._touched:
+                return
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"FSM sweep failed: {e}", exc_info=True)
+
+    async def flush(self):
+        """Write all dirty keys (and TTL renewals) in one transaction."""
+        if not self._dirty and not self._touched:
+            return
+        dirty, self._dirty = self._dirty, set()
+        touched, self._touched = self._touched, set()
+        rows = []
+        for str_key in dirty:
+            entry = self._cache.get(str_key)
+            if entry is not None:
+                rows.append((str_key, entry.state, _dumps(entry.data), entry.touched_at))
+        touches = [
+            (self._cache[str_key].touched_at, str_key)
+            for str_key in touched if str_key in self._cache
+        ]
+        try:
+            await self._run(self._write, rows, touches)
+        except Exception:
+            # Повторим в следующий раз; более новые записи уже в _dirty
+            self._dirty |= dirty
+            self._touched |= touched
+            raise
+        self.stats['flushes'] += 1
+        self.stats['rows_written'] += len(rows)
+
+    async def sweep(self) -> int:
+        """Delete expired rows and drop idle keys from the cache."""
+        now = time.time()
+        for str_key in [k for k, e in self._cache.items() if self._expired(e.touched_at, now) and k not in self._dirty]:
+            del self._cache[str_key]
+            self._touched.discard(str_key)
+        deleted = await self._run(self._delete_expired, now - self.ttl)
+        if deleted:
+            self.stats['expired'] += deleted
+            logger.info(f"FSM storage: removed {deleted} expired keys")
+        return deleted
+
+    # --- SQLite (выполняется в отдельном потоке) ---
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and self.path != ':memory:':
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _load(self, str_key: str) -> Optional[Tuple[Optional[str], Dict[str, Any], float]]:
+        row = self._connection().execute(
+            'SELECT state, data, updated_at FROM fsm WHERE key = ?', (str_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def _write(self, rows: List[tuple], touches: List[tuple]):
+        conn = self._connection()
+        with conn:
+            if rows:
+                conn.executemany(
+                    'INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET state = excluded.state, '
+                    'data = excluded.data, updated_at = excluded.updated_at',
+                    rows
+                )
+            if touches:
+                conn.executemany('UPDATE fsm SET updated_at = ? WHERE key = ?', touches)
+
+    def _delete_expired(self, older_than: float) -> int:
+        conn = self._connection()
+        with conn:
+            return conn.execute('DELETE FROM fsm WHERE updated_at < ?', (older_than,)).rowcount
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    try:
+        return json.dumps(data, ensure_ascii=False)
+    except TypeError as e:
+        logger.error(f"Non-JSON value in FSM data, storing it as a string: {e}")
+        return json.dumps(data, ensure_ascii=False, default=str)
@@ -0,0 +1,203 @@
+"""
+Webhook serving mode.
+
+Telegram POSTs updates to an embedded aiohttp app. The request handler only
+checks the secret token, parses the update and puts it into a bounded
+in-process queue; a fixed pool of workers feeds queued updates to the
+dispatcher. When the queue is full the handler answers 503, so Telegram keeps
+the update and redelivers it later instead of the bot buffering without bound.
+Queue depth, rejections and processing latency are exported through the
+metrics registry, i.e. on the local METRICS_PORT endpoint, never next to the
+public webhook path.
+"""
+
+import asyncio
+import logging
+import secrets
+import time
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from app.core.config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+)
+from app.utils.metrics import REGISTRY
+from app.utils.resilience import EndpointStats
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """aiohttp webhook endpoint with a bounded update queue and a worker pool."""
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = WEBHOOK_PATH,
+        secret: Optional[str] = WEBHOOK_SECRET,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        workers: int = WEBHOOK_WORKERS
+    ):
+        """
+        Args:
+            dp: Dispatcher the updates are fed to
+            bot: Bot instance
+            path: URL path of the webhook
+            secret: Secret token Telegram must send; a random one is generated if empty
+            queue_size: Max updates waiting for a worker
+            workers: Number of updates processed concurrently
+        """
+        self.dp = dp
+        self.bot = bot
+        self.path = '/' + path.strip('/')
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self._worker_tasks: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._accepting = False
+        self.latency = EndpointStats()
+        self.counters = {'received': 0, 'rejected_full': 0, 'rejected_auth': 0, 'bad_request': 0,
+                         'processed': 0, 'failed': 0}
+        self.in_flight = 0
+        self.max_depth = 0
+        REGISTRY.add_collector('webhook', self.collect_metrics)
+
+    # --- HTTP ---
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            self.counters['rejected_auth'] += 1
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except Exception as e:
+            self.counters['bad_request'] += 1
+            logger.error(f"Malformed webhook update: {e}")
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже, обновление не теряется
+            self.counters['rejected_full'] += 1
+            return web.Response(status=503, headers={'Retry-After': '1'})
+
+        self.counters['received'] += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return web.Response()
+
+    def collect_metrics(self):
+        """Queue gauges and counters for the Prometheus endpoint."""
+        yield 'bot_webhook_queue_depth', 'gauge', {}, self.queue.qsize()
+        yield 'bot_webhook_queue_capacity', 'gauge', {}, self.queue.maxsize
+        yield 'bot_webhook_in_flight', 'gauge', {}, self.in_flight
+        for name, value in self.counters.items():
+            yield 'bot_webhook_updates_total', 'counter', {'outcome': name}, value
+        for stage, snapshot in self.latency.snapshot().items():
+            yield 'bot_webhook_latency_p95_seconds', 'gauge', {'stage': stage}, snapshot['p95']
+
+    # --- Обработка ---
+
+    async def _worker(self):
+        while True:
+            enqueued_at, update = await self.queue.get()
+            started = time.monotonic()
+            self.latency.record('queue_wait', started - enqueued_at, 'ok')
+            self.in_flight += 1
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.counters['processed'] += 1
+                outcome = 'ok'
+            except Exception as e:
+                self.counters['failed'] += 1
+                outcome = 'error'
+                logger.error(f"Failed to process update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+            self.latency.record('process', time.monotonic() - started, outcome)
+
+    # --- Жизненный цикл ---
+
+    async def setup(self, base_url: str, host: str, port: int):
+        """Start workers and the HTTP server, then register the webhook."""
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._accepting = True
+
+        await self.bot.set_webhook(
+            url=f"{base_url.rstrip('/')}{self.path}",
+            secret_token=self.secret,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            max_connections=min(100, max(1, self.workers * 2)),
+            # Накопленные за время деплоя обновления сохраняются
+            drop_pending_updates=False
+        )
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+    async def shutdown(self, drain_timeout: float = 10.0):
+        """Stop accepting updates, drain the queue and stop workers."""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.queue.qsize()} updates left in the queue on shutdown")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    base_url: Optional[str] = WEBHOOK_BASE_URL,
+    host: str = WEBAPP_HOST,
+    port: int = WEBAPP_PORT
+) -> bool:
+    """
+    Serve updates through the webhook until cancelled.
+
+    Returns:
+        False if the webhook could not be set up (the caller falls back to
+        polling); otherwise runs until the task is cancelled.
+    """
+    if not base_url:
+        logger.error("BOT_MODE=webhook, but WEBHOOK_BASE_URL is not set")
+        return False
+
+    server = WebhookServer(dp, bot)
+    dp['webhook_server'] = server
+    try:
+        await server.setup(base_url, host, port)
+    except Exception as e:
+        logger.error(f"Failed to start webhook mode: {e}", exc_info=True)
+        await server.shutdown(drain_timeout=0)
+        return False
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.shutdown()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+        await bot.session.close()
+    return True
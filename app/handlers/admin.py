@@ -0,0 +1,83 @@
+import html
+
+from aiogram import Router, F, types
+from aiogram.filters import Command, CommandObject
+
+from app.core.config import ADMIN_IDS
+from app.utils.broadcast import Broadcaster, AUDIENCES, format_status
+from app.utils.test_attempts import TestAttemptStore
+from app.utils.test_content import SCALES_INFO
+
+router = Router()
+# Все команды роутера доступны только администраторам из ADMIN_IDS
+router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+
+BROADCAST_USAGE = (
+    "Ответьте на сообщение, которое нужно разослать, командой\n"
+    "/broadcast parents | students | all\n\n"
+    "/broadcast_status — прогресс рассылки\n"
+    "/broadcast_cancel — остановить рассылку"
+)
+
+
+@router.message(Command("broadcast"))
+async def broadcast_handler(message: types.Message, command: CommandObject, broadcaster: Broadcaster):
+    """Запускает рассылку копии сообщения, на которое ответил администратор."""
+    audience = (command.args or '').strip().lower()
+    if not message.reply_to_message or audience not in AUDIENCES:
+        await message.answer(BROADCAST_USAGE)
+        return
+    if broadcaster.is_running:
+        await message.answer("Рассылка уже идёт.\n\n" + format_status(broadcaster.status()))
+        return
+
+    broadcaster.start(
+        audience=audience,
+        from_chat_id=message.chat.id,
+        message_id=message.reply_to_message.message_id,
+        admin_id=message.from_user.id
+    )
+    await message.answer(f"🚀 Рассылка для '{audience}' запущена. Отчёт придёт по завершении.")
+
+
+@router.message(Command("broadcast_status"))
+async def broadcast_status_handler(message: types.Message, broadcaster: Broadcaster):
+    status = broadcaster.status()
+    if not status:
+        await message.answer("Рассылок ещё не было.")
+        return
+    title = "⏳ Рассылка идёт." if status['running'] else "Последняя рассылка:"
+    await message.answer(f"{title}\n\n{format_status(status)}")
+
+
+@router.message(Command("broadcast_cancel"))
+async def broadcast_cancel_handler(message: types.Message, broadcaster: Broadcaster):
+    if await broadcaster.cancel():
+        await message.answer("⛔ Рассылка остановлена.\n\n" + format_status(broadcaster.status()))
+    else:
+        await message.answer("Сейчас нет активной рассылки.")
+
+
+TEST_STATS_DIMENSIONS = {'city': "городам", 'age': "возрасту", 'role': "ролям"}
+TEST_STATS_ROWS = 15
+
+
+@router.message(Command("test_stats"))
+async def test_stats_handler(message: types.Message, command: CommandObject, test_attempts: TestAttemptStore):
+    """Распределение ведущих шкал STEM-теста: /test_stats [city | age | role]."""
+    dimension = (command.args or 'city').strip().lower()
+    if dimension not in TEST_STATS_DIMENSIONS:
+        await message.answer("/test_stats city | age | role — ведущие шкалы теста по городам, возрасту или ролям")
+        return
+
+    total = test_attempts.aggregates.distribution('all')
+    if not total:
+        await message.answer("Тест ещё никто не прошёл.")
+        return
+
+    lines = [f"📊 Ведущие шкалы по {TEST_STATS_DIMENSIONS[dimension]} (всего попыток: {total[0][1]})\n"]
+    for value, attempts, shares in test_attempts.aggregates.distribution(dimension)[:TEST_STATS_ROWS]:
+        leading = sorted(shares.items(), key=lambda item: -item[1])[:3]
+        parts = ", ".join(f"{SCALES_INFO[scale]['title']} {share:.0%}" for scale, share in leading if share)
+        lines.append(f"<b>{html.escape(value)}</b> — {attempts}: {parts}")
+    await message.answer("\n".join(lines))
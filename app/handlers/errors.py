@@ -0,0 +1,27 @@
+import logging
+
+from aiogram import Router
+from aiogram.filters import ExceptionTypeFilter
+from aiogram.types import ErrorEvent
+
+from app.utils.backends import BackendBusyError
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+BUSY_TEXT = "⏳ Сейчас много запросов. Пожалуйста, повторите через минуту."
+
+
+@router.error(ExceptionTypeFilter(BackendBusyError))
+async def backend_busy_handler(event: ErrorEvent):
+    """Перегрузка Google Sheets / Exode: вежливо просим повторить, а не молчим."""
+    logger.warning(f"Update {event.update.update_id} rejected: {event.exception}")
+    update = event.update
+    try:
+        if update.callback_query:
+            await update.callback_query.answer(BUSY_TEXT, show_alert=True)
+        elif update.message:
+            await update.message.answer(BUSY_TEXT)
+    except Exception as e:
+        logger.error(f"Failed to notify user about busy backend: {e}")
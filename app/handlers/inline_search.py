@@ -0,0 +1,92 @@
+import html
+
+from aiogram import Router, types
+
+from app.core.config import INLINE_CACHE_TIME, INLINE_PAGE_SIZE
+from app.handlers.stem_navigator import PRIMARY_FIELDS
+from app.handlers.universities import VISIBLE_PROGRAM_FIELDS
+from app.utils.content_catalog import PROFESSION_TITLE
+from app.utils.inline_search import InlineSearch, PROFESSION, COURSE, COURSE_TITLE
+from app.utils.search import SearchDocument
+from app.utils.university_catalog import UniversityCatalog, UNIVERSITY, FACULTY, PROGRAM
+
+router = Router()
+
+KIND_ICONS = {PROFESSION: "💼", COURSE: "📚", UNIVERSITY: "🎓", FACULTY: "🏛", PROGRAM: "📘"}
+# Поля карточки профессии: колонки листа и встроенное поле зарплаты
+PROFESSION_CARD_FIELDS = PRIMARY_FIELDS + ["Сколько зарабатывают"]
+MESSAGE_LIMIT = 4096
+# Пока каталоги грузятся, Telegram не должен запоминать пустой ответ
+LOADING_CACHE_TIME = 5
+EMPTY_QUERY_BUTTON = "🔎 Профессии, курсы и вузы — в боте"
+
+
+def _card(title: str, fields) -> str:
+    """Карточка для отправки в чат: заголовок и непустые поля (значения экранируются)."""
+    parts = [f"<b>{html.escape(str(title))}</b>\n"]
+    for name, value in fields:
+        if value not in (None, ''):
+            parts.append(f"<b>{name}:</b> {html.escape(str(value))}")
+    text = "\n".join(parts)
+    return text if len(text) <= MESSAGE_LIMIT else text[:MESSAGE_LIMIT - 1] + "…"
+
+
+def _document_card(document: SearchDocument, university_catalog: UniversityCatalog) -> str:
+    record = document.payload
+    if document.kind == PROFESSION:
+        return _card(record.get(PROFESSION_TITLE), ((f, record.get(f)) for f in PROFESSION_CARD_FIELDS))
+    if document.kind == COURSE:
+        return _card(record.get(COURSE_TITLE), (
+            ("Описание", record.get('Описание')), ("Длительность", record.get('Длительность')),
+            ("Цена", record.get('Цена')),
+        ))
+    if document.kind == PROGRAM:
+        programs = university_catalog.worksheets.get((record['sheet_id'], record['sheet_name']), ())
+        if record['program_row'] < len(programs):
+            program = programs[record['program_row']]
+            universities = university_catalog.universities(record['sheet_id'], record['city'])
+            university = universities[record['uni_index']].get('Наименования ВОУ') if record['uni_index'] < len(universities) else None
+            return _card(program.get("Название программы"), [("Вуз", university)] + [
+                (f, program.get(f)) for f in VISIBLE_PROGRAM_FIELDS if f != "Название программы"
+            ])
+    if document.kind == FACULTY:
+        return _card(document.title, (("Вуз", document.subtitle), ("Город", record['city'])))
+    return _card(document.title, (("Город", record['city']), ("Тип", record['uni_type'])))
+
+
+def _article(document: SearchDocument, university_catalog: UniversityCatalog, bot_link: str):
+    markup = types.InlineKeyboardMarkup(inline_keyboard=[[
+        types.InlineKeyboardButton(text="🤖 Открыть в Stemio", url=bot_link)
+    ]])
+    return types.InlineQueryResultArticle(
+        id=f"{document.kind}:{document.doc_id}",
+        title=f"{KIND_ICONS.get(document.kind, '')} {document.title}",
+        description=document.subtitle,
+        input_message_content=types.InputTextMessageContent(
+            message_text=_document_card(document, university_catalog)
+        ),
+        reply_markup=markup,
+    )
+
+
+@router.inline_query()
+async def inline_search_handler(inline_query: types.InlineQuery, inline_search: InlineSearch, university_catalog: UniversityCatalog):
+    """Поиск профессий, курсов и вузов из любого чата: @bot <запрос>."""
+    query = inline_query.query.strip()
+    if not query:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME, button=types.InlineQueryResultsButton(
+            text=EMPTY_QUERY_BUTTON, start_parameter="inline"
+        ))
+        return
+
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    documents = inline_search.search(query)
+    page = documents[offset:offset + INLINE_PAGE_SIZE]
+    bot_link = f"https://t.me/{(await inline_query.bot.me()).username}"
+    next_offset = str(offset + len(page)) if offset + len(page) < len(documents) else ''
+    await inline_query.answer(
+        [_article(document, university_catalog, bot_link) for document in page],
+        cache_time=INLINE_CACHE_TIME if inline_search.ready else LOADING_CACHE_TIME,
+        is_personal=False,
+        next_offset=next_offset
+    )
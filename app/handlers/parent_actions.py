@@ -4,9 +4,14 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from app.states.registration import ParentActions, StemNavigator
 from app.utils.google_sheets import RegistrationGSheet
+from app.utils.backends import run_blocking, SHEETS
+from app.utils.catalog import STALE_SNAPSHOT_TEXT
+from app.keyboards.callbacks import ChildCallback
 from app.keyboards.inline import get_about_test_keyboard
 from app.keyboards.inline import get_parent_start_test_keyboard 
 from app.handlers.stem_navigator import show_test_results
+from app.utils.ai_helpers import RecommendationService
+from app.utils.profession_matcher import ProfessionMatcher
 
 router = Router()
 
@@ -18,7 +23,7 @@ def get_children_keyboard(children: list, lexicon: dict, lang: str):
 
         builder.row(types.InlineKeyboardButton(
             text=child_name,
-            callback_data=f"select_child_{child_name}"
+            callback_data=ChildCallback.of(child_name)
         ))
     builder.row(types.InlineKeyboardButton(
         text=lexicon[lang]['button-back'], 
@@ -34,7 +39,7 @@ async def select_child_for_test_handler(callback: types.CallbackQuery, state: FS
     Показывает список детей для выбора.
     """
     lang = (await state.get_data()).get('language', 'ru')
-    children = registration_manager.get_children_by_parent_id(callback.from_user.id)
+    children = await run_blocking(SHEETS, registration_manager.get_children_by_parent_id, callback.from_user.id)
 
     if not children:
         await callback.answer("У вас еще нет добавленных детей. Сначала добавьте ребенка в профиле.", show_alert=True)
@@ -48,13 +53,16 @@ async def select_child_for_test_handler(callback: types.CallbackQuery, state: FS
     await callback.answer()
 
 
-@router.callback_query(ParentActions.choosing_child_for_test, F.data.startswith("select_child_"))
-async def start_test_for_child_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+@router.callback_query(ParentActions.choosing_child_for_test, ChildCallback.filter())
+async def start_test_for_child_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, callback_data: ChildCallback):
     """
     Шаг 2: Запускается после выбора ребенка.
     Показывает инструкцию к тесту и кнопку 'Начать'.
     """
-    child_name = callback.data.split('_', 2)[2]
+    child_name = callback_data.resolve()
+    if child_name is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     await state.update_data(test_for_child=child_name)
     
     lang = (await state.get_data()).get('language', 'ru')
@@ -70,7 +78,8 @@ async def start_test_for_child_handler(callback: types.CallbackQuery, state: FSM
     await callback.answer()
 
 @router.message(F.text.in_({"🧭 STEM-навигатор", "🧭 STEM-navigator"}))
-async def parent_stem_navigator_start(message: types.Message, state: FSMContext, lexicon: dict):
+async def parent_stem_navigator_start(message: types.Message, state: FSMContext, lexicon: dict,
+                                      recommendations: RecommendationService, profession_matcher: ProfessionMatcher):
 
     await message.delete()
     user_data = await state.get_data()
@@ -83,7 +92,7 @@ async def parent_stem_navigator_start(message: types.Message, state: FSMContext,
             id="mock_callback_id", from_user=message.from_user, chat_instance="",
             message=mock_callback_message, data="show_results"
         )
-        await show_test_results(mock_callback, state, lexicon)
+        await show_test_results(mock_callback, state, lexicon, recommendations, profession_matcher)
         
     else:
         intro_text = "Ваш ребенок может пройти тест по профориентации, чтобы определить свои сильные стороны и получить рекомендации по подходящим профессиям и направлениям для учёбы."
@@ -3,13 +3,36 @@ from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from app.states.registration import ProfessionsExplorer 
-from app.utils.google_sheets import ProfessionsGSheet
+from app.utils.catalog import STALE_SNAPSHOT_TEXT
+from app.utils.professions_tree import ProfessionsNavigator, ProfessionsTree
 from app.handlers.stem_navigator import PRIMARY_FIELDS, ADDITIONAL_FIELDS
 
 router = Router()
 
+
+def _profession_from_state(professions_navigator: ProfessionsNavigator, user_data: dict, prof_index: int):
+    """Профессия по индексу внутри выбранного направления (или None)."""
+    tree = professions_navigator.get(user_data.get('professions_tree'))
+    direction_index = user_data.get('direction_index')
+    if tree is None or direction_index is None:
+        return None
+    return tree.profession(None, direction_index, prof_index)
+
+
+def _directions_keyboard(tree: ProfessionsTree):
+    """Все направления всех шкал."""
+    builder = InlineKeyboardBuilder()
+    for index, direction in enumerate(tree.directions()):
+        builder.row(types.InlineKeyboardButton(
+            text=direction.title,
+            callback_data=f"explore_dir_{index}" 
+        ))
+    
+    builder.row(types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_main_menu"))
+    return builder.as_markup()
+
 @router.message(F.text.in_({"💼 Профессии"}))
-async def professions_start_handler(message: types.Message, state: FSMContext, professions_manager: ProfessionsGSheet):
+async def professions_start_handler(message: types.Message, state: FSMContext, professions_navigator: ProfessionsNavigator):
     await message.delete()
     user_data = await state.get_data()
     if menu_msg_id := user_data.get('main_menu_message_id'):
@@ -19,52 +42,47 @@ async def professions_start_handler(message: types.Message, state: FSMContext, p
             pass  
     await state.clear() 
 
-    all_professions = professions_manager.get_all_professions()
+    tree = professions_navigator.tree
 
-    if not all_professions:
-        await message.answer("Каталог профессий временно недоступен. (Не удалось загрузить данные из листов human, tech и т.д.)")
+    if not tree.directions():
+        if professions_navigator.ready:
+            await message.answer("Каталог профессий временно недоступен. (Не удалось загрузить данные из листов human, tech и т.д.)")
+        else:
+            await message.answer("Каталог профессий ещё загружается, попробуйте через минуту.")
         return
-    all_directions = sorted(list(set(p.get('Направление') for p in all_professions if p.get('Направление'))))
-    await state.update_data(all_professions=all_professions, all_directions=all_directions)
-    
-    builder = InlineKeyboardBuilder()
-    for index, direction in enumerate(all_directions):
-        builder.row(types.InlineKeyboardButton(
-            text=direction,
-            callback_data=f"explore_dir_{index}" 
-        ))
-    
-    builder.row(types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_main_menu"))
+    await state.update_data(professions_tree=tree.version)
 
     await state.set_state(ProfessionsExplorer.choosing_direction)
     await message.answer(
         "Выберите интересующее вас направление:",
-        reply_markup=builder.as_markup()
+        reply_markup=_directions_keyboard(tree)
     )
 
 @router.callback_query(ProfessionsExplorer.choosing_direction, F.data.startswith("explore_dir_"))
-async def direction_selected_handler(callback: types.CallbackQuery, state: FSMContext, professions_manager: ProfessionsGSheet):
+async def direction_selected_handler(callback: types.CallbackQuery, state: FSMContext, professions_navigator: ProfessionsNavigator):
     direction_index = int(callback.data.replace("explore_dir_", ""))
     
     user_data = await state.get_data()
-    selected_direction = user_data.get('all_directions', [])[direction_index]
-    all_professions = user_data.get('all_professions', [])
-    filtered_professions = [p for p in all_professions if p.get('Направление') == selected_direction]
+    tree = professions_navigator.get(user_data.get('professions_tree'))
+    selected_direction = tree.direction(None, direction_index) if tree else None
+    if selected_direction is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     
     builder = InlineKeyboardBuilder()
-    for index, prof in enumerate(filtered_professions):
+    for index, profession in enumerate(selected_direction.professions):
         builder.row(types.InlineKeyboardButton(
-            text=prof.get('Название профессии'),
+            text=profession.get('Название профессии'),
             callback_data=f"explore_prof_{index}"
         ))
     
     builder.row(types.InlineKeyboardButton(text="⬅️ Назад к направлениям", callback_data="back_to_directions_list"))
     
     await state.set_state(ProfessionsExplorer.choosing_profession)
-    await state.update_data(filtered_professions=filtered_professions)
+    await state.update_data(direction_index=direction_index)
     
     await callback.message.edit_text(
-        f"<b>{selected_direction}</b>\n\nВыберите профессию:",
+        f"<b>{selected_direction.title}</b>\n\nВыберите профессию:",
         reply_markup=builder.as_markup()
     )
     await callback.answer()
@@ -74,15 +92,13 @@ async def direction_selected_handler(callback: types.CallbackQuery, state: FSMCo
     ProfessionsExplorer.choosing_profession, 
     ProfessionsExplorer.viewing_profession   
 )
-async def show_profession_card_handler(callback: types.CallbackQuery, state: FSMContext):
+async def show_profession_card_handler(callback: types.CallbackQuery, state: FSMContext, professions_navigator: ProfessionsNavigator):
     prof_index = int(callback.data.replace("explore_prof_", ""))
     user_data = await state.get_data()
-    filtered_professions = user_data.get('filtered_professions', [])
-    if not filtered_professions or prof_index >= len(filtered_professions):
-        await callback.answer("Произошла ошибка, попробуйте заново.", show_alert=True)
+    profession = _profession_from_state(professions_navigator, user_data, prof_index)
+    if not profession:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
         return
-        
-    profession = filtered_professions[prof_index]
     
     card_text = f"<b>{profession.get('Название профессии')}</b>\n\n"
     for field in PRIMARY_FIELDS:
@@ -95,9 +111,7 @@ async def show_profession_card_handler(callback: types.CallbackQuery, state: FSM
         callback_data=f"explore_full_{prof_index}"
     ))
     
-    all_directions = user_data.get('all_directions', [])
-    direction_name = profession.get('Направление')
-    direction_index = all_directions.index(direction_name) if direction_name in all_directions else -1
+    direction_index = user_data.get('direction_index', -1)
 
     builder.row(types.InlineKeyboardButton(
         text="⬅️ Назад к профессиям", 
@@ -108,16 +122,14 @@ async def show_profession_card_handler(callback: types.CallbackQuery, state: FSM
     await callback.answer()
 
 @router.callback_query(ProfessionsExplorer.viewing_profession, F.data.startswith("explore_full_"))
-async def show_full_profession_card_handler(callback: types.CallbackQuery, state: FSMContext):
+async def show_full_profession_card_handler(callback: types.CallbackQuery, state: FSMContext, professions_navigator: ProfessionsNavigator):
     prof_index = int(callback.data.replace("explore_full_", ""))
     user_data = await state.get_data()
-    filtered_professions = user_data.get('filtered_professions', [])
-    if not filtered_professions or prof_index >= len(filtered_professions):
-        await callback.answer("Произошла ошибка, попробуйте заново.", show_alert=True)
+    profession = _profession_from_state(professions_navigator, user_data, prof_index)
+    if not profession:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
         return
 
-    profession = filtered_professions[prof_index]
-
     card_text = f"<b>{profession.get('Название профессии')}</b>\n\n"
     all_fields = PRIMARY_FIELDS + ADDITIONAL_FIELDS
     for field in all_fields:
@@ -137,26 +149,15 @@ async def show_full_profession_card_handler(callback: types.CallbackQuery, state
 # --- ОБРАБОТЧИК КНОПКИ "НАЗАД" к списку направлений ---
 
 @router.callback_query(F.data == "back_to_directions_list")
-async def back_to_directions_list_handler(callback: types.CallbackQuery, state: FSMContext, professions_manager: ProfessionsGSheet):
+async def back_to_directions_list_handler(callback: types.CallbackQuery, state: FSMContext, professions_navigator: ProfessionsNavigator):
     await state.clear()
-    all_professions = professions_manager.get_all_professions()
-
-    all_directions = sorted(list(set(p.get('Направление') for p in all_professions if p.get('Направление'))))
-    await state.update_data(all_professions=all_professions, all_directions=all_directions) 
-    
-    builder = InlineKeyboardBuilder()
-    for index, direction in enumerate(all_directions):
-        builder.row(types.InlineKeyboardButton(
-            text=direction,
-            callback_data=f"explore_dir_{index}"
-        ))
-    
-    builder.row(types.InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_main_menu"))
+    tree = professions_navigator.tree
+    await state.update_data(professions_tree=tree.version) 
 
     await state.set_state(ProfessionsExplorer.choosing_direction)
     await callback.message.edit_text(
         "Выберите интересующее вас направление:",
-        reply_markup=builder.as_markup()
+        reply_markup=_directions_keyboard(tree)
     )
     await callback.answer()
 
@@ -6,6 +6,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 # --- 1. ИСПРАВЛЕННЫЕ ИМПОРТЫ ---
 from app.utils.google_sheets import RegistrationGSheet 
+from app.utils.backends import run_blocking, SHEETS
 from app.states.registration import ProfileEditing, GeneralRegistration, ParentRegistration, StudentRegistration
 from app.keyboards.inline import (
     get_profile_keyboard, get_edit_profile_choices_keyboard,
@@ -34,7 +35,7 @@ async def profile_handler(message: types.Message, state: FSMContext, lexicon: di
     # --- Конец логики ---
     
     lang = user_fsm_data.get('language', 'ru') # Используем уже сохраненный lang
-    user_data = registration_manager.get_user_by_id(message.from_user.id)
+    user_data = await run_blocking(SHEETS, registration_manager.get_user_by_id, message.from_user.id)
 
     if user_data:
         # Если профиль НАЙДЕН в Google-таблице
@@ -89,7 +90,7 @@ async def my_children_handler(message: types.Message, state: FSMContext, lexicon
     lang = user_fsm_data.get('language', 'ru')
     
     # 1. Проверяем, зарегистрирован ли родитель
-    user_data = registration_manager.get_user_by_id(message.from_user.id)
+    user_data = await run_blocking(SHEETS, registration_manager.get_user_by_id, message.from_user.id)
     if not (user_data and user_data.get('role') == 'parent'):
 
         role = user_fsm_data.get('role')
@@ -113,7 +114,7 @@ async def my_children_handler(message: types.Message, state: FSMContext, lexicon
     await state.set_state(ProfileEditing.managing_children)
     
     # --- Эта логика скопирована из `show_children_list` и адаптирована ---
-    children = registration_manager.get_children_by_parent_id(message.from_user.id)
+    children = await run_blocking(SHEETS, registration_manager.get_children_by_parent_id, message.from_user.id)
     
     if children:
         # Отправляем НОВОЕ сообщение
@@ -184,7 +185,7 @@ async def show_profile_screen(
         await send_or_edit(text, reply_markup=keyboard, parse_mode="Markdown")
     
     elif user_role == 'student':
-        parent_contact = registration_manager.get_student_parent_contact(user_data.get('Telegram ID'))
+        parent_contact = await run_blocking(SHEETS, registration_manager.get_student_parent_contact, user_data.get('Telegram ID'))
         age = calculate_age(user_data.get('Дата рождения'))
         text = lexicon[lang]['profile-student-display'].format(
             first_name=user_data.get('Имя'),
@@ -202,7 +203,7 @@ async def show_profile_screen(
 
 async def show_children_list(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, lang: str, registration_manager: RegistrationGSheet):
 
-    children = registration_manager.get_children_by_parent_id(callback.from_user.id)
+    children = await run_blocking(SHEETS, registration_manager.get_children_by_parent_id, callback.from_user.id)
     
     if children:
         await callback.message.edit_text(
@@ -240,7 +241,7 @@ async def view_child_details_handler(callback: types.CallbackQuery, state: FSMCo
         child_index = int(callback.data.split("_")[2])
         lang = (await state.get_data()).get('language', 'ru')
         
-        children = registration_manager.get_children_by_parent_id(callback.from_user.id)
+        children = await run_blocking(SHEETS, registration_manager.get_children_by_parent_id, callback.from_user.id)
         child = children[child_index]
 
         if child:
@@ -282,7 +283,7 @@ async def add_child_from_profile_handler(callback: types.CallbackQuery, state: F
 @router.callback_query(ProfileEditing.showing_profile, F.data == "edit_profile_action")
 async def edit_profile_action_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, registration_manager: RegistrationGSheet):
     lang = (await state.get_data()).get('language', 'ru')
-    user_data = registration_manager.get_user_by_id(callback.from_user.id)
+    user_data = await run_blocking(SHEETS, registration_manager.get_user_by_id, callback.from_user.id)
     is_parent = user_data and user_data.get('role') == 'parent'
 
     await state.set_state(ProfileEditing.choosing_field_to_edit)
@@ -329,13 +330,14 @@ async def save_edited_field_handler(message: types.Message, state: FSMContext, l
     
     await message.delete()
 
-    success = registration_manager.update_user_data(
+    success = await run_blocking(
+        SHEETS, registration_manager.update_user_data,
         user_id=message.from_user.id,
         field_name=field_to_edit,
         new_value=new_value
     )
     
-    updated_user_data = registration_manager.get_user_by_id(message.from_user.id)
+    updated_user_data = await run_blocking(SHEETS, registration_manager.get_user_by_id, message.from_user.id)
 
     if success and updated_user_data:
         # Передаем registration_manager дальше
@@ -348,7 +350,7 @@ async def save_edited_field_handler(message: types.Message, state: FSMContext, l
 @router.callback_query(F.data == "back_to_profile_view")
 async def back_to_profile_view_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, registration_manager: RegistrationGSheet):
     lang = (await state.get_data()).get('language', 'ru')
-    user_data = registration_manager.get_user_by_id(callback.from_user.id)
+    user_data = await run_blocking(SHEETS, registration_manager.get_user_by_id, callback.from_user.id)
     if user_data:
         await state.set_state(ProfileEditing.showing_profile)
         # Передаем registration_manager дальше
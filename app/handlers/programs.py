@@ -4,6 +4,9 @@ from aiogram.fsm.context import FSMContext
 # Импортируем все необходимые состояния, менеджеры и клавиатуры
 from app.states.registration import Programs
 from app.utils.google_sheets import CoursesGSheet
+from app.utils.backends import run_blocking, SHEETS
+from app.utils.catalog import CatalogRegistry, STALE_SNAPSHOT_TEXT
+from app.keyboards.callbacks import CategoryCallback, SubcategoryCallback
 from app.keyboards.inline import (
     get_course_categories_keyboard,
     get_course_subcategories_keyboard,
@@ -27,7 +30,7 @@ async def programs_start_handler(message: types.Message, state: FSMContext, lexi
             pass 
     lang = (await state.get_data()).get('language', 'ru')
     
-    all_courses = courses_manager.get_courses()
+    all_courses = await run_blocking(SHEETS, courses_manager.get_courses)
     if not all_courses:
         await message.answer("К сожалению, список курсов сейчас недоступен.")
         return
@@ -42,13 +45,16 @@ async def programs_start_handler(message: types.Message, state: FSMContext, lexi
 
 # --- ШАГ 2: УМНЫЙ ВЫБОР ПОДКАТЕГОРИИ ---
 
-@router.callback_query(Programs.choosing_direction, F.data.startswith("category_"))
-async def category_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, courses_manager: CoursesGSheet):
+@router.callback_query(Programs.choosing_direction, CategoryCallback.filter())
+async def category_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, courses_manager: CoursesGSheet, catalog_registry: CatalogRegistry, callback_data: CategoryCallback):
     lang = (await state.get_data()).get('language', 'ru')
-    selected_category = callback.data.split('_', 1)[1]
+    selected_category = callback_data.resolve()
+    if selected_category is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     
     await state.update_data(selected_category=selected_category)
-    all_courses = courses_manager.get_courses()
+    all_courses = await run_blocking(SHEETS, courses_manager.get_courses)
     
     subcategories = sorted(list(set(
         c['Подкатегория'] for c in all_courses 
@@ -66,7 +72,7 @@ async def category_selected_handler(callback: types.CallbackQuery, state: FSMCon
             and c.get('language') == lang
         ]
         
-        await state.update_data(specific_courses_list=specific_courses)
+        await state.update_data(courses_snapshot=catalog_registry.put(specific_courses))
         await state.set_state(Programs.choosing_course)
         
         await callback.message.edit_text(
@@ -84,16 +90,19 @@ async def category_selected_handler(callback: types.CallbackQuery, state: FSMCon
     await callback.answer()
 
 # --- ШАГ 3: ВЫБОР КОНКРЕТНОГО КУРСА ---
-@router.callback_query(Programs.choosing_subcategory, F.data.startswith("subcategory_"))
-async def subcategory_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, courses_manager: CoursesGSheet):
+@router.callback_query(Programs.choosing_subcategory, SubcategoryCallback.filter())
+async def subcategory_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, courses_manager: CoursesGSheet, catalog_registry: CatalogRegistry, callback_data: SubcategoryCallback):
     lang = (await state.get_data()).get('language', 'ru')
-    selected_subcategory = callback.data.split('_', 1)[1]
+    selected_subcategory = callback_data.resolve()
+    if selected_subcategory is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     
     user_data = await state.get_data()
     selected_category = user_data.get('selected_category')
 
     await state.update_data(selected_subcategory=selected_subcategory)
-    all_courses = courses_manager.get_courses()
+    all_courses = await run_blocking(SHEETS, courses_manager.get_courses)
 
     specific_courses = [
         c for c in all_courses 
@@ -102,7 +111,7 @@ async def subcategory_selected_handler(callback: types.CallbackQuery, state: FSM
         and c.get('language') == lang
     ]
     
-    await state.update_data(specific_courses_list=specific_courses)
+    await state.update_data(courses_snapshot=catalog_registry.put(specific_courses))
     await state.set_state(Programs.choosing_course)
     await callback.message.edit_text(
         f"Вы выбрали: {selected_subcategory}\nДоступные курсы:",
@@ -112,12 +121,14 @@ async def subcategory_selected_handler(callback: types.CallbackQuery, state: FSM
 
 # --- ШАГ 4: ПОКАЗ КАРТОЧКИ КУРСА ---
 @router.callback_query(Programs.choosing_course, F.data.startswith("course_"))
-async def course_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+async def course_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, catalog_registry: CatalogRegistry):
     lang = (await state.get_data()).get('language', 'ru')
     course_index = int(callback.data.split('_', 1)[1])
     user_data = await state.get_data()
-    specific_courses = user_data.get('specific_courses_list', [])
-    target_course = specific_courses[course_index]
+    target_course = catalog_registry.get_item(user_data.get('courses_snapshot'), course_index)
+    if not target_course:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
 
     await state.set_state(Programs.viewing_course)
     
@@ -140,7 +151,7 @@ async def course_selected_handler(callback: types.CallbackQuery, state: FSMConte
 @router.callback_query(F.data == "back_to_categories")
 async def back_to_categories_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, courses_manager: CoursesGSheet):
     lang = (await state.get_data()).get('language', 'ru')
-    all_courses = courses_manager.get_courses()
+    all_courses = await run_blocking(SHEETS, courses_manager.get_courses)
     categories = sorted(list(set(c['Категория'] for c in all_courses if c.get('Категория'))))
     await state.set_state(Programs.choosing_direction)
     await callback.message.edit_text(
@@ -155,7 +166,7 @@ async def back_to_subcategories_handler(callback: types.CallbackQuery, state: FS
     user_data = await state.get_data()
     selected_category = user_data.get('selected_category')
 
-    all_courses = courses_manager.get_courses()
+    all_courses = await run_blocking(SHEETS, courses_manager.get_courses)
     subcategories = sorted(list(set(
         c['Подкатегория'] for c in all_courses 
         if c.get('Категория') == selected_category and c.get('Подкатегория')
@@ -1,16 +1,23 @@
 import re
 import uuid
 from datetime import datetime
+from typing import Optional
 from aiogram import Router, F, types, Bot
+from aiogram.filters import or_f
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, ReplyKeyboardRemove
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 
 from app.utils.google_sheets import RegistrationGSheet
+from app.utils.backends import run_blocking, SHEETS, EXODE
+from app.utils.message_cleanup import cleanup_messages
 from app.utils.helpers import calculate_age
-from app.utils.exode_api import find_user_by_phone, upsert_user
+from app.utils.exode_api import upsert_user
+from app.utils.identity import resolve_identity
 from app.keyboards.reply import get_share_phone_keyboard, get_parent_main_menu_keyboard
+from app.keyboards.callbacks import CityCallback
+from app.utils.catalog import STALE_SNAPSHOT_TEXT
 from app.keyboards.inline import (
     get_skip_keyboard, get_profile_confirmation_keyboard, get_edit_profile_keyboard,
     get_add_child_keyboard, get_interests_keyboard,
@@ -31,12 +38,9 @@ EMAIL_REGEX = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
 async def clear_history(chat_id: int, state: FSMContext, bot: Bot):
     user_data = await state.get_data()
     message_ids = user_data.get('message_ids_to_delete', [])
-    for msg_id in reversed(message_ids):
-        try:
-            await bot.delete_message(chat_id, msg_id)
-        except Exception:
-            pass 
     await state.update_data(message_ids_to_delete=[])
+    # Удаляем пачкой и в фоне, следующий шаг не ждёт удаления
+    await cleanup_messages(bot, chat_id, message_ids)
 
 async def append_message_ids(state: FSMContext, *messages: types.Message):
     user_data = await state.get_data()
@@ -176,7 +180,7 @@ async def confirm_parent_profile_handler(callback: types.CallbackQuery, state: F
     await state.update_data(telegram_id=callback.from_user.id)
     user_data = await state.get_data()
     lang = user_data.get('language')
-    registration_manager.add_parent(user_data)
+    await run_blocking(SHEETS, registration_manager.add_parent, user_data)
     payload = {
         'tgId': callback.from_user.id,
         'profile': {
@@ -195,7 +199,7 @@ async def confirm_parent_profile_handler(callback: types.CallbackQuery, state: F
     if user_data.get('parent_email') and user_data.get('parent_email') != 'Пропущено':
         payload['email'] = user_data['parent_email']
 
-    exode_result = upsert_user(payload)
+    exode_result = await run_blocking(EXODE, upsert_user, payload)
     if not exode_result:
         print("Warning: Failed to create Exode account for parent")
 
@@ -306,8 +310,8 @@ async def process_existing_child_prompt(callback: types.CallbackQuery, state: FS
     await callback.answer()
 
 @router.message(ParentRegistration.entering_child_phone)
-async def process_child_phone_number(message: Message, state: FSMContext, lexicon: dict):
-    """Шаг 3: Ищем ребенка по номеру телефона в Exode."""
+async def process_child_phone_number(message: Message, state: FSMContext, lexicon: dict, registration_manager: RegistrationGSheet):
+    """Шаг 3: Ищем ребенка по номеру телефона в Exode и в таблице регистраций."""
     phone_number = message.text.strip()
 
     await state.update_data(temp_child_phone=phone_number) 
@@ -315,22 +319,19 @@ async def process_child_phone_number(message: Message, state: FSMContext, lexico
     lang = (await state.get_data()).get('language')
     searching_msg = await message.answer(lexicon[lang]['searching-user'])
     await append_message_ids(state, message, searching_msg) 
-    child_data = find_user_by_phone(phone_number)
-    full_name = ""
+    # tgId не передаём: Telegram ID здесь принадлежит родителю, а не ребенку.
+    # Ищем только среди детей, чтобы не принять за ребенка родителя или ученика
+    identity = await resolve_identity(phone=phone_number, registration_manager=registration_manager, roles=('child',))
+    child_data = {'user': identity.to_user_payload()} if identity.is_found else None
+    full_name = identity.full_name if identity.first_name else ""
     
     if child_data:
         await state.update_data(found_child_payload=child_data) 
-        
-        user_obj = child_data.get('user', {})
-        profile_obj = child_data.get('profile', {})
-        
-        if profile_obj and profile_obj.get('firstName'):
-            full_name = f"{profile_obj.get('firstName', '')} {profile_obj.get('lastName', '')}".strip()
 
     if full_name:
         confirmation_text = lexicon[lang]['found-child-confirmation'].format(
-            first_name=profile_obj.get('firstName', ''), 
-            last_name=profile_obj.get('lastName', '')
+            first_name=identity.first_name, 
+            last_name=identity.last_name
         )
     elif child_data:
         confirmation_text = lexicon[lang]['child-found-no-name'].format(phone=phone_number)
@@ -465,15 +466,18 @@ async def child_class_handler(message: Message, state: FSMContext, lexicon: dict
     next_msg = await message.answer(lexicon[lang]['child-enter-city-prompt'], reply_markup=get_city_keyboard(lang))
     await append_message_ids(state, message, next_msg)
 
-@router.callback_query(ChildRegistration.entering_city, F.data.startswith("city_") | (F.data == "manual_city_input"))
-async def child_city_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+@router.callback_query(ChildRegistration.entering_city, or_f(CityCallback.filter(), F.data == "manual_city_input"))
+async def child_city_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, callback_data: Optional[CityCallback] = None):
     lang = (await state.get_data()).get('language')
     if callback.data == "manual_city_input":
         await state.set_state(ChildRegistration.entering_city_manually)
         await callback.message.edit_text("Пожалуйста, напишите название вашего города:")
         await callback.answer()
         return
-    city = callback.data.split("_", 1)[1]
+    city = callback_data.resolve()
+    if city is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     await state.update_data(child_city=city)
     await state.set_state(ChildRegistration.choosing_interests)
     await callback.message.edit_text(lexicon[lang]['child-choose-interests-prompt'], reply_markup=get_interests_keyboard(lexicon, lang, set()))
@@ -531,7 +535,7 @@ async def confirm_child_and_ask_consent_handler(callback: types.CallbackQuery, s
     
     user_data = await state.get_data()
     lang = user_data.get('language')
-    registration_manager.add_child(parent_id=callback.from_user.id, data=user_data)
+    await run_blocking(SHEETS, registration_manager.add_child, parent_id=callback.from_user.id, data=user_data)
     if user_data.get('exode_user_id'):       
         message_text = lexicon[lang]['child-profile-linked-success']
         await state.update_data(
@@ -584,7 +588,7 @@ async def finalize_child_registration_handler(callback: types.CallbackQuery, sta
         else: 
             unique_id = str(uuid.uuid4())[:8]
             payload['email'] = f"child_{unique_id}@school.local"
-        new_exode_user = upsert_user(payload)
+        new_exode_user = await run_blocking(EXODE, upsert_user, payload)
         
         if new_exode_user and new_exode_user.get('user'):
             message_text = lexicon[lang]['child-profile-created-success']
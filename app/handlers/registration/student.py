@@ -1,12 +1,16 @@
 from aiogram import Router, F, types, Bot
+from aiogram.filters import or_f
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardRemove, Message
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 from datetime import datetime
+from typing import Optional
 import logging
 
-from app.utils.exode_api import find_user_by_phone, upsert_user
+from app.utils.exode_api import upsert_user
 from app.utils.google_sheets import RegistrationGSheet, CoursesGSheet
+from app.utils.backends import run_blocking, SHEETS, EXODE
+from app.utils.message_cleanup import cleanup_messages
 from app.states.registration import StudentRegistration, StemNavigator, Programs
 from app.keyboards.inline import (
     get_yes_no_keyboard, 
@@ -25,20 +29,22 @@ from app.keyboards.inline import (
     get_student_welcome_keyboard 
 )
 from app.keyboards.reply import get_student_main_menu_keyboard, get_share_phone_keyboard
+from app.keyboards.callbacks import CityCallback
+from app.utils.catalog import STALE_SNAPSHOT_TEXT
 from app.utils.helpers import calculate_age
+from app.utils.identity import resolve_identity
 from app.handlers.stem_navigator import show_test_results
+from app.utils.ai_helpers import RecommendationService
+from app.utils.profession_matcher import ProfessionMatcher
 
 router = Router()
 
 async def clear_history(chat_id: int, state: FSMContext, bot: Bot):
     user_data = await state.get_data()
     message_ids = user_data.get('message_ids_to_delete', [])
-    for msg_id in reversed(message_ids):
-        try:
-            await bot.delete_message(chat_id, msg_id)
-        except Exception:
-            pass 
     await state.update_data(message_ids_to_delete=[])
+    # Удаляем пачкой и в фоне, следующий шаг не ждёт удаления
+    await cleanup_messages(bot, chat_id, message_ids)
 
 async def append_message_ids(state: FSMContext, *messages: types.Message | types.CallbackQuery):
     user_data = await state.get_data()
@@ -91,18 +97,15 @@ async def handle_is_registered_answer(callback: types.CallbackQuery, state: FSMC
     await callback.answer()
 
 @router.message(StudentRegistration.entering_existing_phone)
-async def process_existing_phone(message: Message, state: FSMContext, lexicon: dict):
+async def process_existing_phone(message: Message, state: FSMContext, lexicon: dict, registration_manager: RegistrationGSheet):
     phone = message.text.strip()
     lang = (await state.get_data()).get('language', 'ru')
     searching_msg = await message.answer(lexicon[lang]['searching-user'])
     await append_message_ids(state, message, searching_msg)
-    exode_data = find_user_by_phone(phone)
-    user_info, profile, full_name = None, None, ""
-    if exode_data and exode_data.get('user'):
-        user_info = exode_data['user']
-        profile = user_info.get('profile') 
-    if profile and profile.get('firstName'):
-        full_name = f"{profile.get('firstName', '')} {profile.get('lastName', '')}".strip()
+    # Exode (по телефону и по tgId) и таблица регистраций опрашиваются параллельно
+    identity = await resolve_identity(phone=phone, tg_id=message.from_user.id, registration_manager=registration_manager, roles=('student',))
+    user_info = identity.to_user_payload() if identity.is_found else None
+    full_name = identity.full_name if identity.first_name else ""
     
     if user_info:
         if not full_name:
@@ -110,7 +113,8 @@ async def process_existing_phone(message: Message, state: FSMContext, lexicon: d
         else:
             confirmation_text = lexicon[lang]['student-found-confirm'].format(name=full_name)
         
-        await state.update_data(found_user_data=user_info)
+        # Без аккаунта в Exode согласие на его создание всё равно спрашиваем
+        await state.update_data(found_user_data=user_info, found_exode_user=bool(identity.exode_user))
         await state.set_state(StudentRegistration.confirming_found_user)
         conf_msg = await message.answer(text=confirmation_text, reply_markup=get_yes_no_keyboard(lexicon, lang, "confirm_found_user_yes", "confirm_found_user_no"))
         await append_message_ids(state, conf_msg)
@@ -134,8 +138,7 @@ async def handle_found_user_confirmation(callback: types.CallbackQuery, state: F
             student_first_name=profile.get('firstName'),
             student_last_name=profile.get('lastName'),
             student_phone=found_user.get('phone'),
-            student_dob=dob_str,
-            found_exode_user=True
+            student_dob=dob_str
         )
         
         next_msg = None
@@ -162,7 +165,8 @@ async def start_new_registration_flow(message: types.Message, state: FSMContext,
     prompt_key = 'student-not-found-start-reg' if not user_found_but_empty else 'student-is-not-you-start-reg'
     await state.set_state(StudentRegistration.entering_first_name)
     next_msg = await message.answer(lexicon[lang].get(prompt_key) + "\n\n" + lexicon[lang]['prompt-enter-first-name'])
-    await state.update_data(message_ids_to_delete=[next_msg.message_id])
+    # Найденный аккаунт не подтверждён: новый профиль создаётся только с согласия
+    await state.update_data(message_ids_to_delete=[next_msg.message_id], found_exode_user=False)
 
 @router.message(StudentRegistration.entering_first_name)
 async def student_first_name_handler(message: Message, state: FSMContext, lexicon: dict):
@@ -230,15 +234,18 @@ async def process_manual_dob_input(message: Message, state: FSMContext, lexicon:
         error_msg = await message.answer(lexicon[lang]['student-dob-error'])
         await append_message_ids(state, message, error_msg)
 
-@router.callback_query(StudentRegistration.entering_city, F.data.startswith("city_") | (F.data == "manual_city_input"))
-async def student_city_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+@router.callback_query(StudentRegistration.entering_city, or_f(CityCallback.filter(), F.data == "manual_city_input"))
+async def student_city_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, callback_data: Optional[CityCallback] = None):
     lang = (await state.get_data()).get('language')
     if callback.data == "manual_city_input":
         await state.set_state(StudentRegistration.entering_city_manually)
         await callback.message.edit_text("Пожалуйста, напишите название вашего города:")
         await callback.answer()
         return
-    city = callback.data.split("_", 1)[1]
+    city = callback_data.resolve()
+    if city is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     await state.update_data(student_city=city)
     user_data = await state.get_data()
     if user_data.get("editing_during_registration"):
@@ -367,7 +374,7 @@ async def confirm_student_profile_handler(callback: types.CallbackQuery, state:
         'Роль': 'student'
     }
     
-    registration_manager.add_student(data_to_save)
+    await run_blocking(SHEETS, registration_manager.add_student, data_to_save)
     
     consent_text = lexicon[lang]['student-exode-consent-prompt']
     
@@ -377,7 +384,7 @@ async def confirm_student_profile_handler(callback: types.CallbackQuery, state:
             'tgId': callback.from_user.id
         }
         
-        result = upsert_user(payload)
+        result = await run_blocking(EXODE, upsert_user, payload)
         
         await state.set_state(StudentRegistration.choosing_goal)
         next_msg = await callback.message.answer(
@@ -422,7 +429,7 @@ async def handle_exode_creation_consent(callback: types.CallbackQuery, state: FS
             }
         }
         
-        result = upsert_user(payload)
+        result = await run_blocking(EXODE, upsert_user, payload)
         
         if result:
             success_msg = await callback.message.answer(
@@ -657,7 +664,7 @@ async def coming_soon_handler(callback: types.CallbackQuery, state: FSMContext,
 @router.callback_query(F.data == "find_subject_courses")
 async def find_subject_courses_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, courses_manager: CoursesGSheet):
     lang = (await state.get_data()).get('language', 'ru')
-    all_courses = courses_manager.get_courses()
+    all_courses = await run_blocking(SHEETS, courses_manager.get_courses)
     if not all_courses:
         await callback.answer("К сожалению, список курсов сейчас недоступен.", show_alert=True)
         return
@@ -689,7 +696,8 @@ async def back_to_goal_select_handler(callback: types.CallbackQuery, state: FSMC
     await callback.answer()
 
 @router.message(F.text.in_({"🧭 STEM-навигатор", "🧭 STEM-navigator"}))
-async def student_stem_navigator_start(message: types.Message, state: FSMContext, lexicon: dict):
+async def student_stem_navigator_start(message: types.Message, state: FSMContext, lexicon: dict,
+                                       recommendations: RecommendationService, profession_matcher: ProfessionMatcher):
     await message.delete()
     user_data = await state.get_data()
     if menu_msg_id := user_data.get('main_menu_message_id'):
@@ -707,7 +715,7 @@ async def student_stem_navigator_start(message: types.Message, state: FSMContext
             message=mock_callback_message, data="show_results"
         )
         
-        await show_test_results(mock_callback, state, lexicon)
+        await show_test_results(mock_callback, state, lexicon, recommendations, profession_matcher)
         
     else:
         await state.set_state(StemNavigator.showing_test_info)
@@ -1,11 +1,21 @@
-import collections
+import time
+from typing import Optional
+
 from aiogram import Router, F, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from app.core.config import AI_STREAM_INTERVAL
 from app.states.registration import StemNavigator
-from app.utils.google_sheets import ProfessionsGSheet
-from app.utils.test_content import QUESTIONS, SCORING_KEY, SCALES_INFO
+from app.utils.ai_helpers import RecommendationService, RecommendationUnavailable
+from app.utils.profession_matcher import ProfessionMatcher
+from app.utils.catalog import STALE_SNAPSHOT_TEXT
+from app.utils.professions_tree import ProfessionsNavigator
+from app.utils.test_content import QUESTIONS, SCALES_INFO
+from app.utils.scoring import ScoreCard, answer_letter, answer_string
+from app.utils.helpers import calculate_age
+from app.utils.test_attempts import TestAttemptStore, make_attempt
 
 router = Router()
 
@@ -32,16 +42,23 @@ ADDITIONAL_FIELDS = [
 
 # --- ХЕЛПЕРЫ ---
 
-def calculate_results(answers: list[str]) -> list[tuple[str, int]]:
-    """Подсчитывает результаты теста."""
-    scores = collections.defaultdict(int)
-    for answer in answers:
-        for scale, keys in SCORING_KEY.items():
-            if answer in keys:
-                scores[scale] += 1
-    
-    sorted_scores = sorted(scores.items(), key=lambda item: item[1], reverse=True)
-    return sorted_scores[:3]
+def calculate_results(answers) -> list[tuple[str, int]]:
+    """Три лучшие шкалы по ответам (буквы из FSM или коды ответов)."""
+    return ScoreCard.from_answers(answers).top(3)
+
+
+def _answers(user_data: dict) -> str:
+    """Ответы из FSM буквами; старые сессии хранили список кодов ответов."""
+    return answer_string(user_data.get("answers"))
+
+
+def _scale_profession(professions_navigator: ProfessionsNavigator, user_data: dict, prof_index: int):
+    """Профессия по индексу внутри выбранного направления шкалы (или None)."""
+    tree = professions_navigator.get(user_data.get('scale_tree'))
+    direction_index = user_data.get('current_direction_index')
+    if tree is None or direction_index is None:
+        return None
+    return tree.profession(user_data.get('current_scale_key'), direction_index, prof_index)
 
 
 def get_about_test_keyboard(lexicon: dict, lang: str):
@@ -59,13 +76,45 @@ def get_about_test_keyboard(lexicon: dict, lang: str):
     return builder.as_markup()
 
 
-async def show_test_results(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+RECOMMENDATION_TITLE = "\n\n🤖 <b>Совет от Stemio:</b>\n"
+RECOMMENDATION_LOADING = "<i>Подбираю профессии под твои ответы…</i>"
+MESSAGE_LIMIT = 4096
+
+
+async def _edit_results(message: types.Message, text: str, markup: types.InlineKeyboardMarkup):
+    try:
+        await message.edit_text(text[:MESSAGE_LIMIT], reply_markup=markup)
+    except TelegramBadRequest:
+        # "message is not modified" или сообщение уже удалено
+        pass
+
+
+async def _stream_recommendation(message: types.Message, result_text: str, markup: types.InlineKeyboardMarkup,
+                                 recommendations: RecommendationService, answers):
+    """Дописывает к результатам совет ИИ по мере генерации (не чаще раза в AI_STREAM_INTERVAL)."""
+    shown, latest, last_edit = None, None, time.monotonic()
+    try:
+        async for latest in recommendations.stream(answers):
+            if time.monotonic() - last_edit >= AI_STREAM_INTERVAL:
+                await _edit_results(message, result_text + RECOMMENDATION_TITLE + latest + " ▌", markup)
+                shown, last_edit = latest, time.monotonic()
+    except RecommendationUnavailable:
+        latest = None
+    if latest is None:
+        await _edit_results(message, result_text, markup)
+    elif latest != shown:
+        await _edit_results(message, result_text + RECOMMENDATION_TITLE + latest, markup)
+
+
+async def show_test_results(callback: types.CallbackQuery, state: FSMContext, lexicon: dict,
+                            recommendations: Optional[RecommendationService] = None,
+                            matcher: Optional[ProfessionMatcher] = None):
     user_data = await state.get_data()
     lang = (await state.get_data()).get('language', 'ru')
     top_3_results = user_data.get("test_results") 
 
     if not top_3_results:
-        answers = user_data.get("answers", [])
+        answers = _answers(user_data)
         if not answers:
             await callback.message.edit_text("Не удалось найти результаты теста. Попробуйте пройти его заново.")
             builder = InlineKeyboardBuilder()
@@ -73,7 +122,9 @@ async def show_test_results(callback: types.CallbackQuery, state: FSMContext, le
             await callback.message.edit_reply_markup(reply_markup=builder.as_markup())
             return
             
-        top_3_results = calculate_results(answers)
+        # Счётчики ведутся по ходу теста; пересчёт — только для старых сессий без них
+        scores = user_data.get("scores")
+        top_3_results = ScoreCard(scores).top(3) if scores else calculate_results(answers)
         await state.update_data(test_results=top_3_results) 
 
     # --- БЛОК СБОРКИ ТЕКСТА ---
@@ -95,6 +146,19 @@ async def show_test_results(callback: types.CallbackQuery, state: FSMContext, le
             callback_data=f"view_directions_{scale_key}" 
         ))
     
+    # Ближайшие профессии по всем шкалам и интересам — сразу кнопками, без перебора направлений
+    scores = user_data.get("scores") or ScoreCard.from_answers(_answers(user_data)).scores
+    matches = matcher.match(scores, _answers(user_data)) if matcher else []
+    if matches:
+        result_text += "🎯 <b>Тебе могут подойти:</b>\n"
+        for _, row in matches:
+            title = matcher.rows[row][1].get('Название профессии')
+            result_text += f"• {title}\n"
+            result_builder.row(types.InlineKeyboardButton(
+                text=f"💼 {title}", callback_data=f"match_{matcher.version}_{row}"
+            ))
+        result_text += "\n"
+
     result_text += lexicon[lang].get('test_result_footer', "") # <-- ВОТ ОН
 
     result_builder.row(types.InlineKeyboardButton(text="🔄 Пройти тест заново", callback_data="begin_stem_test"))
@@ -103,8 +167,24 @@ async def show_test_results(callback: types.CallbackQuery, state: FSMContext, le
         callback_data="back_to_main_menu"
     ))
     
-    await callback.message.edit_text(result_text, reply_markup=result_builder.as_markup())
+    markup = result_builder.as_markup()
+    answers = _answers(user_data)
+    if recommendations is None or not answers:
+        await callback.message.edit_text(result_text, reply_markup=markup)
+        await state.set_state(StemNavigator.viewing_results)
+        return
+
+    # Готовый совет (тот же набор ответов уже встречался) — сразу, иначе показываем его по мере генерации
+    cached = recommendations.cached(answers)
+    loading = RECOMMENDATION_TITLE + (cached if cached is not None else RECOMMENDATION_LOADING)
+    await callback.message.edit_text((result_text + loading)[:MESSAGE_LIMIT], reply_markup=markup)
     await state.set_state(StemNavigator.viewing_results)
+    if cached is None:
+        # Совет дописывается в фоне: обработчик не держит очередь пользователя, пока модель пишет
+        recommendations.start_stream(
+            callback.from_user.id,
+            _stream_recommendation(callback.message, result_text, markup, recommendations, answers)
+        )
     
 
 
@@ -119,7 +199,7 @@ async def start_test_handler(callback: types.CallbackQuery, state: FSMContext):
         pass
 
     await state.set_state(StemNavigator.taking_test)
-    await state.update_data(question_index=0, answers=[], test_results=None)
+    await state.update_data(question_index=0, answers="", scores=None, test_results=None)
     
     question = QUESTIONS[0]
     builder = InlineKeyboardBuilder()
@@ -131,14 +211,25 @@ async def start_test_handler(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.callback_query(StemNavigator.taking_test)
-async def answer_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+async def answer_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, recommendations: RecommendationService,
+                         profession_matcher: ProfessionMatcher, test_attempts: TestAttemptStore):
     """Обрабатывает ответ на вопрос и показывает следующий или результат."""
     user_data = await state.get_data()
-    answers = user_data.get("answers", [])
-    answers.append(callback.data)
-    
-    question_index = user_data.get("question_index", 0) + 1
-    await state.update_data(question_index=question_index, answers=answers)
+    question_index = user_data.get("question_index", 0)
+    letter = answer_letter(callback.data, question_index)
+    if letter is None:
+        # Повторное нажатие или кнопка предыдущего вопроса
+        await callback.answer()
+        return
+
+    answers = _answers(user_data)
+    # Сессии, начатые до подсчёта по ходу теста, счётчиков не хранят
+    scores = user_data.get("scores")
+    card = ScoreCard(scores) if scores else ScoreCard.from_answers(answers)
+    card.add(callback.data)
+    question_index += 1
+    answers += letter
+    await state.update_data(question_index=question_index, answers=answers, scores=card.scores)
     
     if question_index < len(QUESTIONS):
         question = QUESTIONS[question_index]
@@ -148,8 +239,21 @@ async def answer_handler(callback: types.CallbackQuery, state: FSMContext, lexic
         builder.adjust(1)
         await callback.message.edit_text(question["text"], reply_markup=builder.as_markup())
     else:
+        # Попытка уходит в журнал для аналитики; запись на диск — в фоне
+        child = user_data.get("test_for_child")
+        test_attempts.record(make_attempt(
+            user_id=callback.from_user.id,
+            role=user_data.get("role") or ("parent" if child else "student"),
+            answers=answers,
+            card=card,
+            child=child,
+            city=user_data.get("child_city" if child else "student_city"),
+            age=calculate_age(user_data.get("child_dob" if child else "student_dob"))
+        ))
+        await callback.answer()
         await callback.message.edit_text("⏳ Спасибо за ответы! Подсчитываю результаты...")
-        await show_test_results(callback, state, lexicon)
+        await show_test_results(callback, state, lexicon, recommendations, profession_matcher)
+        return
 
     await callback.answer()
 
@@ -157,27 +261,27 @@ async def answer_handler(callback: types.CallbackQuery, state: FSMContext, lexic
 # --- ЛОГИКА НАВИГАЦИИ ПО ПРОФЕССИЯМ ---
 
 @router.callback_query(StemNavigator.viewing_results, F.data.startswith("view_directions_"))
-async def view_directions_handler(callback: types.CallbackQuery, state: FSMContext, professions_manager: ProfessionsGSheet):
+async def view_directions_handler(callback: types.CallbackQuery, state: FSMContext, professions_navigator: ProfessionsNavigator):
     """Показывает 'Направления' (e.g. 'Медицинское') для выбранной шкалы (e.g. 'human')."""
     scale_key = callback.data.replace("view_directions_", "")
 
-    professions = professions_manager.get_professions_by_scale(scale_key)
+    tree = professions_navigator.tree
+    directions = tree.directions(scale_key)
     
-    if not professions:
-        await callback.answer("Профессии для этого направления скоро будут добавлены.", show_alert=True)
+    if not directions:
+        text = ("Профессии для этого направления скоро будут добавлены." if professions_navigator.ready
+                else "Каталог профессий ещё загружается, попробуйте через минуту.")
+        await callback.answer(text, show_alert=True)
         return
 
-    directions = sorted(list(set(prof.get('Направление') for prof in professions if prof.get('Направление'))))
-
     await state.update_data(
         current_scale_key=scale_key,
-        current_directions=directions,
-        current_scale_professions=professions 
+        scale_tree=tree.version
     )
     
     builder = InlineKeyboardBuilder()
     for index, direction in enumerate(directions):
-        builder.row(types.InlineKeyboardButton(text=direction, callback_data=f"view_profs_{index}"))
+        builder.row(types.InlineKeyboardButton(text=direction.title, callback_data=f"view_profs_{index}"))
     
     builder.row(types.InlineKeyboardButton(text="⬅️ Назад к результатам", callback_data="back_to_results"))
     
@@ -189,32 +293,31 @@ async def view_directions_handler(callback: types.CallbackQuery, state: FSMConte
 
 
 @router.callback_query(StemNavigator.viewing_results, F.data.startswith("view_profs_"))
-async def view_professions_handler(callback: types.CallbackQuery, state: FSMContext, professions_manager: ProfessionsGSheet):
+async def view_professions_handler(callback: types.CallbackQuery, state: FSMContext, professions_navigator: ProfessionsNavigator):
     """Показывает список профессий (e.g. 'Врач') для выбранного направления."""
     direction_index = int(callback.data.replace("view_profs_", ""))
 
     user_data = await state.get_data()
-    directions = user_data.get('current_directions', [])
-    direction = directions[direction_index]
-    
-    all_professions_in_scale = user_data.get('current_scale_professions', [])
     scale_key = user_data.get('current_scale_key')
+    tree = professions_navigator.get(user_data.get('scale_tree'))
+    direction = tree.direction(scale_key, direction_index) if tree else None
+    if direction is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     
-    filtered_professions = [prof for prof in all_professions_in_scale if prof.get('Направление') == direction]
-    
-    await state.update_data(current_filtered_professions=filtered_professions)
+    await state.update_data(current_direction_index=direction_index)
 
     builder = InlineKeyboardBuilder()
-    for index, prof in enumerate(filtered_professions):
+    for index, profession in enumerate(direction.professions):
         builder.row(types.InlineKeyboardButton(
-            text=prof.get('Название профессии'),
+            text=profession.get('Название профессии'),
             callback_data=f"show_prof_{index}" 
         ))
     
     builder.row(types.InlineKeyboardButton(text="⬅️ Назад к направлениям", callback_data=f"view_directions_{scale_key}"))
     
     await callback.message.edit_text(
-        f"<b>{direction}</b>\n\nВыберите профессию:",
+        f"<b>{direction.title}</b>\n\nВыберите профессию:",
         reply_markup=builder.as_markup()
     )
     await callback.answer()
@@ -223,25 +326,22 @@ async def view_professions_handler(callback: types.CallbackQuery, state: FSMCont
     F.data.startswith("show_prof_"),
     StemNavigator.viewing_results 
 )
-async def show_profession_card_handler(callback: types.CallbackQuery, state: FSMContext):
+async def show_profession_card_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, professions_navigator: ProfessionsNavigator,
+                                        recommendations: RecommendationService, profession_matcher: ProfessionMatcher):
     """Показывает КОРОТКУЮ карточку профессии."""
     prof_index = int(callback.data.replace("show_prof_", ""))
 
     user_data = await state.get_data()
 
-    filtered_professions = user_data.get('current_filtered_professions', [])
+    profession = _scale_profession(professions_navigator, user_data, prof_index)
 
-    if not filtered_professions or prof_index >= len(filtered_professions):
-        await callback.answer("Произошла ошибка, пожалуйста, вернитесь назад.", show_alert=True)
+    if not profession:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
 
-        await show_test_results(callback, state, lexicon=await state.get_data().get('lexicon', {}))
+        await show_test_results(callback, state, lexicon, recommendations, profession_matcher)
         return
-        
-    profession = filtered_professions[prof_index]
     
-    direction = profession.get('Направление')
-    directions = user_data.get('current_directions', [])
-    direction_index = directions.index(direction) if direction in directions else 0
+    direction_index = user_data.get('current_direction_index', 0)
 
     card_text = f"<b>{profession.get('Название профессии')}</b>\n\n"
     for field in PRIMARY_FIELDS:
@@ -264,24 +364,21 @@ async def show_profession_card_handler(callback: types.CallbackQuery, state: FSM
 
 
 @router.callback_query(StemNavigator.viewing_results, F.data.startswith("show_full_"))
-async def show_full_profession_card_handler(callback: types.CallbackQuery, state: FSMContext):
+async def show_full_profession_card_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, professions_navigator: ProfessionsNavigator,
+                                             recommendations: RecommendationService, profession_matcher: ProfessionMatcher):
     """Показывает ПОЛНУЮ карточку профессии."""
     prof_index = int(callback.data.replace("show_full_", ""))
     
     user_data = await state.get_data()
-    filtered_professions = user_data.get('current_filtered_professions', [])
+    profession = _scale_profession(professions_navigator, user_data, prof_index)
 
-    if not filtered_professions or prof_index >= len(filtered_professions):
-        await callback.answer("Произошла ошибка, пожалуйста, вернитесь назад.", show_alert=True)
+    if not profession:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
 
-        await show_test_results(callback, state, lexicon=await state.get_data().get('lexicon', {}))
+        await show_test_results(callback, state, lexicon, recommendations, profession_matcher)
         return
-        
-    profession = filtered_professions[prof_index]
 
-    direction = profession.get('Направление')
-    directions = user_data.get('current_directions', [])
-    direction_index = directions.index(direction) if direction in directions else 0
+    direction_index = user_data.get('current_direction_index', 0)
 
     card_text = f"<b>{profession.get('Название профессии')}</b>\n\n"
     all_fields = PRIMARY_FIELDS + ADDITIONAL_FIELDS
@@ -302,14 +399,42 @@ async def show_full_profession_card_handler(callback: types.CallbackQuery, state
     await callback.message.edit_text(card_text, reply_markup=builder.as_markup(), parse_mode="HTML")
     await callback.answer()
 
+@router.callback_query(StemNavigator.viewing_results, F.data.startswith("match_"))
+async def show_match_handler(callback: types.CallbackQuery, profession_matcher: ProfessionMatcher):
+    """Карточка профессии из подборки на экране результатов."""
+    _, version, row = callback.data.split("_")
+    match = profession_matcher.profession(version, int(row))
+    if match is None:
+        # Каталог профессий обновился после показа результатов
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
+
+    scale_key, profession = match
+    card_text = f"<b>{profession.get('Название профессии')}</b>\n"
+    card_text += f"<i>{SCALES_INFO[scale_key]['title']} · {profession.get('Направление', '')}</i>\n\n"
+    for field in PRIMARY_FIELDS + ["Сколько зарабатывают"]:
+        if value := profession.get(field):
+            card_text += f"<b>{field}:</b> {value}\n"
+
+    builder = InlineKeyboardBuilder()
+    builder.row(types.InlineKeyboardButton(
+        text=f"Все профессии: {SCALES_INFO[scale_key]['title']}",
+        callback_data=f"view_directions_{scale_key}"
+    ))
+    builder.row(types.InlineKeyboardButton(text="⬅️ Назад к результатам", callback_data="back_to_results"))
+    await callback.message.edit_text(card_text[:MESSAGE_LIMIT], reply_markup=builder.as_markup())
+    await callback.answer()
+
 @router.callback_query(StemNavigator.viewing_results, F.data == "back_to_results")
-async def back_to_results_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+async def back_to_results_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, recommendations: RecommendationService,
+                                  profession_matcher: ProfessionMatcher):
     """Возврат к экрану результатов теста."""
-    await show_test_results(callback, state, lexicon)
     await callback.answer()
+    await show_test_results(callback, state, lexicon, recommendations, profession_matcher)
 
 @router.message(F.text.in_({"🧭 STEM-навигатор", "🧭 STEM-navigator"}))
-async def student_stem_navigator_start(message: types.Message, state: FSMContext, lexicon: dict):
+async def student_stem_navigator_start(message: types.Message, state: FSMContext, lexicon: dict,
+                                       recommendations: RecommendationService, profession_matcher: ProfessionMatcher):
     await message.delete()
 
     user_data = await state.get_data()
@@ -328,7 +453,7 @@ async def student_stem_navigator_start(message: types.Message, state: FSMContext
             message=mock_callback_message, data="show_results"
         )
         
-        await show_test_results(mock_callback, state, lexicon)
+        await show_test_results(mock_callback, state, lexicon, recommendations, profession_matcher)
         
     else:
         await state.set_state(StemNavigator.showing_test_info)
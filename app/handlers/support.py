@@ -1,7 +1,6 @@
 from aiogram import Router, F, types, Bot
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import BigInteger
 
 from app.states.registration import Support
 from app.core.config import SUPPORT_GROUP_ID
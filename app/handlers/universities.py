@@ -1,11 +1,20 @@
+import html
+
 from aiogram import Router, F, types, Dispatcher
+from aiogram.filters import Command, CommandObject, or_f
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from app.states.registration import Universities 
 from app.utils.google_sheets import UniversitiesGSheet
+from app.utils.backends import run_blocking, SHEETS
 from app.utils.locations import CITIES_RU 
-from app.core.config import PRIVATE_UNIVERSITIES_SHEET_ID, FOREIGN_UNIVERSITIES_SHEET_ID
+from app.utils.catalog import CatalogRegistry, PagedList, STALE_SNAPSHOT_TEXT, unique_sorted
+from app.utils.university_catalog import UniversityCatalog, UNIVERSITY, FACULTY, PROGRAM
+from app.utils.university_overview import STATE, PRIVATE, FOREIGN
+from app.utils.program_filters import STUDY_FORMS
+from app.keyboards.callbacks import UniCityCallback, SearchResultCallback, ProgramFilterCallback, NationwideCallback, RegionCallback
+from app.core.config import PRIVATE_UNIVERSITIES_SHEET_ID, FOREIGN_UNIVERSITIES_SHEET_ID, SEARCH_MAX_RESULTS
 
 router = Router()
 ITEMS_PER_PAGE = 5 
@@ -18,12 +27,66 @@ VISIBLE_PROGRAM_FIELDS = [
     "Стипендия", "Наличие общежития", "Количество мест", "Квота на бюджет", "Квота на платное обучение" 
 ]
 
+# --- КАТАЛОГ ---
+
+class ProgramIndex:
+    """
+    Факультеты и программы одного вуза со страницами для клавиатур.
+    Строится один раз на снимок программ и общий для всех пользователей.
+    """
+
+    def __init__(self, records):
+        faculties = unique_sorted(records, "Название факультета")
+        positions = {faculty: [] for faculty in faculties}
+        for i, record in enumerate(records):
+            faculty = record.get("Название факультета")
+            if faculty in positions:
+                positions[faculty].append(i)
+        self.faculties = PagedList(faculties, ITEMS_PER_PAGE)
+        # Позиции программ факультета в снимке и страницы их названий
+        self.program_positions = tuple(tuple(positions[faculty]) for faculty in faculties)
+        self.programs = tuple(
+            PagedList([records[i].get("Название программы", "N/A") for i in faculty_positions], ITEMS_PER_PAGE)
+            for faculty_positions in self.program_positions
+        )
+
+def _university_names(catalog_registry: CatalogRegistry, universities_snapshot: str):
+    return catalog_registry.derive(
+        universities_snapshot, 'names',
+        lambda r: PagedList([uni.get("Наименования ВОУ", "N/A") for uni in r], ITEMS_PER_PAGE)
+    )
+
+def _program_index(catalog_registry: CatalogRegistry, programs_snapshot: str):
+    return catalog_registry.derive(programs_snapshot, 'index', ProgramIndex)
+
+def _faculty(catalog_registry: CatalogRegistry, user_data: dict):
+    """(индекс программ, номер факультета) выбранного факультета или None, если снимок устарел."""
+    index = _program_index(catalog_registry, user_data.get("programs_snapshot"))
+    faculty_index = user_data.get("selected_faculty_index")
+    if index is None or faculty_index is None or not 0 <= faculty_index < len(index.faculties):
+        return None
+    return index, faculty_index
+
+def _faculty_program(catalog_registry: CatalogRegistry, user_data: dict, program_index: int):
+    """Запись программы выбранного факультета или None."""
+    selected = _faculty(catalog_registry, user_data)
+    if selected is None:
+        return None
+    index, faculty_index = selected
+    positions = index.program_positions[faculty_index]
+    if not 0 <= program_index < len(positions):
+        return None
+    return catalog_registry.get_item(user_data.get("programs_snapshot"), positions[program_index])
+
 # --- КЛАВИАТУРЫ ---
 
 def get_cities_keyboard(lexicon: dict, lang: str):
     builder = InlineKeyboardBuilder()
     for city_name in CITIES_RU:
-        builder.row(types.InlineKeyboardButton(text=city_name, callback_data=f"uni_city_{city_name}"))
+        builder.row(types.InlineKeyboardButton(text=city_name, callback_data=UniCityCallback.of(city_name)))
+    builder.row(types.InlineKeyboardButton(text="🔎 Поиск вуза или программы", callback_data="search_start"))
+    builder.row(types.InlineKeyboardButton(text="🌍 Все регионы и рейтинги", callback_data=NationwideCallback(action='open').pack()))
+    builder.row(types.InlineKeyboardButton(text="🎛 Подбор программ по всей стране", callback_data=ProgramFilterCallback(action='open').pack()))
     builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data="back_to_main_menu"))
     return builder.as_markup()
 
@@ -32,34 +95,45 @@ def get_uni_types_keyboard(lexicon: dict, lang: str):
     builder.row(types.InlineKeyboardButton(text="🎓 Государственные", callback_data="uni_type_Государственный"))
     builder.row(types.InlineKeyboardButton(text="🏢 Частные", callback_data="uni_type_Частный"))
     builder.row(types.InlineKeyboardButton(text="🌍 Иностранные", callback_data="uni_type_Иностранный"))
+    builder.row(types.InlineKeyboardButton(text="🎛 Подбор программ в городе", callback_data=ProgramFilterCallback(action='open', value='city').pack()))
     builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data="back_to_cities"))
     return builder.as_markup()
 
-def get_paginated_keyboard(items: list, page: int, data_prefix: str, back_callback: str, lexicon: dict, lang: str):
+def get_paginated_keyboard(items: PagedList, page: int, data_prefix: str, back_callback: str, lexicon: dict, lang: str):
     builder = InlineKeyboardBuilder()
-    start_index = page * ITEMS_PER_PAGE
-    end_index = start_index + ITEMS_PER_PAGE
-    
-    current_page_items = items[start_index:end_index]
-    
-    for item_name in current_page_items:
-        try:
-            actual_index = items.index(item_name, start_index, end_index + len(items))
-        except ValueError:
-            actual_index = start_index + current_page_items.index(item_name) 
-
-        builder.row(types.InlineKeyboardButton(text=str(item_name), callback_data=f"{data_prefix}_{actual_index}"))
+    for item_index, item_name in items.page(page):
+        builder.row(types.InlineKeyboardButton(text=str(item_name), callback_data=f"{data_prefix}_{item_index}"))
         
     nav_buttons = []
     if page > 0:
         nav_buttons.append(types.InlineKeyboardButton(text="⬅️", callback_data=f"page_{data_prefix}_{page - 1}"))
-    if end_index < len(items):
+    if items.has_next(page):
         nav_buttons.append(types.InlineKeyboardButton(text="➡️", callback_data=f"page_{data_prefix}_{page + 1}"))
     
     if nav_buttons: builder.row(*nav_buttons)
     builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data=back_callback))
     return builder.as_markup()
 
+def get_program_card(program: dict, program_index: int, lexicon: dict, lang: str, results_callback: str = None):
+    """Текст и клавиатура карточки программы; results_callback — возврат к результатам поиска или подбора."""
+    card_parts = [f"<b>{program.get('Название программы')}</b>\n"]
+    for field_name in VISIBLE_PROGRAM_FIELDS:
+        if field_name == "Название программы": continue 
+        value = program.get(field_name)
+        if value: 
+            card_parts.append(f"<b>{field_name}:</b> {value}")
+            
+    card_text = "\n".join(card_parts)
+    
+    builder = InlineKeyboardBuilder()
+    if program.get("Список документов"):
+        builder.row(types.InlineKeyboardButton(text="📄 Список документов", callback_data=f"show_docs_{program_index}"))
+    if results_callback:
+        builder.row(types.InlineKeyboardButton(text="🔎 К результатам", callback_data=results_callback))
+
+    builder.row(types.InlineKeyboardButton(text=lexicon[lang]['button-back'], callback_data="back_to_faculties"))
+    return card_text, builder.as_markup()
+
 # --- ОБРАБОТЧИКИ ---
 
 @router.message(F.text.in_({"🎓 Вузы", "🎓 OTMlar"}))
@@ -76,14 +150,18 @@ async def universities_start_handler(message: types.Message, state: FSMContext,
     await state.set_state(Universities.choosing_city)
     await message.answer("Выберите город:", reply_markup=get_cities_keyboard(lexicon, lang))
 
-@router.callback_query(Universities.choosing_city, F.data.startswith("uni_city_"))
+@router.callback_query(Universities.choosing_city, UniCityCallback.filter())
 async def city_selected_handler(
     callback: types.CallbackQuery, 
     state: FSMContext, 
     lexicon: dict, 
-    state_uni_ids_by_city: dict
+    state_uni_ids_by_city: dict,
+    callback_data: UniCityCallback
 ):
-    selected_city = callback.data.split('_', 2)[2]
+    selected_city = callback_data.resolve()
+    if selected_city is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     lang = (await state.get_data()).get('language', 'ru')
     
     state_uni_ids = state_uni_ids_by_city
@@ -106,7 +184,9 @@ async def uni_type_selected_handler(
     state: FSMContext, 
     lexicon: dict, 
     universities_manager: UniversitiesGSheet, 
-    state_uni_ids_by_city: dict
+    state_uni_ids_by_city: dict,
+    catalog_registry: CatalogRegistry,
+    university_catalog: UniversityCatalog
 ):
     selected_type = callback.data.split('_', 2)[2] 
     user_data = await state.get_data()
@@ -134,12 +214,19 @@ async def uni_type_selected_handler(
 
     city_filter = selected_city if selected_type in ["Частный", "Иностранный"] else None
     
-    all_universities_in_file = universities_manager.get_universities_by_city_and_type(
-        sheet_id=selected_sheet_id,
-        city=city_filter 
-    )
+    if university_catalog.has(selected_sheet_id):
+        # Список уже в памяти каталога, и его снимок посчитан один раз на обновление
+        universities_snapshot = university_catalog.universities_snapshot(catalog_registry, selected_sheet_id, city_filter)
+    else:
+        # Каталог ещё загружается — читаем вкладку из таблицы
+        all_universities_in_file = await run_blocking(
+            SHEETS, universities_manager.get_universities_by_city_and_type,
+            sheet_id=selected_sheet_id,
+            city=city_filter 
+        )
+        universities_snapshot = catalog_registry.put(all_universities_in_file) if all_universities_in_file else None
 
-    if not all_universities_in_file:
+    if not universities_snapshot:
         await callback.answer(f"В г. {selected_city} не найдены вузы типа '{selected_type}'.", show_alert=True)
         return
         
@@ -148,49 +235,55 @@ async def uni_type_selected_handler(
         page=0, 
         uni_type=selected_type, 
         current_sheet_id=selected_sheet_id, 
-        filtered_universities=all_universities_in_file
+        universities_snapshot=universities_snapshot
     )
     
-    uni_names = [uni.get("Наименования ВОУ", "N/A") for uni in all_universities_in_file]
-    
     await callback.message.edit_text(
         f"<b>{selected_city} / {selected_type}</b>\n\nВыберите вуз:",
         reply_markup=get_paginated_keyboard(
-            items=uni_names, page=0, data_prefix="uni", back_callback="back_to_uni_type", lexicon=lexicon, lang=lang
+            items=_university_names(catalog_registry, universities_snapshot), page=0, data_prefix="uni", back_callback="back_to_uni_type", lexicon=lexicon, lang=lang
         )
     )
     await callback.answer()
 
 @router.callback_query(Universities.choosing_university, F.data.startswith("uni_"))
-async def university_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, universities_manager: UniversitiesGSheet):
+async def university_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, universities_manager: UniversitiesGSheet, catalog_registry: CatalogRegistry,
+                                      university_catalog: UniversityCatalog):
     university_index = int(callback.data.split('_')[1])
     user_data = await state.get_data()
     lang = user_data.get('language', 'ru')
     
-    selected_university = user_data.get("filtered_universities", [])[university_index]
+    selected_university = catalog_registry.get_item(user_data.get("universities_snapshot"), university_index)
+    if not selected_university:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     
     sheet_name = selected_university.get('sheet_name')
     if not sheet_name:
         await callback.answer(f"Ошибка: Для ВУЗа '{selected_university.get('Наименования ВОУ')}' не указан 'sheet_name' в таблице.", show_alert=True)
         return
 
-    all_programs = universities_manager.get_faculties_by_sheet_name(sheet_name)
+    sheet_id = user_data.get("current_sheet_id")
+    if university_catalog.has(sheet_id):
+        programs_snapshot = university_catalog.programs_snapshot(catalog_registry, sheet_id, sheet_name)
+    else:
+        all_programs = await run_blocking(
+            SHEETS, universities_manager.get_faculties_by_sheet_name, sheet_name, sheet_id=sheet_id
+        )
+        programs_snapshot = catalog_registry.put(all_programs) if all_programs else None
     
-    if not all_programs:
+    if not programs_snapshot:
         await callback.answer(f"Для этого вуза факультеты (на листе '{sheet_name}') еще не добавлены.", show_alert=True)
         return
         
-    unique_faculties = sorted(list(set(
-        p.get("Название факультета") for p in all_programs if p.get("Название факультета")
-    )))
+    unique_faculties = _program_index(catalog_registry, programs_snapshot).faculties
     
     if not unique_faculties:
          await callback.answer(f"В таблице '{sheet_name}' не найдена колонка 'Название факультета' или она пуста.", show_alert=True)
          return
     
     await state.update_data(
-        all_programs=all_programs, 
-        unique_faculties=unique_faculties, 
+        programs_snapshot=programs_snapshot, 
         selected_university_index=university_index
     )
     await state.set_state(Universities.choosing_faculty)
@@ -205,25 +298,21 @@ async def university_selected_handler(callback: types.CallbackQuery, state: FSMC
 
 
 @router.callback_query(Universities.choosing_faculty, F.data.startswith("faculty_"))
-async def faculty_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+async def faculty_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, catalog_registry: CatalogRegistry):
     faculty_index = int(callback.data.split('_')[1])
     user_data = await state.get_data()
     lang = user_data.get('language', 'ru')
     
-    selected_faculty_name = user_data.get("unique_faculties", [])[faculty_index]
-    all_programs = user_data.get("all_programs", [])
-    
-    programs_in_faculty = [
-        p for p in all_programs 
-        if p.get("Название факультета") == selected_faculty_name
-    ]
-    
-    program_names = [p.get("Название программы", "N/A") for p in programs_in_faculty]
+    user_data['selected_faculty_index'] = faculty_index
+    selected = _faculty(catalog_registry, user_data)
+    if selected is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
+    index, _ = selected
+    selected_faculty_name = index.faculties.labels[faculty_index]
+    program_names = index.programs[faculty_index]
     
-    await state.update_data(
-        programs_in_faculty=programs_in_faculty, 
-        selected_faculty_index=faculty_index
-    )
+    await state.update_data(selected_faculty_index=faculty_index)
     await state.set_state(Universities.choosing_program)
     
     await callback.message.edit_text(
@@ -235,12 +324,15 @@ async def faculty_selected_handler(callback: types.CallbackQuery, state: FSMCont
     await callback.answer()
 
 @router.callback_query(Universities.choosing_program, F.data.startswith("program_"))
-async def program_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+async def program_selected_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, catalog_registry: CatalogRegistry):
     program_index = int(callback.data.split('_')[1])
     user_data = await state.get_data()
     lang = user_data.get('language', 'ru')
     
-    program = user_data.get("programs_in_faculty", [])[program_index]
+    if _faculty(catalog_registry, user_data) is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
+    program = _faculty_program(catalog_registry, user_data, program_index)
     
     if not program:
         await callback.answer("Не удалось найти информацию о программе.", show_alert=True)
@@ -248,22 +340,11 @@ async def program_selected_handler(callback: types.CallbackQuery, state: FSMCont
 
     await state.set_state(Universities.viewing_faculty) 
     
-    card_parts = [f"<b>{program.get('Название программы')}</b>\n"]
-    for field_name in VISIBLE_PROGRAM_FIELDS:
-        if field_name == "Название программы": continue 
-        value = program.get(field_name)
-        if value: 
-            card_parts.append(f"<b>{field_name}:</b> {value}")
-            
-    card_text = "\n".join(card_parts)
-    
-    builder = InlineKeyboardBuilder()
-    if program.get("Список документов"):
-        builder.row(types.InlineKeyboardButton(text="📄 Список документов", callback_data=f"show_docs_{program_index}"))
-
-    builder.row(types.InlineKeyboardButton(text=lexicon[lang]['button-back'], callback_data="back_to_faculties"))
-    
-    await callback.message.edit_text(card_text, reply_markup=builder.as_markup())
+    # Карточка, открытая из поиска или подбора, сохраняет кнопку возврата к результатам
+    from_results = list(user_data.get("search_card") or ()) == [user_data.get("selected_faculty_index"), program_index]
+    results_callback = user_data.get("results_callback") if from_results else None
+    card_text, card_markup = get_program_card(program, program_index, lexicon, lang, results_callback=results_callback)
+    await callback.message.edit_text(card_text, reply_markup=card_markup)
     await callback.answer()
 
 # --- ОБРАБОТЧИКИ "НАЗАД" ---
@@ -301,15 +382,17 @@ async def back_to_universities_handler(
     callback: types.CallbackQuery, 
     state: FSMContext, 
     lexicon: dict, 
+    catalog_registry: CatalogRegistry
 ):
 
     user_data = await state.get_data()
     lang = user_data.get('language', 'ru')
     selected_city = user_data.get("selected_city")
     selected_type = user_data.get("uni_type")
-    all_universities_in_file = user_data.get("filtered_universities", [])
-    
-    uni_names = [uni.get("Наименования ВОУ", "N/A") for uni in all_universities_in_file]
+    uni_names = _university_names(catalog_registry, user_data.get("universities_snapshot"))
+    if uni_names is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     
     await state.set_state(Universities.choosing_university)
     await callback.message.edit_text(
@@ -321,32 +404,38 @@ async def back_to_universities_handler(
     await callback.answer()
 
 @router.callback_query(F.data == "back_to_faculties")
-async def back_to_faculties_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, universities_manager: UniversitiesGSheet):
+async def back_to_faculties_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, universities_manager: UniversitiesGSheet, catalog_registry: CatalogRegistry):
     user_data = await state.get_data()
     lang = user_data.get('language', 'ru')
     
     uni_index = user_data.get("selected_university_index")
-    selected_university = user_data.get("filtered_universities", [])[uni_index]
-    unique_faculties = user_data.get("unique_faculties", []) 
+    selected_university = catalog_registry.get_item(user_data.get("universities_snapshot"), uni_index or 0)
+    index = _program_index(catalog_registry, user_data.get("programs_snapshot"))
+    if not selected_university or index is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
 
     await state.set_state(Universities.choosing_faculty)
     await callback.message.edit_text(
         f"<b>{selected_university.get('Наименования ВОУ')}</b>\n\nВыберите факультет:",
         reply_markup=get_paginated_keyboard(
-            items=unique_faculties, page=0, data_prefix="faculty", back_callback="back_to_universities", lexicon=lexicon, lang=lang
+            items=index.faculties, page=0, data_prefix="faculty", back_callback="back_to_universities", lexicon=lexicon, lang=lang
         )
     )
     await callback.answer()
     
 @router.callback_query(F.data == "back_to_programs")
-async def back_to_programs_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+async def back_to_programs_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, catalog_registry: CatalogRegistry):
     user_data = await state.get_data()
     lang = user_data.get('language', 'ru')
 
-    faculty_index = user_data.get("selected_faculty_index")
-    selected_faculty_name = user_data.get("unique_faculties", [])[faculty_index]
-    programs_in_faculty = user_data.get("programs_in_faculty", [])
-    program_names = [p.get("Название программы", "N/A") for p in programs_in_faculty]
+    selected = _faculty(catalog_registry, user_data)
+    if selected is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
+    index, faculty_index = selected
+    selected_faculty_name = index.faculties.labels[faculty_index]
+    program_names = index.programs[faculty_index]
 
     await state.set_state(Universities.choosing_program)
     await callback.message.edit_text(
@@ -360,7 +449,7 @@ async def back_to_programs_handler(callback: types.CallbackQuery, state: FSMCont
 # --- ПАГИНАЦИЯ (ОБЩАЯ) ---
 
 @router.callback_query(F.data.startswith("page_"))
-async def pagination_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+async def pagination_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, catalog_registry: CatalogRegistry):
     parts = callback.data.split('_')
     data_prefix = parts[1]
     page = int(parts[2])
@@ -369,18 +458,24 @@ async def pagination_handler(callback: types.CallbackQuery, state: FSMContext, l
     user_data = await state.get_data()
     lang = user_data.get('language', 'ru')
     
-    items_list = []
+    items_list = None
     back_callback = ""
     
     if data_prefix == 'uni':
-        items_list = [uni.get("Наименования ВОУ", "N/A") for uni in user_data.get("filtered_universities", [])]
+        items_list = _university_names(catalog_registry, user_data.get("universities_snapshot"))
         back_callback = "back_to_uni_type"
     elif data_prefix == 'faculty':
-        items_list = user_data.get("unique_faculties", [])
+        index = _program_index(catalog_registry, user_data.get("programs_snapshot"))
+        items_list = index.faculties if index else None
         back_callback = "back_to_universities"
     elif data_prefix == 'program':
-        items_list = [p.get("Название программы", "N/A") for p in user_data.get("programs_in_faculty", [])]
+        selected = _faculty(catalog_registry, user_data)
+        items_list = selected[0].programs[selected[1]] if selected else None
         back_callback = "back_to_faculties"
+
+    if items_list is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
     
     await callback.message.edit_reply_markup(
         reply_markup=get_paginated_keyboard(
@@ -398,14 +493,14 @@ async def pagination_handler(callback: types.CallbackQuery, state: FSMContext, l
 # --- ОБРАБОТЧИК ДОКУМЕНТОВ ---
 
 @router.callback_query(Universities.viewing_faculty, F.data.startswith("show_docs_"))
-async def show_documents_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict): 
+async def show_documents_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, catalog_registry: CatalogRegistry): 
     try:
         program_index = int(callback.data.split("_", 2)[2])
         user_data = await state.get_data()
         lang = user_data.get('language', 'ru')
         
-        program = user_data.get("programs_in_faculty", [])[program_index]
-        documents_text = program.get("Список документов")
+        program = _faculty_program(catalog_registry, user_data, program_index)
+        documents_text = program.get("Список документов") if program else None
         
         if documents_text:
             await callback.message.delete()
@@ -426,6 +521,411 @@ async def show_documents_handler(callback: types.CallbackQuery, state: FSMContex
     await callback.answer()
 
 @router.callback_query(Universities.viewing_faculty, F.data.startswith("program_"))
-async def back_to_program_card_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
-    await program_selected_handler(callback, state, lexicon)
+async def back_to_program_card_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, catalog_registry: CatalogRegistry):
+    await program_selected_handler(callback, state, lexicon, catalog_registry)
+
+
+
+# --- ПОИСК ---
+
+SEARCH_ICONS = {UNIVERSITY: "🏛", FACULTY: "📂", PROGRAM: "🎓"}
+SEARCH_PROMPT = ("🔎 Введите название вуза, факультета или программы.\n"
+                 "Можно на русском или узбекском, кириллицей или латиницей, и не целиком: «тошкент ахборот», «samarqand fiz».")
+
+def get_search_prompt_keyboard(lexicon: dict, lang: str):
+    builder = InlineKeyboardBuilder()
+    builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data="back_to_cities"))
+    return builder.as_markup()
+
+def get_search_results_keyboard(results: list, lexicon: dict, lang: str):
+    builder = InlineKeyboardBuilder()
+    for document in results:
+        builder.row(types.InlineKeyboardButton(
+            text=f"{SEARCH_ICONS.get(document.kind, '')} {document.title}",
+            callback_data=SearchResultCallback(doc=document.doc_id).pack()
+        ))
+    builder.row(types.InlineKeyboardButton(text="🔎 Новый поиск", callback_data="search_start"))
+    builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data="back_to_cities"))
+    return builder.as_markup()
+
+def search_results_message(query: str, university_catalog: UniversityCatalog, lexicon: dict, lang: str):
+    """Текст и клавиатура с результатами поиска."""
+    if not university_catalog.loaded:
+        return "Каталог вузов ещё загружается, попробуйте через минуту.", get_search_results_keyboard([], lexicon, lang)
+    results = university_catalog.index.search(query, limit=SEARCH_MAX_RESULTS)
+    if not results:
+        text = f"По запросу «{html.escape(query)}» ничего не найдено. Попробуйте другое написание или часть названия."
+        return text, get_search_results_keyboard([], lexicon, lang)
+    lines = [f"🔎 Результаты по запросу «{html.escape(query)}»:\n"]
+    for document in results:
+        lines.append(f"{SEARCH_ICONS.get(document.kind, '')} <b>{html.escape(document.title)}</b>\n"
+                     f"<i>{html.escape(document.subtitle)}</i>")
+    return "\n".join(lines), get_search_results_keyboard(results, lexicon, lang)
+
+@router.callback_query(F.data == "search_start")
+async def search_start_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict):
+    lang = (await state.get_data()).get('language', 'ru')
+    await state.set_state(Universities.searching)
+    await callback.message.edit_text(SEARCH_PROMPT, reply_markup=get_search_prompt_keyboard(lexicon, lang))
+    await callback.answer()
+
+@router.message(Command("search"))
+async def search_command_handler(message: types.Message, state: FSMContext, command: CommandObject, lexicon: dict, university_catalog: UniversityCatalog):
+    lang = (await state.get_data()).get('language', 'ru')
+    await state.set_state(Universities.searching)
+    if not command.args:
+        await message.answer(SEARCH_PROMPT, reply_markup=get_search_prompt_keyboard(lexicon, lang))
+        return
+    await state.update_data(search_query=command.args, results_callback="search_back")
+    text, markup = search_results_message(command.args, university_catalog, lexicon, lang)
+    await message.answer(text, reply_markup=markup)
+
+# Кнопки главного меню начинаются с эмодзи и обрабатываются своими роутерами
+@router.message(Universities.searching, F.text.regexp(r"^\w"))
+async def search_query_handler(message: types.Message, state: FSMContext, lexicon: dict, university_catalog: UniversityCatalog):
+    lang = (await state.get_data()).get('language', 'ru')
+    await state.update_data(search_query=message.text, results_callback="search_back")
+    text, markup = search_results_message(message.text, university_catalog, lexicon, lang)
+    await message.answer(text, reply_markup=markup)
+
+@router.callback_query(F.data == "search_back")
+async def search_back_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, university_catalog: UniversityCatalog):
+    user_data = await state.get_data()
+    lang = user_data.get('language', 'ru')
+    query = user_data.get('search_query')
+    await state.set_state(Universities.searching)
+    if not query:
+        await callback.message.edit_text(SEARCH_PROMPT, reply_markup=get_search_prompt_keyboard(lexicon, lang))
+    else:
+        text, markup = search_results_message(query, university_catalog, lexicon, lang)
+        await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
 
+@router.callback_query(SearchResultCallback.filter())
+async def search_result_handler(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    lexicon: dict,
+    callback_data: SearchResultCallback,
+    university_catalog: UniversityCatalog,
+    catalog_registry: CatalogRegistry
+):
+    """Открывает найденный вуз, факультет или программу на нужном шаге обычной навигации."""
+    document = university_catalog.index.get(callback_data.doc)
+    if document is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
+    found = document.payload
+    lang = (await state.get_data()).get('language', 'ru')
+
+    universities_snapshot = university_catalog.universities_snapshot(catalog_registry, found['sheet_id'], found['city'])
+    selected_university = catalog_registry.get_item(universities_snapshot, found['uni_index'])
+    if selected_university is None:
+        await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+        return
+    programs_snapshot = university_catalog.programs_snapshot(catalog_registry, found['sheet_id'], found['sheet_name'])
+    if not programs_snapshot:
+        await callback.answer(f"Для этого вуза факультеты (на листе '{found['sheet_name']}') еще не добавлены.", show_alert=True)
+        return
+
+    # Те же снимки, что создаёт обычная навигация: кнопки "Назад" работают как обычно
+    index = _program_index(catalog_registry, programs_snapshot)
+    await state.update_data(
+        page=0,
+        selected_city=found['city'],
+        uni_type=found['uni_type'],
+        current_sheet_id=found['sheet_id'],
+        universities_snapshot=universities_snapshot,
+        selected_university_index=found['uni_index'],
+        programs_snapshot=programs_snapshot
+    )
+
+    if document.kind == UNIVERSITY:
+        await state.set_state(Universities.choosing_faculty)
+        await callback.message.edit_text(
+            f"<b>{selected_university.get('Наименования ВОУ')}</b>\n\nВыберите факультет:",
+            reply_markup=get_paginated_keyboard(
+                items=index.faculties, page=0, data_prefix="faculty", back_callback="back_to_universities", lexicon=lexicon, lang=lang
+            )
+        )
+        await callback.answer()
+        return
+
+    faculty_index = index.faculties.labels.index(found['faculty'])
+    await state.update_data(selected_faculty_index=faculty_index)
+
+    if document.kind == FACULTY:
+        await state.set_state(Universities.choosing_program)
+        await callback.message.edit_text(
+            f"<b>{found['faculty']}</b>\n\nВыберите программу обучения:",
+            reply_markup=get_paginated_keyboard(
+                items=index.programs[faculty_index], page=0, data_prefix="program", back_callback="back_to_faculties", lexicon=lexicon, lang=lang
+            )
+        )
+        await callback.answer()
+        return
+
+    program_index = index.program_positions[faculty_index].index(found['program_row'])
+    await state.update_data(search_card=[faculty_index, program_index])
+    await state.set_state(Universities.viewing_faculty)
+    card_text, card_markup = get_program_card(
+        programs[found['program_row']], program_index, lexicon, lang,
+        results_callback=(await state.get_data()).get('results_callback', "search_back")
+    )
+    await callback.message.edit_text(card_text, reply_markup=card_markup)
+    await callback.answer()
+
+
+# --- ПОДБОР ПРОГРАММ ПО ФИЛЬТРАМ ---
+
+FILTER_FLAGS = {'budget': "🎓 Бюджетные места", 'dormitory': "🏠 Общежитие", 'stipend': "💰 Стипендия"}
+COST_STEPS = [5_000_000, 10_000_000, 15_000_000, 20_000_000, 30_000_000]
+SCORE_STEPS = [100, 125, 150, 175]
+EXAM_BUTTONS = 10
+CATALOG_LOADING_TEXT = "Каталог вузов ещё загружается, попробуйте через минуту."
+
+def _next_step(steps: list, current):
+    """Следующее значение по кругу: не задано -> steps[0] -> ... -> не задано."""
+    options = [None] + list(steps)
+    position = options.index(current) if current in options else 0
+    return options[(position + 1) % len(options)]
+
+def _millions(value) -> str:
+    return f"{value / 1_000_000:g} млн"
+
+def get_program_filters_keyboard(filters: dict, total: int, scope_city: str, back_callback: str, lexicon: dict, lang: str):
+    builder = InlineKeyboardBuilder()
+    for flag, label in FILTER_FLAGS.items():
+        mark = "✅" if filters.get(flag) else "▫️"
+        builder.row(types.InlineKeyboardButton(text=f"{mark} {label}", callback_data=ProgramFilterCallback(action='flag', value=flag).pack()))
+    form = STUDY_FORMS.get(filters.get('form'), "любая")
+    cost = f"до {_millions(filters['max_cost'])} сум" if filters.get('max_cost') else "любая"
+    score = filters.get('score') or "не указан"
+    exams = f"выбрано {len(filters['exams'])}" if filters.get('exams') else "любые"
+    builder.row(types.InlineKeyboardButton(text=f"📚 Форма обучения: {form}", callback_data=ProgramFilterCallback(action='form').pack()))
+    builder.row(types.InlineKeyboardButton(text=f"💵 Стоимость: {cost}", callback_data=ProgramFilterCallback(action='cost').pack()))
+    builder.row(types.InlineKeyboardButton(text=f"🎯 Мой балл: {score}", callback_data=ProgramFilterCallback(action='score').pack()))
+    builder.row(types.InlineKeyboardButton(text=f"📝 Мои экзамены: {exams}", callback_data=ProgramFilterCallback(action='exams').pack()))
+    if scope_city:
+        scope = f"📍 {filters['city']}" if filters.get('city') else "📍 Вся страна"
+        builder.row(types.InlineKeyboardButton(text=scope, callback_data=ProgramFilterCallback(action='scope').pack()))
+    builder.row(types.InlineKeyboardButton(text=f"🔎 Показать программы ({total})", callback_data=ProgramFilterCallback(action='show').pack()))
+    builder.row(types.InlineKeyboardButton(text="♻️ Сбросить", callback_data=ProgramFilterCallback(action='reset').pack()))
+    builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data=back_callback))
+    return builder.as_markup()
+
+def get_exam_filters_keyboard(selected: list, exams: list):
+    builder = InlineKeyboardBuilder()
+    for key, name in exams:
+        mark = "✅" if key in selected else "▫️"
+        builder.row(types.InlineKeyboardButton(text=f"{mark} {name[:1].upper()}{name[1:]}", callback_data=ProgramFilterCallback(action='exam', value=key).pack()))
+    builder.row(types.InlineKeyboardButton(text="✔️ Готово", callback_data=ProgramFilterCallback(action='edit').pack()))
+    return builder.as_markup()
+
+async def _show_program_filters(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, university_catalog: UniversityCatalog):
+    user_data = await state.get_data()
+    lang = user_data.get('language', 'ru')
+    filters = user_data.get('program_filters') or {}
+    total, _ = university_catalog.facets.query(filters, limit=0)
+    where = filters.get('city') or "вся страна"
+    await callback.message.edit_text(
+        f"🎛 <b>Подбор программ</b> ({where})\n\n"
+        "Отметьте, что для вас важно. «Мой балл» оставит программы с проходным баллом не выше вашего, "
+        "«Мои экзамены» — программы, для которых не нужны другие экзамены.",
+        reply_markup=get_program_filters_keyboard(
+            filters, total, user_data.get('filters_city'), user_data.get('filters_back', "back_to_cities"), lexicon, lang
+        )
+    )
+    await callback.answer()
+
+@router.callback_query(ProgramFilterCallback.filter(F.action == 'open'))
+async def program_filters_open_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, callback_data: ProgramFilterCallback, university_catalog: UniversityCatalog):
+    if not university_catalog.loaded:
+        await callback.answer(CATALOG_LOADING_TEXT, show_alert=True)
+        return
+    city = (await state.get_data()).get('selected_city') if callback_data.value == 'city' else None
+    await state.update_data(
+        program_filters={'city': city} if city else {},
+        filters_city=city,
+        filters_back="back_to_uni_type" if city else "back_to_cities"
+    )
+    await _show_program_filters(callback, state, lexicon, university_catalog)
+
+@router.callback_query(ProgramFilterCallback.filter(F.action.in_({'flag', 'form', 'cost', 'score', 'scope', 'reset', 'edit'})))
+async def program_filters_change_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, callback_data: ProgramFilterCallback, university_catalog: UniversityCatalog):
+    user_data = await state.get_data()
+    filters = dict(user_data.get('program_filters') or {})
+    action = callback_data.action
+
+    if action == 'flag' and callback_data.value in FILTER_FLAGS:
+        filters[callback_data.value] = None if filters.get(callback_data.value) else True
+    elif action == 'form':
+        filters['form'] = _next_step(list(STUDY_FORMS), filters.get('form'))
+    elif action == 'cost':
+        filters['max_cost'] = _next_step(COST_STEPS, filters.get('max_cost'))
+    elif action == 'score':
+        filters['score'] = _next_step(SCORE_STEPS, filters.get('score'))
+    elif action == 'scope':
+        filters['city'] = None if filters.get('city') else user_data.get('filters_city')
+    elif action == 'reset':
+        filters = {'city': filters.get('city')}
+
+    await state.update_data(program_filters={k: v for k, v in filters.items() if v is not None})
+    await _show_program_filters(callback, state, lexicon, university_catalog)
+
+@router.callback_query(ProgramFilterCallback.filter(F.action.in_({'exams', 'exam'})))
+async def program_filters_exams_handler(callback: types.CallbackQuery, state: FSMContext, callback_data: ProgramFilterCallback, university_catalog: UniversityCatalog):
+    filters = dict((await state.get_data()).get('program_filters') or {})
+    selected = list(filters.get('exams') or [])
+    if callback_data.action == 'exam':
+        if callback_data.value in selected:
+            selected.remove(callback_data.value)
+        else:
+            selected.append(callback_data.value)
+        filters['exams'] = selected
+        await state.update_data(program_filters={k: v for k, v in filters.items() if v})
+
+    await callback.message.edit_text(
+        "📝 Отметьте экзамены, которые вы сдаёте. Останутся программы, для которых других экзаменов не нужно.",
+        reply_markup=get_exam_filters_keyboard(selected, university_catalog.facets.top_exams(EXAM_BUTTONS))
+    )
+    await callback.answer()
+
+@router.callback_query(ProgramFilterCallback.filter(F.action == 'show'))
+async def program_filters_results_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, university_catalog: UniversityCatalog):
+    user_data = await state.get_data()
+    lang = user_data.get('language', 'ru')
+    filters = user_data.get('program_filters') or {}
+    total, doc_ids = university_catalog.facets.query(filters, limit=SEARCH_MAX_RESULTS)
+    documents = [d for d in map(university_catalog.index.get, doc_ids) if d is not None]
+    if not documents:
+        await callback.answer("Под эти фильтры не подходит ни одна программа. Попробуйте ослабить условия.", show_alert=True)
+        return
+
+    lines = [f"🎛 Найдено программ: {total}. Сначала — с меньшим проходным баллом.\n"]
+    for document in documents:
+        facets = university_catalog.facets.get(document.doc_id)
+        details = []
+        if facets.min_score is not None:
+            details.append(f"от {facets.min_score:g} баллов")
+        if facets.cost is not None:
+            details.append(f"{_millions(facets.cost)} сум" if facets.currency == 'UZS' else f"{facets.cost:g} {facets.currency}")
+        lines.append(f"🎓 <b>{html.escape(document.title)}</b>\n<i>{html.escape(document.subtitle)}</i>"
+                     + (f"\n{', '.join(details)}" if details else ""))
+
+    builder = InlineKeyboardBuilder()
+    for document in documents:
+        builder.row(types.InlineKeyboardButton(text=f"🎓 {document.title}", callback_data=SearchResultCallback(doc=document.doc_id).pack()))
+    builder.row(types.InlineKeyboardButton(text="🎛 Изменить фильтры", callback_data=ProgramFilterCallback(action='edit').pack()))
+    builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data=user_data.get('filters_back', "back_to_cities")))
+
+    await state.update_data(results_callback=ProgramFilterCallback(action='show').pack())
+    await callback.message.edit_text("\n".join(lines), reply_markup=builder.as_markup())
+    await callback.answer()
+
+
+# --- ВСЕ РЕГИОНЫ И РЕЙТИНГИ ---
+
+NATIONWIDE_PER_PAGE = 8
+SORT_LABELS = {
+    'name': "по названию",
+    'score': "проходной балл ↑",
+    'cost': "стоимость ↑",
+    'budget': "бюджетных программ ↓",
+    'programs': "программ ↓",
+}
+TYPE_FILTERS = [None, STATE, PRIVATE, FOREIGN]
+
+def get_regions_keyboard(regions: list, lexicon: dict, lang: str):
+    builder = InlineKeyboardBuilder()
+    builder.row(types.InlineKeyboardButton(text="🏆 Рейтинг вузов страны", callback_data=NationwideCallback(action='list').pack()))
+    for city, universities, _ in regions:
+        builder.row(types.InlineKeyboardButton(text=f"📍 {city} ({universities})", callback_data=RegionCallback.of(city)))
+    builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data="back_to_cities"))
+    return builder.as_markup()
+
+def nationwide_ranking_message(view: dict, university_catalog: UniversityCatalog, lexicon: dict, lang: str):
+    """Текст и клавиатура страницы рейтинга; view — настройки из FSM (sort, type, city, page)."""
+    ranking = university_catalog.overview.ranking(view.get('sort', 'name'), view.get('type'), view.get('city'))
+    pages = PagedList(ranking, NATIONWIDE_PER_PAGE)
+    page = min(view.get('page', 0), max(0, (len(ranking) - 1) // NATIONWIDE_PER_PAGE))
+    where = view.get('city') or "вся страна"
+    kind = view['type'].lower() if view.get('type') else "все"
+    lines = [f"🏆 <b>Вузы: {html.escape(where)}</b> ({kind}, {len(ranking)})\n"
+             f"Сортировка: {SORT_LABELS.get(view.get('sort'), SORT_LABELS['name'])}\n"]
+
+    builder = InlineKeyboardBuilder()
+    for position, summary in pages.page(page):
+        details = [f"{summary.programs} программ"]
+        if summary.budget_programs:
+            details.append(f"бюджет: {summary.budget_programs}")
+        if summary.min_score is not None:
+            details.append(f"от {summary.min_score:g} баллов")
+        if summary.min_cost is not None:
+            details.append(f"от {_millions(summary.min_cost)} сум")
+        lines.append(f"{position + 1}. <b>{html.escape(summary.name)}</b>\n"
+                     f"<i>{html.escape(summary.city)}, {summary.uni_type.lower()}</i> · {', '.join(details)}")
+        builder.row(types.InlineKeyboardButton(text=f"{position + 1}. {summary.name}", callback_data=SearchResultCallback(doc=summary.doc_id).pack()))
+
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(types.InlineKeyboardButton(text="⬅️", callback_data=NationwideCallback(action='page', page=page - 1).pack()))
+    if pages.has_next(page):
+        nav_buttons.append(types.InlineKeyboardButton(text="➡️", callback_data=NationwideCallback(action='page', page=page + 1).pack()))
+    if nav_buttons: builder.row(*nav_buttons)
+    builder.row(
+        types.InlineKeyboardButton(text="↕️ Сортировка", callback_data=NationwideCallback(action='sort').pack()),
+        types.InlineKeyboardButton(text="🏷 Тип вуза", callback_data=NationwideCallback(action='type').pack())
+    )
+    builder.row(types.InlineKeyboardButton(text="🗺 Регионы", callback_data=NationwideCallback(action='open').pack()))
+    builder.row(types.InlineKeyboardButton(text=lexicon.get(lang, {}).get('button-back', 'Back'), callback_data="back_to_cities"))
+    return "\n".join(lines), builder.as_markup()
+
+@router.callback_query(NationwideCallback.filter(F.action == 'open'))
+async def nationwide_regions_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, university_catalog: UniversityCatalog):
+    """Сводка по регионам: число вузов и программ в каждом, из каталога в памяти."""
+    if not university_catalog.loaded:
+        await callback.answer(CATALOG_LOADING_TEXT, show_alert=True)
+        return
+    lang = (await state.get_data()).get('language', 'ru')
+    regions = university_catalog.overview.regions()
+    total_programs = sum(programs for _, _, programs in regions)
+    await callback.message.edit_text(
+        f"🌍 <b>Вузы по всей стране</b>\n\n"
+        f"{len(university_catalog.overview)} вузов и {total_programs} программ в {len(regions)} регионах.\n"
+        "Выберите регион или откройте рейтинг по всей стране.",
+        reply_markup=get_regions_keyboard(regions, lexicon, lang)
+    )
+    await callback.answer()
+
+@router.callback_query(or_f(RegionCallback.filter(), NationwideCallback.filter(F.action.in_({'list', 'sort', 'type', 'page'}))))
+async def nationwide_ranking_handler(callback: types.CallbackQuery, state: FSMContext, lexicon: dict, callback_data, university_catalog: UniversityCatalog):
+    if not university_catalog.loaded:
+        await callback.answer(CATALOG_LOADING_TEXT, show_alert=True)
+        return
+    user_data = await state.get_data()
+    lang = user_data.get('language', 'ru')
+    view = dict(user_data.get('nationwide') or {})
+
+    if isinstance(callback_data, RegionCallback):
+        city = callback_data.resolve()
+        if city is None:
+            await callback.answer(STALE_SNAPSHOT_TEXT, show_alert=True)
+            return
+        view = {'sort': view.get('sort', 'name'), 'city': city}
+    elif callback_data.action == 'list':
+        view = {'sort': view.get('sort', 'name')}
+    elif callback_data.action == 'sort':
+        sorts = list(SORT_LABELS)
+        view['sort'] = sorts[(sorts.index(view.get('sort', 'name')) + 1) % len(sorts)]
+        view['page'] = 0
+    elif callback_data.action == 'type':
+        view['type'] = TYPE_FILTERS[(TYPE_FILTERS.index(view.get('type')) + 1) % len(TYPE_FILTERS)]
+        view['page'] = 0
+    else:
+        view['page'] = callback_data.page
+
+    await state.update_data(nationwide={k: v for k, v in view.items() if v is not None})
+    text, markup = nationwide_ranking_message(view, university_catalog, lexicon, lang)
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
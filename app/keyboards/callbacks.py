@@ -0,0 +1,78 @@
+"""
+Typed callback data for buttons that select a catalog value by name.
+
+Each button carries "<prefix>:<short id>" (at most ~25 bytes); the name is
+resolved through app.utils.callback_ids. Build buttons with
+`SomeCallback.of(name)`, match them with `SomeCallback.filter()` and read the
+name with `callback_data.resolve()` (None if the ID is no longer known).
+"""
+
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
+
+from app.utils.callback_ids import SHORT_IDS
+from app.utils.locations import CITIES_RU, CITIES_UZ
+
+
+class NamedCallback(CallbackData, prefix='named'):
+    """Base class: a catalog value encoded as a short registry ID."""
+
+    id: str
+
+    @classmethod
+    def of(cls, value: str) -> str:
+        """Packed callback data for a button selecting `value`."""
+        return cls(id=SHORT_IDS.encode(cls.__prefix__, value)).pack()
+
+    def resolve(self) -> Optional[str]:
+        return SHORT_IDS.decode(self.__prefix__, self.id)
+
+
+class CityCallback(NamedCallback, prefix='city'):
+    """Город при регистрации ученика / ребенка."""
+
+
+class UniCityCallback(NamedCallback, prefix='uni_city'):
+    """Город в разделе вузов."""
+
+
+class ChildCallback(NamedCallback, prefix='select_child'):
+    """Ребенок, который будет проходить тест."""
+
+
+class CategoryCallback(NamedCallback, prefix='category'):
+    """Категория курсов."""
+
+
+class SubcategoryCallback(NamedCallback, prefix='subcategory'):
+    """Подкатегория курсов."""
+
+
+class RegionCallback(NamedCallback, prefix='nw_region'):
+    """Регион на экране вузов по всей стране."""
+
+
+class SearchResultCallback(CallbackData, prefix='srch'):
+    """Результат поиска по вузам (ID документа в поисковом индексе)."""
+
+    doc: int
+
+
+class ProgramFilterCallback(CallbackData, prefix='pf'):
+    """Действие на экране подбора программ по фильтрам."""
+
+    action: str
+    value: str = ''
+
+
+class NationwideCallback(CallbackData, prefix='nw'):
+    """Действие на экранах вузов по всей стране: open, list, sort, type, page."""
+
+    action: str
+    page: int = 0
+
+
+# Списки городов статичны: их кнопки должны работать и после перезапуска
+SHORT_IDS.pin(CityCallback.__prefix__, CITIES_RU + CITIES_UZ)
+SHORT_IDS.pin(UniCityCallback.__prefix__, CITIES_RU)
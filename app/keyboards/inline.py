@@ -4,6 +4,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram_calendar import SimpleCalendar
 
 from app.utils.locations import CITIES_RU, CITIES_UZ
+from app.keyboards.callbacks import CityCallback, CategoryCallback, SubcategoryCallback
 
 # --- ОБЩИЕ КЛАВИАТУРЫ ---
 
@@ -38,7 +39,7 @@ def get_city_keyboard(lang: str):
     cities_list = CITIES_UZ if lang == 'uz' else CITIES_RU
     builder = InlineKeyboardBuilder()
     for city in cities_list:
-        builder.add(InlineKeyboardButton(text=city, callback_data=f"city_{city}"))
+        builder.add(InlineKeyboardButton(text=city, callback_data=CityCallback.of(city)))
     builder.adjust(2)
     builder.row(types.InlineKeyboardButton(text="⌨️ Ввести город вручную", callback_data="manual_city_input"))
     return builder.as_markup()
@@ -371,7 +372,7 @@ def get_course_categories_keyboard(categories: list, lexicon: dict, lang: str):
     """Создает клавиатуру со списком категорий (Программирование, Математика)."""
     builder = InlineKeyboardBuilder()
     for cat in sorted(categories):
-        builder.row(types.InlineKeyboardButton(text=cat, callback_data=f"category_{cat}"))
+        builder.row(types.InlineKeyboardButton(text=cat, callback_data=CategoryCallback.of(cat)))
     builder.row(types.InlineKeyboardButton(text=lexicon[lang]['button-back'], callback_data="back_to_main_menu"))
     return builder.as_markup()
 
@@ -381,7 +382,7 @@ def get_course_subcategories_keyboard(subcategories: list, lexicon: dict, lang:
     """Создает клавиатуру со списком подкатегорий (Python, C++, Web)."""
     builder = InlineKeyboardBuilder()
     for subcat in sorted(subcategories):
-        builder.row(types.InlineKeyboardButton(text=subcat, callback_data=f"subcategory_{subcat}"))
+        builder.row(types.InlineKeyboardButton(text=subcat, callback_data=SubcategoryCallback.of(subcat)))
     builder.row(types.InlineKeyboardButton(text=lexicon[lang]['button-back'], callback_data="back_to_categories"))
     return builder.as_markup()
 
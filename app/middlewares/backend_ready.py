@@ -0,0 +1,51 @@
+"""
+Holds back handlers whose sheet manager is still connecting after a restart.
+
+The middleware is set on the dispatcher's event observers (inherited by every
+router) and looks at the matched handler's parameters: only a handler that
+takes e.g. `registration_manager` waits for that manager, so /start, language
+and role selection and other screens without Sheets work from the first
+second. If the manager does not come up in time, BackendBusyError is raised
+and the error router asks the user to retry.
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from app.core.config import SHEETS_INIT_WAIT
+from app.core.startup import BackendInitializer
+from app.middlewares.metrics import SKIPPED_EVENTS
+from app.utils.backends import BackendBusyError, SHEETS
+
+
+class BackendReadyMiddleware(BaseMiddleware):
+    """Inner middleware: waits for the managers the handler depends on."""
+
+    def __init__(self, initializer: BackendInitializer, timeout: float = SHEETS_INIT_WAIT):
+        self.initializer = initializer
+        self.timeout = timeout
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        if handler_object is not None:
+            # Обработчик с **kwargs получает все зависимости — ждём всех
+            needed = self.initializer.names if handler_object.varkw else self.initializer.names & handler_object.params
+            pending = [name for name in needed if not self.initializer.is_ready(name)]
+            if pending and not await self.initializer.wait(*pending, timeout=self.timeout):
+                raise BackendBusyError(SHEETS)
+        return await handler(event, data)
+
+
+def setup_backend_ready_middleware(dp: Dispatcher, initializer: BackendInitializer):
+    """Attach the middleware to every handler observer of the dispatcher."""
+    middleware = BackendReadyMiddleware(initializer)
+    for event_name, observer in dp.observers.items():
+        if event_name not in SKIPPED_EVENTS:
+            observer.middleware(middleware)
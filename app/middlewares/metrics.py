@@ -0,0 +1,114 @@
+"""
+Latency instrumentation for updates, handlers and Telegram Bot API calls.
+
+UpdateMetricsMiddleware is an outer update middleware: it times each update
+end to end (including the wait behind earlier updates of the same user).
+HandlerMetricsMiddleware is an inner middleware set on the dispatcher's
+event observers, so it is inherited by every router and sees the matched
+handler: it records per-router, per-handler latency, errors and in-flight
+counts. BotApiMetricsMiddleware wraps the bot session and times every Bot
+API method (edit_text, answer, ...). Sheets and Exode calls are timed in
+app.utils.backends.
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+from app.utils.metrics import (
+    UPDATE_DURATION, UPDATES_TOTAL, HANDLER_DURATION, HANDLER_ERRORS, HANDLERS_IN_FLIGHT,
+    BOT_API_DURATION, BOT_API_ERRORS
+)
+
+# Служебные события диспетчера, обработчиков бота на них нет
+SKIPPED_EVENTS = ('update', 'error')
+
+
+def _handler_labels(data: Dict[str, Any]):
+    """(router, handler) labels: the handler's module (one router per module) and function name."""
+    handler = data.get('handler')
+    callback = getattr(handler, 'callback', None)
+    if callback is None:
+        return 'unknown', 'unknown'
+    module = getattr(callback, '__module__', '') or ''
+    router = module.removeprefix('app.handlers.') if module != '__main__' else 'bot'
+    return router, getattr(callback, '__name__', type(callback).__name__)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: end-to-end time per update type."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await handler(event, data)
+            outcome = 'unhandled' if result is UNHANDLED else 'handled'
+            return result
+        finally:
+            UPDATE_DURATION.observe(event_type, value=time.perf_counter() - started)
+            UPDATES_TOTAL.inc(event_type, outcome)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: latency, errors and in-flight count per handler."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        labels = _handler_labels(data)
+        HANDLERS_IN_FLIGHT.inc(*labels)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(*labels, type(e).__name__)
+            raise
+        finally:
+            HANDLER_DURATION.observe(*labels, value=time.perf_counter() - started)
+            HANDLERS_IN_FLIGHT.dec(*labels)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware: time of every Bot API request by method."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            BOT_API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            BOT_API_DURATION.observe(name, value=time.perf_counter() - started)
+
+
+def setup_metrics_middlewares(dp: Dispatcher, bot: Bot):
+    """Attach all instrumentation; call before other outer update middlewares."""
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_middleware = HandlerMetricsMiddleware()
+    for event_name, observer in dp.observers.items():
+        if event_name not in SKIPPED_EVENTS:
+            observer.middleware(handler_middleware)
+    bot.session.middleware(BotApiMetricsMiddleware())
@@ -0,0 +1,34 @@
+"""
+Stops the AI recommendation on the results screen once the user moves on.
+
+The recommendation is written into the results message by a background task
+(RecommendationService.start_stream). Any message or button press of the same
+user means they are leaving that screen (or reopening it, which starts a new
+stream), so the task is cancelled before the update is handled and never edits
+a message that already shows something else.
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.utils.ai_helpers import RecommendationService
+
+
+class RecommendationStreamMiddleware(BaseMiddleware):
+    """Outer update middleware: cancels the user's recommendation stream on their next action."""
+
+    def __init__(self, recommendations: RecommendationService):
+        self.recommendations = recommendations
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is not None and isinstance(event, Update) and (event.message or event.callback_query):
+            self.recommendations.cancel_stream(user.id)
+        return await handler(event, data)
@@ -0,0 +1,95 @@
+"""
+Per-user update serialization.
+
+aiogram processes updates concurrently, so two fast taps of the same user run
+their handlers in parallel and race on get_data/update_data. This outer
+middleware runs the updates of one user strictly one after another. At most
+`max_pending` updates per user may wait; extra ones are dropped. A callback
+press that repeats one already waiting or running (same message, same data)
+is merged into it, i.e. answered and dropped.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.core.config import USER_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+
+class _UserSlot:
+    __slots__ = ('lock', 'pending', 'callbacks')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        self.callbacks: Set[Hashable] = set()
+
+
+class UserSerializationMiddleware(BaseMiddleware):
+    """Outer update middleware: one update at a time per user, bounded backlog."""
+
+    def __init__(self, max_pending: int = USER_MAX_PENDING):
+        self.max_pending = max_pending
+        self._slots: Dict[int, _UserSlot] = {}
+        self.stats = {'serialized': 0, 'dropped_duplicate': 0, 'dropped_overflow': 0}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None or not isinstance(event, Update):
+            return await handler(event, data)
+
+        slot = self._slots.get(user.id)
+        if slot is None:
+            slot = self._slots[user.id] = _UserSlot()
+
+        callback_key = self._callback_key(event)
+        if callback_key is not None and callback_key in slot.callbacks:
+            self.stats['dropped_duplicate'] += 1
+            await self._answer_callback(event, data)
+            return None
+        if slot.pending >= self.max_pending:
+            self.stats['dropped_overflow'] += 1
+            logger.info(f"Dropping update {event.update_id} of user {user.id}: {slot.pending} already pending")
+            await self._answer_callback(event, data, "⏳ Подождите, обрабатываю предыдущее действие...")
+            return None
+
+        slot.pending += 1
+        if callback_key is not None:
+            slot.callbacks.add(callback_key)
+        try:
+            async with slot.lock:
+                self.stats['serialized'] += 1
+                return await handler(event, data)
+        finally:
+            slot.pending -= 1
+            slot.callbacks.discard(callback_key)
+            if slot.pending == 0:
+                self._slots.pop(user.id, None)
+
+    @staticmethod
+    def _callback_key(update: Update) -> Optional[Hashable]:
+        callback = update.callback_query
+        if callback is None:
+            return None
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        return message_id, callback.data
+
+    @staticmethod
+    async def _answer_callback(update: Update, data: Dict[str, Any], text: Optional[str] = None):
+        # Убираем "часики" на кнопке, даже если нажатие отброшено
+        if update.callback_query is None:
+            return
+        try:
+            await data['bot'].answer_callback_query(update.callback_query.id, text=text)
+        except Exception as e:
+            logger.debug(f"Failed to answer dropped callback: {e}")
@@ -78,6 +78,7 @@ class Universities(StatesGroup):
     choosing_faculty = State()
     choosing_program = State()    
     viewing_faculty = State()
+    searching = State()
 
 class Support(StatesGroup):
     active_chat = State()
@@ -1,22 +1,303 @@
+"""
+Profession recommendations written from the STEM-navigator test answers.
+
+A model backend (an LLM behind an HTTP API, or LocalRecommendationBackend,
+the deterministic stand-in used until then and in tests) streams the text in
+chunks. RecommendationService sits in front of it:
+
+- a fixed pool of AI_WORKERS workers takes requests from a queue of at most
+  AI_MAX_QUEUED, so a burst of finished tests can't open unbounded model
+  calls; when the queue is full the caller gets RecommendationUnavailable;
+- every generation is limited to AI_TIMEOUT seconds, and a request that
+  waited longer than that in the queue is dropped before it starts;
+- results are cached by the normalized answer vector (one letter per
+  question, "ABCA..."), since many students answer identically, and a request
+  for an answer set that is already being generated joins it instead of
+  starting another call.
+
+stream() yields the text generated so far after every chunk, so the results
+screen can show it while the model is still writing. The screen is updated
+from a background task per user (start_stream), so the handler returns at
+once; the task is cancelled when the user sends anything else
+(RecommendationStreamMiddleware), while the generation itself still
+finishes and lands in the cache.
+"""
+
 import asyncio
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, Sequence, Tuple, Union
+
+from app.core.config import (
+    AI_BACKEND, AI_WORKERS, AI_MAX_QUEUED, AI_TIMEOUT, AI_CACHE_SIZE, AI_CACHE_TTL, AI_LOCAL_DELAY
+)
+from app.utils.inline_search import ResultCache
+from app.utils.metrics import REGISTRY
+from app.utils.scoring import ScoreCard, answer_codes
+from app.utils.test_content import SCALES_INFO
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationUnavailable(Exception):
+    """Raised when no recommendation can be produced now (queue full, timeout, backend error)."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Recommendation unavailable: {reason}")
+        self.reason = reason
+
+
+def normalize_answers(answers: Union[str, Sequence[str]]) -> str:
+    """One letter per question ("ABCA..."), from the FSM letters or from answer codes ("1_A", ...)."""
+    return ''.join(code.rsplit('_', 1)[-1] for code in answer_codes(answers)).upper()
+
+
+class RecommendationRequest:
+    """What a backend gets: normalized answers and the scales they score."""
+
+    __slots__ = ('answers', 'scores', 'top')
+
+    def __init__(self, answers: str):
+        card = ScoreCard.from_answers(answers)
+        self.answers = answers
+        self.scores = card.as_dict()
+        self.top = card.top(3)
+
+
+class RecommendationBackend:
+    """A model that writes a recommendation; generate() yields it in chunks."""
+
+    name = 'base'
+
+    def generate(self, request: RecommendationRequest) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+
+class LocalRecommendationBackend(RecommendationBackend):
+    """Deterministic stand-in for a model: text built from the leading scales, same answers -> same text."""
+
+    name = 'local'
+
+    def __init__(self, delay: float = AI_LOCAL_DELAY):
+        """
+        Args:
+            delay: Seconds between chunks, to imitate a model writing
+        """
+        self.delay = delay
+
+    async def generate(self, request: RecommendationRequest) -> AsyncIterator[str]:
+        if not request.top:
+            yield "Пока недостаточно ответов, чтобы что-то посоветовать — попробуй пройти тест ещё раз."
+            return
+        titles = [SCALES_INFO[scale]['title'] for scale, _ in request.top]
+        yield f"По твоим ответам сильнее всего выражены склонности «{titles[0]}»"
+        if len(titles) > 1:
+            yield ", а также " + " и ".join(f"«{title}»" for title in titles[1:])
+        yield ". Вот с чего можно начать:\n"
+        # Выбор профессий зависит только от ответов
+        seed = sum(ord(letter) * (i + 1) for i, letter in enumerate(request.answers))
+        for rank, (scale, score) in enumerate(request.top):
+            professions = SCALES_INFO[scale].get('professions') or []
+            if not professions:
+                continue
+            picked = [professions[(seed + rank + k) % len(professions)] for k in range(min(2, len(professions)))]
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield f"\n{rank + 1}. <b>{SCALES_INFO[scale]['title']}</b> ({score}): {', '.join(dict.fromkeys(picked))}."
+
+
+BACKENDS = {LocalRecommendationBackend.name: LocalRecommendationBackend}
+
+
+def create_backend(name: str = AI_BACKEND) -> RecommendationBackend:
+    backend = BACKENDS.get(name)
+    if backend is None:
+        logger.warning(f"Unknown AI_BACKEND '{name}', using the local stand-in")
+        backend = LocalRecommendationBackend
+    return backend()
+
+
+class _Job:
+    """One generation, shared by every caller waiting for the same answers."""
+
+    def __init__(self, request: RecommendationRequest):
+        self.request = request
+        self.created = time.monotonic()
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[RecommendationUnavailable] = None
+        self.changed = asyncio.Condition()
+
+    async def update(self, chunk: Optional[str] = None, error: Optional[RecommendationUnavailable] = None,
+                     done: bool = False):
+        async with self.changed:
+            if chunk:
+                self.chunks.append(chunk)
+            if error is not None:
+                self.error = error
+            self.done = self.done or done or error is not None
+            self.changed.notify_all()
+
+
+class RecommendationService:
+    """Bounded worker pool, timeouts, cache and request coalescing in front of a backend."""
+
+    def __init__(
+        self,
+        backend: RecommendationBackend,
+        workers: int = AI_WORKERS,
+        max_queued: int = AI_MAX_QUEUED,
+        timeout: float = AI_TIMEOUT,
+        cache_size: int = AI_CACHE_SIZE,
+        cache_ttl: float = AI_CACHE_TTL
+    ):
+        self.backend = backend
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.cache = ResultCache(cache_size, cache_ttl)
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: Dict[Tuple[str, str], _Job] = {}
+        # Пользователь -> задача, дописывающая совет на его экран результатов
+        self._streams: Dict[int, asyncio.Task] = {}
+        self.stats = {'cached': 0, 'joined': 0, 'generated': 0, 'rejected': 0, 'timed_out': 0, 'errors': 0}
+        REGISTRY.add_collector('recommendations', self.collect_metrics)
+
+    def cached(self, answers: Union[str, Sequence[str]]) -> Optional[str]:
+        """The recommendation for `answers` if it is already cached, without generating one."""
+        text = self.cache.get((self.backend.name, normalize_answers(answers)))
+        if text is not None:
+            self.stats['cached'] += 1
+        return text
+
+    async def recommend(self, answers: Union[str, Sequence[str]]) -> str:
+        """The whole recommendation for `answers`."""
+        text = ''
+        async for text in self.stream(answers):
+            pass
+        return text
+
+    async def stream(self, answers: Union[str, Sequence[str]]) -> AsyncIterator[str]:
+        """
+        Text generated so far, after every new chunk; the last value is the whole recommendation.
+
+        Raises:
+            RecommendationUnavailable: queue full, generation timed out or failed
+        """
+        normalized = normalize_answers(answers)
+        key = (self.backend.name, normalized)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats['cached'] += 1
+            yield cached
+            return
+
+        job = self._jobs.get(key)
+        if job is None:
+            job = self._submit(key, RecommendationRequest(normalized))
+        else:
+            self.stats['joined'] += 1
+
+        seen = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.done or len(job.chunks) > seen)
+            if job.error is not None:
+                raise job.error
+            if len(job.chunks) > seen:
+                seen = len(job.chunks)
+                yield ''.join(job.chunks)
+            if job.done and seen == len(job.chunks):
+                return
+
+    def start_stream(self, user_id: int, coro: Awaitable):
+        """Run `coro` (showing a recommendation to `user_id`) in the background, replacing the previous one."""
+        self.cancel_stream(user_id)
+        task = asyncio.create_task(coro)
+        self._streams[user_id] = task
+        task.add_done_callback(lambda t: self._stream_done(user_id, t))
+
+    def cancel_stream(self, user_id: int):
+        """Stop updating the screen of `user_id`; the generation itself goes on into the cache."""
+        task = self._streams.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+
+    def _stream_done(self, user_id: int, task: asyncio.Task):
+        if self._streams.get(user_id) is task:
+            del self._streams[user_id]
+        if not task.cancelled() and task.exception():
+            logger.error(f"Recommendation stream for user {user_id} failed: {task.exception()}")
+
+    def _submit(self, key: Tuple[str, str], request: RecommendationRequest) -> _Job:
+        queue = self._get_queue()
+        if queue.full():
+            self.stats['rejected'] += 1
+            raise RecommendationUnavailable('busy')
+        job = self._jobs[key] = _Job(request)
+        queue.put_nowait((key, job))
+        return job
+
+    def _get_queue(self) -> asyncio.Queue:
+        # Очередь и воркеры создаются лениво и заново для нового event loop (как в backends.py)
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._loop = loop
+            self._jobs = {}
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self._queue
+
+    async def _worker(self):
+        while True:
+            key, job = await self._queue.get()
+            try:
+                await self._run(key, job)
+            finally:
+                self._jobs.pop(key, None)
+                self._queue.task_done()
+
+    async def _run(self, key: Tuple[str, str], job: _Job):
+        if time.monotonic() - job.created > self.timeout:
+            self.stats['timed_out'] += 1
+            await job.update(error=RecommendationUnavailable('timeout'))
+            return
+        try:
+            await asyncio.wait_for(self._generate(job), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats['timed_out'] += 1
+            logger.warning(f"Recommendation timed out after {self.timeout}s ({self.backend.name})")
+            await job.update(error=RecommendationUnavailable('timeout'))
+            return
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Recommendation backend {self.backend.name} failed: {e}")
+            await job.update(error=RecommendationUnavailable('error'))
+            return
+        self.stats['generated'] += 1
+        self.cache.put(key, ''.join(job.chunks))
+        await job.update(done=True)
+
+    async def _generate(self, job: _Job):
+        async for chunk in self.backend.generate(job.request):
+            await job.update(chunk)
+
+    async def stop(self):
+        streams = list(self._streams.values())
+        for task in streams:
+            task.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
 
-async def get_profession_recommendation_mock(answers: list) -> str:
-    """
-    Это функция-заглушка. Она имитирует обращение к ChatGPT.
-    В будущем вы замените её на реальный вызов API.
-    """
-    print(f"🤖 ИИ-заглушка получила ответы: {answers}")
-    print("⏳ Имитирую обработку...")
-
-    await asyncio.sleep(3) 
-    
-    print("✅ Обработка завершена, возвращаю результат.")
-
-    mock_result = (
-        "На основе твоих ответов, я вижу у тебя склонности к аналитике и созданию систем. Тебе могут подойти следующие профессии:\n\n"
-        "1.  **Программист-разработчик (Software Developer)** — ты любишь информатику и создавать новое. Эта профессия идеально сочетает оба качества.\n\n"
-        "2.  **Аналитик данных (Data Analyst)** — если тебе нравится находить закономерности и работать с информацией, это отличный выбор.\n\n"
-        "3.  **Биоинженер (Bioengineer)** — учитывая твой интерес к биологии, это направление позволит применять технические навыки для решения биологических и медицинских задач."
-    )
-    
-    return mock_result
\ No newline at end of file
+    def collect_metrics(self):
+        yield 'bot_ai_queue_size', 'gauge', {}, self._queue.qsize() if self._queue else 0
+        yield 'bot_ai_cache_entries', 'gauge', {}, len(self.cache)
+        yield 'bot_ai_streams_active', 'gauge', {}, len(self._streams)
+        for result, value in self.stats.items():
+            yield 'bot_ai_requests_total', 'counter', {'result': result}, value
@@ -0,0 +1,122 @@
+"""
+Global concurrency limits for blocking backends (Google Sheets, Exode).
+
+gspread and the Exode client are synchronous, so every call runs on a worker
+thread. run_blocking() sends it to the thread pool of its backend, whose size
+is the backend's concurrency cap. Callers beyond the cap wait in line; when the
+line is too long or the wait too slow, BackendBusyError is raised and the error
+handler tells the user to retry, instead of the whole bot slowing down.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import (
+    SHEETS_CONCURRENCY, EXODE_CONCURRENCY, BACKEND_MAX_WAITING, BACKEND_WAIT_TIMEOUT
+)
+from app.utils.metrics import BACKEND_CALL_DURATION, BACKEND_WAIT_DURATION, BACKEND_ERRORS
+
+logger = logging.getLogger(__name__)
+
+SHEETS = 'sheets'
+EXODE = 'exode'
+
+
+class BackendBusyError(Exception):
+    """Raised when a backend has no free slot within the allowed wait."""
+
+    def __init__(self, backend: str):
+        super().__init__(f"Backend '{backend}' is busy")
+        self.backend = backend
+
+
+class Backend:
+    """Thread pool + admission control for one blocking backend."""
+
+    def __init__(self, name: str, limit: int, max_waiting: int, wait_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"backend-{name}")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = {'calls': 0, 'rejected': 0, 'timed_out': 0, 'errors': 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Создаётся лениво и заново для нового event loop (например, в бенчмарках)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        semaphore = self._get_semaphore()
+        if semaphore.locked() and self.waiting >= self.max_waiting:
+            self.stats['rejected'] += 1
+            BACKEND_ERRORS.inc(self.name, 'rejected')
+            raise BackendBusyError(self.name)
+
+        self.waiting += 1
+        wait_started = time.monotonic()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.stats['timed_out'] += 1
+            BACKEND_ERRORS.inc(self.name, 'timed_out')
+            raise BackendBusyError(self.name)
+        finally:
+            self.waiting -= 1
+            BACKEND_WAIT_DURATION.observe(self.name, value=time.monotonic() - wait_started)
+
+        self.in_flight += 1
+        self.stats['calls'] += 1
+        started = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        except Exception as e:
+            self.stats['errors'] += 1
+            BACKEND_ERRORS.inc(self.name, type(e).__name__)
+            raise
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+            elapsed = time.monotonic() - started
+            call_name = getattr(func, '__qualname__', type(func).__name__)
+            BACKEND_CALL_DURATION.observe(self.name, call_name, value=elapsed)
+            if elapsed > 5:
+                logger.warning(f"Slow {self.name} call {call_name}: {elapsed:.1f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit, 'in_flight': self.in_flight, 'waiting': self.waiting, **self.stats
+        }
+
+
+_backends: Dict[str, Backend] = {
+    SHEETS: Backend(SHEETS, SHEETS_CONCURRENCY, BACKEND_MAX_WAITING, BACKEND_WAIT_TIMEOUT),
+    EXODE: Backend(EXODE, EXODE_CONCURRENCY, BACKEND_MAX_WAITING, BACKEND_WAIT_TIMEOUT),
+}
+
+
+async def run_blocking(backend: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking call on the thread pool of `backend` ('sheets' or 'exode').
+
+    Raises:
+        BackendBusyError: no free slot within BACKEND_WAIT_TIMEOUT, or too many callers waiting
+    """
+    return await _backends[backend].run(func, *args, **kwargs)
+
+
+def get_backend_stats() -> Dict[str, Dict[str, Any]]:
+    """Current load and counters of every backend."""
+    return {name: backend.snapshot() for name, backend in _backends.items()}
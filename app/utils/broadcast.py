@@ -0,0 +1,374 @@
+"""
+Rate-aware broadcasts to registered parents and students.
+
+Recipients are streamed from the registration worksheets ('Родитель',
+'Ученик') in row chunks, so a broadcast never holds the whole audience in
+memory. Every send goes through a SendRateLimiter: a global token bucket
+(Telegram allows roughly 30 messages per second per bot) plus a minimum
+spacing between messages to the same chat. RetryAfter pauses the whole
+bucket for the requested time and retries; users who blocked the bot are
+counted and skipped. Progress is checkpointed to a small JSON file after every
+send batch, so a broadcast interrupted by a restart resumes from the last
+finished batch on the next startup (only that unfinished batch can be sent
+twice). The chat IDs already sent to are appended to a side file
+(<checkpoint>.seen); the checkpoint records its length, so after a restart
+duplicates further down the sheet are still skipped and IDs appended by an
+unfinished batch are dropped. Batch writes run in the default executor, off
+the event loop.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
+
+from app.core.config import (
+    BROADCAST_RATE, BROADCAST_CHAT_INTERVAL, BROADCAST_CHUNK_ROWS,
+    BROADCAST_BATCH_SIZE, BROADCAST_CHECKPOINT_PATH
+)
+from app.utils.backends import run_blocking, SHEETS
+from app.utils.google_sheets import RegistrationGSheet
+
+logger = logging.getLogger(__name__)
+
+MAX_SEND_ATTEMPTS = 3
+
+# Аудитория -> атрибуты RegistrationGSheet с названиями листов
+AUDIENCES = {
+    'parents': ('parent_worksheet',),
+    'students': ('student_worksheet',),
+    'all': ('parent_worksheet', 'student_worksheet'),
+}
+
+
+class SendRateLimiter:
+    """Global token bucket plus per-chat spacing for outgoing messages."""
+
+    def __init__(self, rate: float = BROADCAST_RATE, chat_interval: float = BROADCAST_CHAT_INTERVAL):
+        """
+        Args:
+            rate: Messages per second across all chats (also the bucket size)
+            chat_interval: Minimum seconds between two messages to one chat
+        """
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.chat_interval = chat_interval
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._last_sent: Dict[int, float] = {}
+
+    def pause(self, seconds: float):
+        """Stop all sends for `seconds` (after a flood-wait from Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self, chat_id: int):
+        """Wait until a message to `chat_id` may be sent."""
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+        self._last_sent[chat_id] = time.monotonic()
+        if len(self._last_sent) > 10000:
+            # Старые отметки больше не ограничивают отправку
+            horizon = time.monotonic() - self.chat_interval
+            self._last_sent = {c: t for c, t in self._last_sent.items() if t > horizon}
+
+
+class Broadcaster:
+    """Runs one broadcast at a time: copies an admin's message to an audience."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        registration_manager: RegistrationGSheet,
+        limiter: Optional[SendRateLimiter] = None,
+        chunk_rows: int = BROADCAST_CHUNK_ROWS,
+        batch_size: int = BROADCAST_BATCH_SIZE,
+        checkpoint_path: str = BROADCAST_CHECKPOINT_PATH
+    ):
+        """
+        Args:
+            bot: Bot instance
+            registration_manager: Registration sheet manager (recipient source)
+            limiter: Shared send rate limiter
+            chunk_rows: Rows of Telegram IDs read from the sheet per request
+            batch_size: Sends between two checkpoints
+            checkpoint_path: JSON file with the progress of the current broadcast
+                (sent chat IDs go to checkpoint_path + '.seen')
+        """
+        self.bot = bot
+        self.registration_manager = registration_manager
+        self.limiter = limiter or SendRateLimiter()
+        self.chunk_rows = chunk_rows
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.seen_path = f"{checkpoint_path}.seen"
+        self.job: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._started = 0.0
+        self._seen: set = set()
+        # Запись пачки в executor; при отмене дожидаемся её, чтобы не писать чекпоинт параллельно
+        self._writing: Optional[asyncio.Future] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # --- Управление ---
+
+    def start(self, audience: str, from_chat_id: int, message_id: int, admin_id: int) -> Dict[str, Any]:
+        """
+        Start broadcasting a copy of message `message_id` from `from_chat_id`.
+
+        Raises:
+            ValueError: unknown audience
+            RuntimeError: another broadcast is running
+        """
+        if audience not in AUDIENCES:
+            raise ValueError(f"Unknown audience '{audience}'")
+        if self.is_running:
+            raise RuntimeError("Broadcast already running")
+        self.job = {
+            'audience': audience,
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+            'admin_id': admin_id,
+            'sheet_index': 0,
+            'next_row': 2,
+            'stats': {'sent': 0, 'blocked': 0, 'failed': 0, 'duplicates': 0, 'retries': 0},
+            'elapsed': 0.0,
+            # Длина файла .seen в байтах: чаты из законченных пачек, дальше — хвост недоотправленной
+            'seen_offset': 0,
+        }
+        self._seen = set()
+        self._remove(self.seen_path)
+        self._save_checkpoint()
+        self._task = asyncio.create_task(self._run())
+        return self.job
+
+    async def resume(self):
+        """Resume an unfinished broadcast from the checkpoint; registered on startup."""
+        if self.is_running or not os.path.exists(self.checkpoint_path):
+            return
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                self.job = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Broadcast checkpoint unreadable, dropping it: {e}")
+            self._clear_checkpoint()
+            return
+        try:
+            self._seen = self._load_seen()
+        except (OSError, ValueError) as e:
+            logger.error(f"Broadcast seen list unreadable, duplicates may be sent again: {e}")
+            self._seen = set()
+        logger.info(f"Resuming broadcast to '{self.job['audience']}' from row {self.job['next_row']}")
+        self._task = asyncio.create_task(self._run())
+
+    async def cancel(self) -> bool:
+        """Stop the running broadcast and drop its checkpoint."""
+        if not self.is_running:
+            return False
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._clear_checkpoint()
+        return True
+
+    async def stop(self):
+        """Stop on shutdown; the checkpoint is kept so the broadcast resumes."""
+        if self.is_running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def status(self) -> Optional[Dict[str, Any]]:
+        """Counters, elapsed time and throughput of the current or last broadcast."""
+        if not self.job:
+            return None
+        stats = self.job['stats']
+        elapsed = self.job['elapsed'] + (time.monotonic() - self._started if self.is_running else 0)
+        done = stats['sent'] + stats['blocked'] + stats['failed']
+        return {
+            **stats,
+            'audience': self.job['audience'],
+            'running': self.is_running,
+            'elapsed': round(elapsed, 1),
+            'rate': round(done / elapsed, 2) if elapsed else 0.0,
+        }
+
+    # --- Рассылка ---
+
+    async def _run(self):
+        job = self.job
+        self._started = time.monotonic()
+        seen = self._seen
+        sheet_names = [getattr(self.registration_manager, attr) for attr in AUDIENCES[job['audience']]]
+        try:
+            while job['sheet_index'] < len(sheet_names):
+                worksheet = await run_blocking(
+                    SHEETS, self.registration_manager.sheet.worksheet, sheet_names[job['sheet_index']]
+                )
+                while True:
+                    start_row = job['next_row']
+                    end_row = start_row + self.chunk_rows - 1
+                    rows = await run_blocking(SHEETS, worksheet.get, f"A{start_row}:A{end_row}")
+                    if not rows:
+                        break
+                    await self._send_chunk(rows, start_row, seen)
+                    if len(rows) < self.chunk_rows:
+                        break
+                job['sheet_index'] += 1
+                job['next_row'] = 2
+                self._save_checkpoint()
+        except asyncio.CancelledError:
+            if self._writing is not None and not self._writing.done():
+                await asyncio.wait([self._writing])
+            self._checkpoint_elapsed()
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast failed at row {job['next_row']}: {e}", exc_info=True)
+            self._checkpoint_elapsed()
+            return
+
+        self._checkpoint_elapsed()
+        self._clear_checkpoint()
+        report = self.status()
+        logger.info(f"Broadcast finished: {report}")
+        try:
+            await self.bot.send_message(job['admin_id'], "✅ Рассылка завершена.\n\n" + format_status(report))
+        except TelegramAPIError as e:
+            logger.error(f"Failed to send broadcast report: {e}")
+
+    async def _send_chunk(self, rows: List[List[str]], first_row: int, seen: set):
+        job = self.job
+        for offset in range(0, len(rows), self.batch_size):
+            batch = rows[offset:offset + self.batch_size]
+            recipients = []
+            for row in batch:
+                raw = str(row[0]).strip() if row else ''
+                if not raw.lstrip('-').isdigit():
+                    continue
+                chat_id = int(raw)
+                if chat_id in seen:
+                    job['stats']['duplicates'] += 1
+                    continue
+                seen.add(chat_id)
+                recipients.append(chat_id)
+
+            # Токены выдаются по очереди, поэтому параллельные отправки не превышают лимит
+            await asyncio.gather(*(self._send(chat_id) for chat_id in recipients))
+            # Смещение .seen сдвигается вместе с next_row, чтобы недоотправленная пачка не считалась дублями
+            data = ''.join(f"{chat_id}\n" for chat_id in recipients)
+            job['seen_offset'] += len(data)
+            job['next_row'] = first_row + offset + len(batch)
+            snapshot = {**job, 'stats': dict(job['stats'])}
+            self._writing = asyncio.get_running_loop().run_in_executor(None, self._write_batch, data, snapshot)
+            # shield: отмена задачи не снимает запись, поток дописывает файл до конца
+            await asyncio.shield(self._writing)
+
+    async def _send(self, chat_id: int):
+        stats = self.job['stats']
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            await self.limiter.acquire(chat_id)
+            try:
+                await self.bot.copy_message(chat_id, self.job['from_chat_id'], self.job['message_id'])
+                stats['sent'] += 1
+                return
+            except TelegramRetryAfter as e:
+                stats['retries'] += 1
+                logger.warning(f"Flood limit hit, pausing broadcast for {e.retry_after}s")
+                self.limiter.pause(e.retry_after)
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота
+                stats['blocked'] += 1
+                return
+            except TelegramAPIError as e:
+                logger.debug(f"Broadcast to {chat_id} failed: {e}")
+                stats['failed'] += 1
+                return
+        stats['failed'] += 1
+
+    # --- Чекпоинт ---
+
+    def _checkpoint_elapsed(self):
+        self.job['elapsed'] += time.monotonic() - self._started
+        self._started = time.monotonic()
+        self._save_checkpoint()
+
+    def _write_batch(self, data: str, job: Dict[str, Any]):
+        # Сначала ID, потом чекпоинт: после сбоя между ними лишний хвост .seen отбрасывается
+        if data:
+            with open(self.seen_path, 'a', encoding='utf-8') as f:
+                f.write(data)
+        self._save_checkpoint(job)
+
+    def _load_seen(self) -> set:
+        legacy = self.job.pop('seen', None)
+        if legacy is not None:
+            # Чекпоинт старого формата хранил ID внутри себя
+            with open(self.seen_path, 'w', encoding='utf-8') as f:
+                f.write(''.join(f"{chat_id}\n" for chat_id in legacy))
+                self.job['seen_offset'] = f.tell()
+            return set(legacy)
+        offset = self.job.setdefault('seen_offset', 0)
+        if not offset:
+            self._remove(self.seen_path)
+            return set()
+        with open(self.seen_path, 'r+', encoding='utf-8') as f:
+            data = f.read(offset)
+            f.truncate(offset)
+        return {int(line) for line in data.split()}
+
+    def _save_checkpoint(self, job: Optional[Dict[str, Any]] = None):
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job or self.job, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        self._remove(self.checkpoint_path)
+        self._remove(self.seen_path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def format_status(status: Dict[str, Any]) -> str:
+    """Human-readable broadcast report for the admin."""
+    return (
+        f"Аудитория: {status['audience']}\n"
+        f"Отправлено: {status['sent']}\n"
+        f"Заблокировали бота: {status['blocked']}\n"
+        f"Ошибки: {status['failed']}\n"
+        f"Повторы после RetryAfter: {status['retries']}\n"
+        f"Время: {status['elapsed']} с, скорость: {status['rate']} сообщ./с"
+    )
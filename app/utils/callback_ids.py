@@ -0,0 +1,80 @@
+"""
+Short IDs for catalog values carried in inline-button callback data.
+
+Telegram limits callback_data to 64 bytes; a Cyrillic city, category or child
+name takes two bytes per letter and used to be embedded as is (and decoded by
+string splitting). Buttons now carry a fixed-length ID instead: 12 URL-safe
+base64 characters derived from a hash of (kind, value), so the same value
+always gets the same ID across users and restarts, whatever the catalog size.
+The registry maps IDs back to values with one dict lookup.
+
+Values are registered when their keyboard is built. Static lists (cities) are
+registered at import, so their buttons keep working after a restart; for
+values loaded from Google Sheets decode() returns None after a restart or an
+eviction and the handler asks the user to reopen the section.
+"""
+
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from app.core.config import CALLBACK_IDS_MAX
+
+logger = logging.getLogger(__name__)
+
+ID_BYTES = 9  # 12 символов base64; вероятность коллизии пренебрежимо мала
+
+
+class ShortIdRegistry:
+    """LRU-bounded two-way map between (kind, value) and short IDs."""
+
+    def __init__(self, max_entries: int = CALLBACK_IDS_MAX):
+        self.max_entries = max_entries
+        self._values: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._pinned: set = set()
+        self._lock = threading.Lock()
+        self.stats = {'encoded': 0, 'hits': 0, 'misses': 0, 'evicted': 0}
+
+    @staticmethod
+    def make_id(kind: str, value: str) -> str:
+        """Deterministic ID of a value within its kind."""
+        digest = hashlib.blake2b(f"{kind}\x00{value}".encode('utf-8'), digest_size=ID_BYTES).digest()
+        return base64.urlsafe_b64encode(digest).decode('ascii')
+
+    def encode(self, kind: str, value: str) -> str:
+        """Register a value and return its ID."""
+        value = str(value)
+        short_id = self.make_id(kind, value)
+        key = (kind, short_id)
+        with self._lock:
+            self.stats['encoded'] += 1
+            known = self._values.get(key)
+            if known is not None and known != value:
+                logger.error(f"Callback ID collision for kind '{kind}': '{known}' vs '{value}'")
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries + len(self._pinned):
+                old_key = next(k for k in self._values if k not in self._pinned)
+                del self._values[old_key]
+                self.stats['evicted'] += 1
+        return short_id
+
+    def pin(self, kind: str, values: Iterable[str]):
+        """Register values that must never be evicted (static lists)."""
+        for value in values:
+            short_id = self.encode(kind, value)
+            with self._lock:
+                self._pinned.add((kind, short_id))
+
+    def decode(self, kind: str, short_id: str) -> Optional[str]:
+        """Value behind an ID, or None if it is unknown."""
+        with self._lock:
+            value = self._values.get((kind, short_id))
+            self.stats['hits' if value is not None else 'misses'] += 1
+            return value
+
+
+SHORT_IDS = ShortIdRegistry()
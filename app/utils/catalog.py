@@ -0,0 +1,127 @@
+"""
+Shared registry of catalog snapshots (professions, courses, universities, programs).
+
+Handlers used to copy whole record lists into FSM data. Instead, a list loaded
+from Google Sheets is registered here once and FSM keeps only its snapshot ID
+plus the indices the user picked. IDs are derived from the content, so every
+user browsing the same data shares one snapshot, and a changed sheet yields a
+new ID while users still looking at the old version keep a consistent view.
+
+Snapshots live in memory only (LRU-bounded). After a restart or an eviction
+get() returns None and the handler asks the user to reopen the section.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app.core.config import CATALOG_MAX_SNAPSHOTS
+
+logger = logging.getLogger(__name__)
+
+STALE_SNAPSHOT_TEXT = "Данные устарели, откройте раздел заново."
+
+
+class CatalogRegistry:
+    """Content-addressed, LRU-bounded store of immutable record lists."""
+
+    def __init__(self, max_snapshots: int = CATALOG_MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self._snapshots: "OrderedDict[str, Tuple[Dict[str, Any], ...]]" = OrderedDict()
+        # snapshot_id -> {key: derived value}
+        self._derived: Dict[str, Dict[Hashable, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats = {'puts': 0, 'reused': 0, 'hits': 0, 'misses': 0, 'evicted': 0}
+
+    @staticmethod
+    def snapshot_id(records: Sequence[Dict[str, Any]]) -> str:
+        """Version ID of a record list (hash of its canonical JSON)."""
+        payload = json.dumps(list(records), ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+    def put(self, records: Sequence[Dict[str, Any]]) -> str:
+        """Register a record list and return its snapshot ID."""
+        snapshot_id = self.snapshot_id(records)
+        with self._lock:
+            self.stats['puts'] += 1
+            if snapshot_id in self._snapshots:
+                self.stats['reused'] += 1
+                self._snapshots.move_to_end(snapshot_id)
+                return snapshot_id
+            self._snapshots[snapshot_id] = tuple(records)
+            while len(self._snapshots) > self.max_snapshots:
+                old_id, _ = self._snapshots.popitem(last=False)
+                self._derived.pop(old_id, None)
+                self.stats['evicted'] += 1
+        return snapshot_id
+
+    def get(self, snapshot_id: Optional[str]) -> Optional[Tuple[Dict[str, Any], ...]]:
+        """Records of a snapshot, or None if it is unknown (evicted / before restart)."""
+        with self._lock:
+            records = self._snapshots.get(snapshot_id) if snapshot_id else None
+            if records is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self._snapshots.move_to_end(snapshot_id)
+            return records
+
+    def get_item(self, snapshot_id: Optional[str], index: int) -> Optional[Dict[str, Any]]:
+        """One record of a snapshot, or None if the snapshot or index is unknown."""
+        records = self.get(snapshot_id)
+        if records is None or not 0 <= index < len(records):
+            return None
+        return records[index]
+
+    def derive(self, snapshot_id: Optional[str], key: Hashable, build: Callable[[Sequence[Dict[str, Any]]], Any]) -> Any:
+        """
+        Value computed from a snapshot (e.g. a sorted list of directions),
+        built once per snapshot and shared by all users. None if the snapshot is unknown.
+        """
+        records = self.get(snapshot_id)
+        if records is None:
+            return None
+        with self._lock:
+            derived = self._derived.setdefault(snapshot_id, {})
+            if key in derived:
+                return derived[key]
+        value = build(records)
+        with self._lock:
+            if snapshot_id in self._snapshots:
+                self._derived.setdefault(snapshot_id, {})[key] = value
+        return value
+
+
+class PagedList:
+    """Immutable list of labels split into precomputed pages of (index, label) pairs."""
+
+    def __init__(self, labels: Sequence[Any], page_size: int):
+        self.labels: Tuple[Any, ...] = tuple(labels)
+        self.page_size = page_size
+        self.pages: Tuple[Tuple[Tuple[int, Any], ...], ...] = tuple(
+            tuple((i, self.labels[i]) for i in range(start, min(start + page_size, len(self.labels))))
+            for start in range(0, len(self.labels), page_size)
+        ) or ((),)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def page(self, number: int) -> Tuple[Tuple[int, Any], ...]:
+        """Items of a page; out-of-range numbers are clamped to the first/last page."""
+        return self.pages[min(max(number, 0), len(self.pages) - 1)]
+
+    def has_next(self, number: int) -> bool:
+        return number + 1 < len(self.pages)
+
+
+def unique_sorted(records: Sequence[Dict[str, Any]], field: str) -> List[str]:
+    """Sorted distinct non-empty values of a column."""
+    return sorted(set(r.get(field) for r in records if r.get(field)))
+
+
+def indices_where(records: Sequence[Dict[str, Any]], field: str, value: Any) -> List[int]:
+    """Positions of records whose column equals value."""
+    return [i for i, r in enumerate(records) if r.get(field) == value]
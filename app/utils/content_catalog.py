@@ -0,0 +1,179 @@
+"""
+In-memory copy of the professions and courses spreadsheets.
+
+The professions spreadsheet has one worksheet per test scale (human, tech,
+...); together with the built-in descriptions in professions_data.PROFESSIONS
+it is everything the bot knows about professions. The courses spreadsheet has
+one 'Courses' worksheet. Both are read with one batch request each and
+refreshed in the background; a spreadsheet whose Drive modification time has
+not changed is not read again.
+
+Consumers that derive something from the data (search indexes, ...) register
+with on_change() and are called after every change, so they rebuild only
+when the catalogs actually change.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import CONTENT_CATALOG_REFRESH
+from app.utils.backends import run_blocking, SHEETS
+from app.utils.catalog import CatalogRegistry
+from app.utils.google_sheets import CoursesGSheet, ProfessionsGSheet
+from app.utils.metrics import REGISTRY
+from app.utils.professions_data import PROFESSIONS
+
+logger = logging.getLogger(__name__)
+
+PROFESSION_TITLE = "Название профессии"
+DIRECTION = "Направление"
+# Поля встроенных описаний -> колонки листов профессий
+BUILTIN_FIELDS = {
+    'title': PROFESSION_TITLE,
+    'about': "О чём профессия?",
+    'tasks': "Чем занимаются?",
+    'qualities': "Какими качествами нужно обладать",
+    'study_at': "Где учиться",
+    'salary': "Сколько зарабатывают",
+}
+
+
+def builtin_professions() -> Dict[str, Tuple[Dict[str, Any], ...]]:
+    """PROFESSIONS as sheet-like records per scale; the subcategory title is the direction."""
+    professions = {}
+    for scale, category in PROFESSIONS.items():
+        records = []
+        for subcategory in category.get('subcategories', {}).values():
+            for profession in subcategory.get('professions', ()):
+                record = {BUILTIN_FIELDS.get(key, key): value for key, value in profession.items()}
+                record[DIRECTION] = subcategory.get('title', '')
+                records.append(record)
+        professions[scale] = tuple(records)
+    return professions
+
+
+class ContentCatalog:
+    """Professions (sheet and built-in) and courses in memory."""
+
+    def __init__(
+        self,
+        professions_manager: ProfessionsGSheet,
+        courses_manager: CoursesGSheet,
+        interval: float = CONTENT_CATALOG_REFRESH
+    ):
+        """
+        Args:
+            professions_manager: Manager of the professions spreadsheet (one worksheet per scale)
+            courses_manager: Manager of the courses spreadsheet
+            interval: Seconds between refreshes (0 loads once)
+        """
+        self.professions_manager = professions_manager
+        self.courses_manager = courses_manager
+        self.interval = interval
+        # шкала -> записи листа этой шкалы, в порядке листов таблицы
+        self.professions: Dict[str, Tuple[Dict[str, Any], ...]] = {}
+        self.builtin = builtin_professions()
+        self.courses: Tuple[Dict[str, Any], ...] = ()
+        # Растёт при каждом изменении данных
+        self.version = 0
+        self.loaded = False
+        self._versions: Dict[str, Optional[str]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._listeners: List[Callable[['ContentCatalog'], None]] = []
+        self.stats = {'refreshes': 0, 'changes': 0, 'errors': 0, 'last_refresh_seconds': 0.0}
+        self._task: Optional[asyncio.Task] = None
+        REGISTRY.add_collector('content_catalog', self.collect_metrics)
+
+    def on_change(self, listener: Callable[['ContentCatalog'], None]):
+        """Call `listener(catalog)` after every change (and now, if already loaded)."""
+        self._listeners.append(listener)
+        if self.loaded:
+            listener(self)
+
+    def all_professions(self) -> List[Dict[str, Any]]:
+        """Same list get_all_professions() returns."""
+        return [record for records in self.professions.values() for record in records]
+
+    # --- Периодическое обновление ---
+
+    async def start(self):
+        """Load the catalog and keep it fresh; registered on dispatcher startup."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Content catalog refresh failed: {e}", exc_info=True)
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Fetch both spreadsheets concurrently; notify listeners if anything changed."""
+        started = time.perf_counter()
+        sources = {
+            'professions': (self.professions_manager, ProfessionsGSheet.SCALE_SHEETS),
+            'courses': (self.courses_manager, [self.courses_manager.worksheet_name]),
+        }
+        names = [name for name, (manager, _) in sources.items() if manager.sheet is not None]
+        results = await asyncio.gather(*(
+            run_blocking(SHEETS, sources[name][0].fetch_spreadsheet, None, self._versions.get(name), sources[name][1])
+            for name in names
+        ), return_exceptions=True)
+
+        changed = False
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                # Старые данные остаются до следующей попытки
+                self.stats['errors'] += 1
+                logger.error(f"Failed to load {name} spreadsheet: {result}")
+            elif result is not None:
+                version, worksheets = result
+                changed |= self._apply(name, worksheets)
+                self._versions[name] = version
+
+        first_load = not self.loaded
+        self.loaded = True
+        if changed or first_load:
+            self.version += 1
+            self.stats['changes'] += 1
+            for listener in self._listeners:
+                listener(self)
+        self.stats['refreshes'] += 1
+        self.stats['last_refresh_seconds'] = time.perf_counter() - started
+        logger.info(f"Content catalog refreshed in {self.stats['last_refresh_seconds']:.2f}s: "
+                    f"{sum(map(len, self.professions.values()))} professions, {len(self.courses)} courses")
+        return self.stats
+
+    def _apply(self, name: str, worksheets: Dict[str, List[Dict[str, Any]]]) -> bool:
+        digest = CatalogRegistry.snapshot_id([{'title': title, 'records': records} for title, records in worksheets.items()])
+        if self._hashes.get(name) == digest:
+            return False
+        self._hashes[name] = digest
+        if name == 'professions':
+            self.professions = {title: tuple(records) for title, records in worksheets.items()}
+        else:
+            self.courses = tuple(worksheets.get(self.courses_manager.worksheet_name, ()))
+        return True
+
+    def collect_metrics(self):
+        yield 'bot_content_catalog_professions', 'gauge', {}, sum(map(len, self.professions.values()))
+        yield 'bot_content_catalog_courses', 'gauge', {}, len(self.courses)
+        yield 'bot_content_catalog_refresh_seconds', 'gauge', {}, self.stats['last_refresh_seconds']
+        yield 'bot_content_catalog_errors_total', 'counter', {}, self.stats['errors']
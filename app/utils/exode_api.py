@@ -11,12 +11,42 @@ from app.core.config import (
     EXODE_API_BASE_URL,
     EXODE_TOKEN,
     SELLER_ID,
-    SCHOOL_ID
+    SCHOOL_ID,
+    EXODE_CALL_DEADLINE,
+    EXODE_ATTEMPT_TIMEOUT,
+    EXODE_RETRY_ATTEMPTS,
+    EXODE_CIRCUIT_FAILURES,
+    EXODE_CIRCUIT_RESET
+)
+from app.utils.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    EndpointStats,
+    ResilientCaller,
+    RetryPolicy
 )
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# One shared resilience layer for every Exode call
+_session = requests.Session()
+_breaker = CircuitBreaker(
+    'exode',
+    failure_threshold=EXODE_CIRCUIT_FAILURES,
+    reset_timeout=EXODE_CIRCUIT_RESET
+)
+_endpoint_stats = EndpointStats()
+_caller = ResilientCaller(
+    breaker=_breaker,
+    retry_policy=RetryPolicy(max_attempts=EXODE_RETRY_ATTEMPTS),
+    stats=_endpoint_stats,
+    transient_exceptions=(requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+    default_deadline=EXODE_CALL_DEADLINE,
+    attempt_timeout=EXODE_ATTEMPT_TIMEOUT
+)
+
 
 def _get_headers() -> Dict[str, str]:
     """
@@ -33,6 +63,73 @@ def _get_headers() -> Dict[str, str]:
     }
 
 
+def _classify_response(response: requests.Response) -> str:
+    """
+    Map an HTTP response to a resilience outcome.
+
+    429 and 5xx are transient (retried, counted against the circuit);
+    other 4xx are permanent failures of this call only.
+    """
+    if response.status_code == 429 or response.status_code >= 500:
+        return 'retry'
+    return 'ok' if response.status_code < 400 else 'fail'
+
+
+def _request(
+    method: str,
+    endpoint: str,
+    path: str,
+    idempotent: bool,
+    deadline: Optional[float] = None,
+    **kwargs
+) -> requests.Response:
+    """
+    Perform an Exode API request through the shared resilience layer.
+
+    Args:
+        method: HTTP method
+        endpoint: Endpoint label for statistics (path template, e.g. '/user/{id}/update')
+        path: Actual path relative to EXODE_API_BASE_URL
+        idempotent: Whether the call may be retried safely
+        deadline: Total time budget in seconds (defaults to EXODE_CALL_DEADLINE)
+        **kwargs: Passed to requests (params, json)
+
+    Returns:
+        Last HTTP response
+
+    Raises:
+        CircuitOpenError, DeadlineExceeded, requests.exceptions.RequestException
+    """
+    url = f'{EXODE_API_BASE_URL}{path}'
+    headers = _get_headers()
+    return _caller.call(
+        f'{method} {endpoint}',
+        lambda timeout: _session.request(method, url, headers=headers, timeout=timeout, **kwargs),
+        _classify_response,
+        idempotent=idempotent,
+        deadline=deadline
+    )
+
+
+def get_exode_stats() -> Dict[str, Any]:
+    """
+    Get circuit state and per-endpoint latency statistics.
+
+    Returns:
+        Dict with 'circuit' and 'endpoints' sections
+    """
+    return {
+        'circuit': {
+            'state': _breaker.state,
+            'consecutive_failures': _breaker.consecutive_failures,
+            'transitions': [
+                {'at': at, 'from': old, 'to': new} for at, old, new in _breaker.transitions
+            ]
+        },
+        'endpoints': _endpoint_stats.snapshot()
+    }
+
+
 def _format_phone(phone: str) -> str:
     """
     Format phone number to international format.
@@ -81,13 +178,11 @@ def find_user_by_phone(phone: str) -> Optional[Dict[str, Any]]:
             logger.error("Empty phone number provided")
             return None
         
-        url = f'{EXODE_API_BASE_URL}/user/find'
-        headers = _get_headers()
         params = {'login': phone}
         
         logger.info(f"Searching for user with phone: {phone}")
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = _request('GET', '/user/find', '/user/find', idempotent=True, params=params)
         
         if response.status_code == 200:
             result = response.json()
@@ -112,6 +207,12 @@ def find_user_by_phone(phone: str) -> Optional[Dict[str, Any]]:
             logger.error(f"Unexpected status code: {response.status_code}")
             return None
             
+    except CircuitOpenError as e:
+        logger.error(f"Exode API unavailable: {e}")
+        return None
+    except DeadlineExceeded as e:
+        logger.error(f"Exode API too slow: {e}")
+        return None
     except requests.exceptions.ConnectionError:
         logger.error("Connection error - check internet connection")
         return None
@@ -134,13 +235,11 @@ def find_user_by_telegram_id(tg_id: int) -> Optional[Dict[str, Any]]:
         User data dict or None if not found/error
     """
     try:
-        url = f'{EXODE_API_BASE_URL}/user/find'
-        headers = _get_headers()
         params = {'tgId': tg_id}
         
         logger.info(f"Searching for user with Telegram ID: {tg_id}")
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = _request('GET', '/user/find', '/user/find', idempotent=True, params=params)
         
         if response.status_code == 200:
             result = response.json()
@@ -159,6 +258,9 @@ def find_user_by_telegram_id(tg_id: int) -> Optional[Dict[str, Any]]:
             logger.error(f"Unexpected status code: {response.status_code}")
             return None
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Exode API unavailable in find_user_by_telegram_id: {e}")
+        return None
     except Exception as e:
         logger.error(f"Unexpected error in find_user_by_telegram_id: {e}")
         return None
@@ -175,9 +277,6 @@ def create_user(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         Created user data or None if failed
     """
     try:
-        url = f'{EXODE_API_BASE_URL}/user/create'
-        headers = _get_headers()
-        
         # Validate that we have at least one login method
         has_login = any([
             payload.get('email'),
@@ -201,7 +300,8 @@ def create_user(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         
         logger.info(f"Creating user with data: {json.dumps(payload, ensure_ascii=False)}")
         
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        # Not idempotent: a retried create may produce a duplicate user
+        response = _request('POST', '/user/create', '/user/create', idempotent=False, json=payload)
         
         if response.status_code in [200, 201]:
             result = response.json()
@@ -222,6 +322,9 @@ def create_user(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
             logger.error(f"Failed to create user. Status: {response.status_code}, Response: {response.text}")
             return None
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Exode API unavailable in create_user: {e}")
+        return None
     except Exception as e:
         logger.error(f"Unexpected error in create_user: {e}")
         return None
@@ -239,16 +342,13 @@ def update_user(user_id: int, payload: Dict[str, Any]) -> Optional[Dict[str, Any
         Updated user data or None if failed
     """
     try:
-        url = f'{EXODE_API_BASE_URL}/user/{user_id}/update'
-        headers = _get_headers()
-        
         # Format phone if present
         if payload.get('phone'):
             payload['phone'] = _format_phone(payload['phone'])
         
         logger.info(f"Updating user {user_id} with data: {json.dumps(payload, ensure_ascii=False)}")
         
-        response = requests.put(url, json=payload, headers=headers, timeout=10)
+        response = _request('PUT', '/user/{id}/update', f'/user/{user_id}/update', idempotent=True, json=payload)
         
         if response.status_code == 200:
             result = response.json()
@@ -265,6 +365,9 @@ def update_user(user_id: int, payload: Dict[str, Any]) -> Optional[Dict[str, Any
             logger.error(f"Failed to update user. Status: {response.status_code}, Response: {response.text}")
             return None
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Exode API unavailable in update_user: {e}")
+        return None
     except Exception as e:
         logger.error(f"Unexpected error in update_user: {e}")
         return None
@@ -283,9 +386,6 @@ def upsert_user(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         User data with 'isCreated' flag or None if failed
     """
     try:
-        url = f'{EXODE_API_BASE_URL}/user/upsert'
-        headers = _get_headers()
-        
         # Validate that we have at least one identifier
         has_identifier = any([
             payload.get('email'),
@@ -309,7 +409,8 @@ def upsert_user(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         
         logger.info(f"Upserting user with data: {json.dumps(payload, ensure_ascii=False)}")
         
-        response = requests.put(url, json=payload, headers=headers, timeout=10)
+        # Upsert is keyed by email/phone/tgId, so repeating it is safe
+        response = _request('PUT', '/user/upsert', '/user/upsert', idempotent=True, json=payload)
         
         if response.status_code in [200, 201]:
             result = response.json()
@@ -329,6 +430,9 @@ def upsert_user(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
             logger.error(f"Failed to upsert user. Status: {response.status_code}, Response: {response.text}")
             return None
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Exode API unavailable in upsert_user: {e}")
+        return None
     except Exception as e:
         logger.error(f"Unexpected error in upsert_user: {e}")
         return None
@@ -346,8 +450,6 @@ def create_session_token(user_id: int, force_create: bool = False) -> Optional[D
         Session data with token or None if failed
     """
     try:
-        url = f'{EXODE_API_BASE_URL}/user/session/auth-token'
-        headers = _get_headers()
         data = {
             'userId': user_id,
             'forceCreate': force_create
@@ -355,7 +457,10 @@ def create_session_token(user_id: int, force_create: bool = False) -> Optional[D
         
         logger.info(f"Creating session token for user {user_id}")
         
-        response = requests.post(url, json=data, headers=headers, timeout=10)
+        response = _request(
+            'POST', '/user/session/auth-token', '/user/session/auth-token',
+            idempotent=not force_create, json=data
+        )
         
         if response.status_code == 200:
             result = response.json()
@@ -371,30 +476,33 @@ def create_session_token(user_id: int, force_create: bool = False) -> Optional[D
             logger.error(f"Failed to create session. Status: {response.status_code}")
             return None
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Exode API unavailable in create_session_token: {e}")
+        return None
     except Exception as e:
         logger.error(f"Unexpected error in create_session_token: {e}")
         return None
 
 
-def get_user_state(user_id: int, key: str) -> Optional[Any]:
+def get_user_state(user_id: int, key: str, on_error: Any = None) -> Optional[Any]:
     """
     Get user state by key.
     
     Args:
         user_id: Exode user ID
         key: State key
+        on_error: Returned instead of None when the request failed, so callers
+            can tell "no value" from "Exode unavailable"
         
     Returns:
-        State value or None if not found/error
+        State value, None if not found, `on_error` on error
     """
     try:
-        url = f'{EXODE_API_BASE_URL}/user/{user_id}/state/get'
-        headers = _get_headers()
         params = {'key': key}
         
         logger.info(f"Getting state for user {user_id}, key: {key}")
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = _request('GET', '/user/{id}/state/get', f'/user/{user_id}/state/get', idempotent=True, params=params)
         
         if response.status_code == 200:
             result = response.json()
@@ -402,14 +510,17 @@ def get_user_state(user_id: int, key: str) -> Optional[Any]:
                 return result['payload'].get('value')
             else:
                 logger.error(f"API error: {result.get('message', 'Unknown error')}")
-                return None
+                return on_error
         else:
             logger.error(f"Failed to get state. Status: {response.status_code}")
-            return None
+            return on_error
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Exode API unavailable in get_user_state: {e}")
+        return on_error
     except Exception as e:
         logger.error(f"Unexpected error in get_user_state: {e}")
-        return None
+        return on_error
 
 
 def set_user_state(user_id: int, key: str, value: Any) -> bool:
@@ -425,14 +536,15 @@ def set_user_state(user_id: int, key: str, value: Any) -> bool:
         True if successful, False otherwise
     """
     try:
-        url = f'{EXODE_API_BASE_URL}/user/{user_id}/state/set'
-        headers = _get_headers()
         params = {'key': key}
         data = {'value': value}
         
         logger.info(f"Setting state for user {user_id}, key: {key}, value: {value}")
         
-        response = requests.put(url, params=params, json=data, headers=headers, timeout=10)
+        response = _request(
+            'PUT', '/user/{id}/state/set', f'/user/{user_id}/state/set',
+            idempotent=True, params=params, json=data
+        )
         
         if response.status_code == 200:
             result = response.json()
@@ -446,6 +558,9 @@ def set_user_state(user_id: int, key: str, value: Any) -> bool:
             logger.error(f"Failed to set state. Status: {response.status_code}")
             return False
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Exode API unavailable in set_user_state: {e}")
+        return False
     except Exception as e:
         logger.error(f"Unexpected error in set_user_state: {e}")
         return False
@@ -480,13 +595,10 @@ def test_connection() -> bool:
         True if connection successful, False otherwise
     """
     try:
-        headers = _get_headers()
-        
         # Try to find a non-existent user to test auth
-        url = f'{EXODE_API_BASE_URL}/user/find'
         params = {'login': 'test@nonexistent.com'}
         
-        response = requests.get(url, params=params, headers=headers, timeout=5)
+        response = _request('GET', '/user/find', '/user/find', idempotent=True, deadline=5, params=params)
         
         if response.status_code == 200:
             logger.info("Exode API connection successful")
@@ -501,6 +613,9 @@ def test_connection() -> bool:
             logger.error(f"Unexpected status: {response.status_code}")
             return False
             
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.error(f"Connection test failed: {e}")
+        return False
     except Exception as e:
         logger.error(f"Connection test failed: {e}")
         return False
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Per-user cache in front of Exode user state (get_user_state / set_user_state).
+
+Reads are served locally once a key has been fetched or written. Writes update
+the cache immediately and are coalesced: all set() calls for a user within
+`flush_delay` seconds end up in a single flush, where each dirty key is sent
+once with its latest value. Pending writes are flushed on shutdown via close().
+A failed read is not cached: the next get() asks Exode again.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import EXODE_STATE_FLUSH_DELAY, EXODE_STATE_CACHE_TTL
+from app.utils.backends import run_blocking, EXODE
+from app.utils.exode_api import get_user_state, set_user_state
+
+logger = logging.getLogger(__name__)
+
+# get_user_state() вернул ошибку, а не пустое значение
+_UNAVAILABLE = object()
+
+
+class ExodeStateCache:
+    """Write-back cache with batched flush for Exode user state."""
+
+    def __init__(
+        self,
+        flush_delay: float = EXODE_STATE_FLUSH_DELAY,
+        ttl: float = EXODE_STATE_CACHE_TTL,
+        max_users: int = 10000
+    ):
+        """
+        Args:
+            flush_delay: Window (seconds) in which writes of one user are coalesced
+            ttl: How long a clean cached value is trusted (seconds)
+            max_users: Max users kept in memory; only users without pending writes are evicted
+        """
+        self.flush_delay = flush_delay
+        self.ttl = ttl
+        self.max_users = max_users
+        # user_id -> {key: (value, fetched_at)}
+        self._values: "OrderedDict[int, Dict[str, Tuple[Any, float]]]" = OrderedDict()
+        # user_id -> {key: value} waiting to be flushed
+        self._dirty: Dict[int, Dict[str, Any]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+        # Лок живёт, пока его держит или ждёт хотя бы один flush(); счётчик — сколько их
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._lock_refs: Dict[int, int] = {}
+        self._closed = False
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'flushes': 0, 'http_sets': 0, 'flush_errors': 0,
+                      'fetch_errors': 0}
+
+    # --- Чтение / запись ---
+
+    async def get(self, user_id: int, key: str, default: Any = None) -> Any:
+        """Get a state value, fetching it from Exode on a cache miss."""
+        pending = self._dirty.get(user_id, {})
+        if key in pending:
+            self.stats['hits'] += 1
+            return pending[key]
+
+        cached = self._values.get(user_id, {}).get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            self.stats['hits'] += 1
+            self._values.move_to_end(user_id)
+            return default if cached[0] is None else cached[0]
+
+        self.stats['misses'] += 1
+        value = await run_blocking(EXODE, get_user_state, user_id, key, on_error=_UNAVAILABLE)
+        # A write may have happened while we were waiting for the network
+        if key in self._dirty.get(user_id, {}):
+            return self._dirty[user_id][key]
+        if value is _UNAVAILABLE:
+            # Ошибку не кэшируем, иначе она отдавалась бы весь TTL
+            self.stats['fetch_errors'] += 1
+            return default
+        self._store(user_id, key, value)
+        return default if value is None else value
+
+    async def set(self, user_id: int, key: str, value: Any):
+        """Set a state value locally and schedule a coalesced flush."""
+        if self._closed:
+            # После остановки пишем напрямую, чтобы не потерять данные
+            await run_blocking(EXODE, set_user_state, user_id, key, value)
+            return
+
+        self.stats['writes'] += 1
+        self._dirty.setdefault(user_id, {})[key] = value
+        self._store(user_id, key, value)
+
+        if user_id not in self._timers and user_id not in self._flush_tasks:
+            loop = asyncio.get_running_loop()
+            self._timers[user_id] = loop.call_later(self.flush_delay, self._start_flush, user_id)
+
+    def invalidate(self, user_id: int, key: Optional[str] = None):
+        """Drop clean cached values so the next get() goes to Exode."""
+        if key is None:
+            self._values.pop(user_id, None)
+        else:
+            self._values.get(user_id, {}).pop(key, None)
+
+    # --- Сброс на сервер ---
+
+    def _start_flush(self, user_id: int):
+        self._timers.pop(user_id, None)
+        task = asyncio.create_task(self.flush(user_id))
+        self._flush_tasks[user_id] = task
+        task.add_done_callback(lambda _: self._flush_tasks.pop(user_id, None))
+
+    async def flush(self, user_id: Optional[int] = None):
+        """Flush pending writes of one user (or of everybody if user_id is None)."""
+        if user_id is None:
+            await asyncio.gather(*(self.flush(uid) for uid in list(self._dirty)))
+            return
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._lock_refs[user_id] = self._lock_refs.get(user_id, 0) + 1
+        try:
+            async with lock:
+                await self._flush_user(user_id)
+        finally:
+            self._lock_refs[user_id] -= 1
+            if not self._lock_refs[user_id]:
+                del self._lock_refs[user_id]
+                del self._locks[user_id]
+
+        if self._dirty.get(user_id) and not self._closed and user_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[user_id] = loop.call_later(self.flush_delay, self._start_flush, user_id)
+
+    async def close(self):
+        """Flush all pending writes; called on dispatcher shutdown."""
+        self._closed = True
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks.values(), return_exceptions=True)
+        # Одна попытка для оставшихся записей
+        if self._dirty:
+            logger.info(f"Flushing pending Exode state for {len(self._dirty)} users")
+            await self.flush()
+        if self._dirty:
+            logger.error(f"Exode state for {len(self._dirty)} users could not be flushed on shutdown")
+
+    # --- Внутреннее ---
+
+    async def _flush_user(self, user_id: int):
+        pending = self._dirty.pop(user_id, None)
+        if not pending:
+            return
+        self.stats['flushes'] += 1
+        keys = list(pending)
+        results = await asyncio.gather(
+            *(run_blocking(EXODE, set_user_state, user_id, key, pending[key]) for key in keys),
+            return_exceptions=True
+        )
+        self.stats['http_sets'] += len(keys)
+
+        failed = {
+            key: pending[key] for key, ok in zip(keys, results)
+            if ok is not True
+        }
+        if failed:
+            self.stats['flush_errors'] += len(failed)
+            logger.error(f"Failed to flush Exode state for user {user_id}: {list(failed)}")
+            # Возвращаем неудачные ключи, не затирая более свежие значения
+            current = self._dirty.setdefault(user_id, {})
+            for key, value in failed.items():
+                current.setdefault(key, value)
+
+    def _store(self, user_id: int, key: str, value: Any):
+        self._values.setdefault(user_id, {})[key] = (value, time.monotonic())
+        self._values.move_to_end(user_id)
+        excess = len(self._values) - self.max_users
+        if excess > 0:
+            # Пользователей с несброшенными записями пропускаем и вытесняем следующих по давности
+            clean = (uid for uid in self._values if uid not in self._dirty)
+            for uid in list(islice(clean, excess)):
+                del self._values[uid]
@@ -0,0 +1,400 @@
+"""
+Local Exode API stand-in for load and integration testing.
+
+Implements the subset of the Exode SaaS v2 API used by app.utils.exode_api
+with the same payload shapes, keeps users and user state in memory and can
+simulate slow responses, 4xx/5xx errors, hanging requests and quota limits.
+
+Usage:
+    python -m app.utils.exode_stub --port 8081 --latency lognormal:60:0.5 --error-rate 0.05
+
+Then start the bot with:
+    EXODE_API_BASE_URL=http://127.0.0.1:8081/saas/v2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = '/saas/v2'
+
+
+def parse_latency(spec: Optional[str]) -> Callable[[], float]:
+    """
+    Parse a latency distribution spec into a sampler returning seconds.
+
+    Supported specs (all values in milliseconds):
+        none                    - no delay
+        fixed:MS                - constant delay
+        uniform:LO:HI           - uniform between LO and HI
+        normal:MEAN:STD         - normal, clipped at 0
+        lognormal:MEDIAN:SIGMA  - log-normal with the given median (long tail)
+
+    Args:
+        spec: Distribution spec string
+
+    Returns:
+        Function that samples one delay in seconds
+    """
+    if not spec or spec == 'none':
+        return lambda: 0.0
+
+    name, *raw_args = spec.split(':')
+    try:
+        args = [float(a) for a in raw_args]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec}")
+
+    if name == 'fixed' and len(args) == 1:
+        return lambda: args[0] / 1000
+    if name == 'uniform' and len(args) == 2:
+        return lambda: random.uniform(args[0], args[1]) / 1000
+    if name == 'normal' and len(args) == 2:
+        return lambda: max(0.0, random.gauss(args[0], args[1])) / 1000
+    if name == 'lognormal' and len(args) == 2:
+        # median = exp(mu)
+        mu = math.log(max(args[0], 0.001))
+        return lambda: random.lognormvariate(mu, args[1]) / 1000
+
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class StubConfig:
+    """Fault-injection settings of the stand-in server."""
+
+    def __init__(
+        self,
+        latency: Optional[str] = None,
+        route_latency: Optional[Dict[str, str]] = None,
+        error_rate: float = 0.0,
+        client_error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        hang_seconds: float = 30.0,
+        quota: int = 0,
+        quota_window: float = 60.0,
+        require_auth: bool = True,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            latency: Default latency spec for every route (see parse_latency)
+            route_latency: Per-route latency specs, keyed by route name (e.g. 'user.find')
+            error_rate: Share of requests answered with a random 5xx
+            client_error_rate: Share of requests answered with 400
+            timeout_rate: Share of requests that hang for hang_seconds
+            hang_seconds: How long a "timed out" request hangs
+            quota: Max requests per quota_window (0 disables the quota)
+            quota_window: Quota window length in seconds
+            require_auth: Reject requests without a Bearer token with 401
+            seed: Random seed for reproducible runs
+        """
+        self.latency = parse_latency(latency)
+        self.route_latency = {
+            route: parse_latency(spec) for route, spec in (route_latency or {}).items()
+        }
+        self.error_rate = error_rate
+        self.client_error_rate = client_error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.quota = quota
+        self.quota_window = quota_window
+        self.require_auth = require_auth
+        if seed is not None:
+            random.seed(seed)
+
+
+class ExodeStub:
+    """In-memory Exode users/state store served over aiohttp."""
+
+    def __init__(self, config: Optional[StubConfig] = None, prefix: str = DEFAULT_PREFIX):
+        self.config = config or StubConfig()
+        self.prefix = prefix.rstrip('/')
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.state: Dict[int, Dict[str, Any]] = {}
+        self.sessions: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+        self._quota_hits: deque = deque()
+        self.stats: Counter = Counter()
+
+    # --- Хранилище ---
+
+    def reset(self):
+        self.users.clear()
+        self.state.clear()
+        self.sessions.clear()
+        self._next_id = 1
+        self._quota_hits.clear()
+        self.stats.clear()
+
+    def seed_users(self, users: list):
+        """Load users (Exode user objects or create payloads) into the store."""
+        for data in users:
+            self._create(data)
+
+    def _find(self, login: Optional[str] = None, tg_id: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+        for user in self.users.values():
+            if login and login in (user.get('phone'), user.get('email')):
+                return user
+            if tg_id is not None and str(user.get('tgId')) == str(tg_id):
+                return user
+        return None
+
+    def _find_by_identifiers(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for login in (payload.get('email'), payload.get('phone')):
+            if login and (user := self._find(login=login)):
+                return user
+        if payload.get('tgId') is not None:
+            return self._find(tg_id=payload['tgId'])
+        return None
+
+    def _create(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        user_id = payload.get('id') or self._next_id
+        self._next_id = max(self._next_id, user_id) + 1
+        user = {
+            'id': user_id,
+            'phone': payload.get('phone'),
+            'email': payload.get('email'),
+            'tgId': payload.get('tgId'),
+            'profile': dict(payload.get('profile') or {}),
+            'createdAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        self.users[user_id] = user
+        return user
+
+    @staticmethod
+    def _apply(user: Dict[str, Any], payload: Dict[str, Any]):
+        for field in ('phone', 'email', 'tgId'):
+            if payload.get(field) is not None:
+                user[field] = payload[field]
+        if payload.get('profile'):
+            user['profile'].update({k: v for k, v in payload['profile'].items() if v is not None})
+
+    # --- Ответы ---
+
+    @staticmethod
+    def _ok(payload: Any, status: int = 200) -> web.Response:
+        return web.json_response({'success': True, 'payload': payload}, status=status)
+
+    @staticmethod
+    def _fail(message: str, status: int) -> web.Response:
+        return web.json_response({'success': False, 'message': message}, status=status)
+
+    def _quota_exceeded(self) -> bool:
+        if not self.config.quota:
+            return False
+        now = time.monotonic()
+        while self._quota_hits and now - self._quota_hits[0] > self.config.quota_window:
+            self._quota_hits.popleft()
+        if len(self._quota_hits) >= self.config.quota:
+            return True
+        self._quota_hits.append(now)
+        return False
+
+    @web.middleware
+    async def fault_middleware(self, request: web.Request, handler):
+        """Applies auth check, quota, latency and error injection to every API route."""
+        route = request.match_info.route.name
+        if not route or route.startswith('stub.'):
+            return await handler(request)
+
+        self.stats[f'requests.{route}'] += 1
+        cfg = self.config
+
+        if cfg.require_auth and not request.headers.get('Authorization', '').startswith('Bearer '):
+            self.stats['injected.401'] += 1
+            return self._fail('Unauthorized', 401)
+
+        if self._quota_exceeded():
+            self.stats['injected.429'] += 1
+            return self._fail('QuotaExceeded', 429)
+
+        await asyncio.sleep(cfg.route_latency.get(route, cfg.latency)())
+
+        roll = random.random()
+        if roll < cfg.timeout_rate:
+            self.stats['injected.timeout'] += 1
+            await asyncio.sleep(cfg.hang_seconds)
+        elif roll < cfg.timeout_rate + cfg.error_rate:
+            status = random.choice((500, 502, 503))
+            self.stats[f'injected.{status}'] += 1
+            return self._fail('InternalServerError', status)
+        elif roll < cfg.timeout_rate + cfg.error_rate + cfg.client_error_rate:
+            self.stats['injected.400'] += 1
+            return self._fail('ValidationError', 400)
+
+        return await handler(request)
+
+    # --- Эндпоинты ---
+
+    async def user_find(self, request: web.Request) -> web.Response:
+        login = request.query.get('login')
+        tg_id = request.query.get('tgId')
+        if not login and not tg_id:
+            return self._fail('LoginOrTgIdRequired', 400)
+        user = self._find(login=login, tg_id=tg_id)
+        return self._ok({'user': user} if user else None)
+
+    async def user_create(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        if not any(payload.get(f) for f in ('email', 'phone', 'tgId')):
+            return self._fail('LoginRequired', 400)
+        if payload.get('email') and self._find(login=payload['email']):
+            return self._fail('EmailIsBusy', 400)
+        if payload.get('phone') and self._find(login=payload['phone']):
+            return self._fail('PhoneIsBusy', 400)
+        return self._ok({'user': self._create(payload)}, status=201)
+
+    async def user_upsert(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        if not any(payload.get(f) for f in ('email', 'phone', 'tgId')):
+            return self._fail('LoginRequired', 400)
+        user = self._find_by_identifiers(payload)
+        if user:
+            self._apply(user, payload)
+            return self._ok({'user': user, 'isCreated': False})
+        return self._ok({'user': self._create(payload), 'isCreated': True})
+
+    async def user_update(self, request: web.Request) -> web.Response:
+        user = self.users.get(int(request.match_info['user_id']))
+        if not user:
+            return self._fail('UserNotFound', 404)
+        self._apply(user, await request.json())
+        return self._ok({'user': user})
+
+    async def session_auth_token(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        user_id = data.get('userId')
+        if user_id not in self.users:
+            return self._fail('UserNotFound', 404)
+        session = self.sessions.get(user_id)
+        is_created = data.get('forceCreate') or session is None
+        if is_created:
+            session = {'token': uuid.uuid4().hex, 'userId': user_id}
+            self.sessions[user_id] = session
+        return self._ok({'session': session, 'isCreated': bool(is_created)})
+
+    async def state_get(self, request: web.Request) -> web.Response:
+        user_id = int(request.match_info['user_id'])
+        if user_id not in self.users:
+            return self._fail('UserNotFound', 404)
+        value = self.state.get(user_id, {}).get(request.query.get('key'))
+        return self._ok({'value': value})
+
+    async def state_set(self, request: web.Request) -> web.Response:
+        user_id = int(request.match_info['user_id'])
+        if user_id not in self.users:
+            return self._fail('UserNotFound', 404)
+        data = await request.json()
+        self.state.setdefault(user_id, {})[request.query.get('key')] = data.get('value')
+        return self._ok({'set': True})
+
+    # --- Служебные ---
+
+    async def stub_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'users': len(self.users),
+            'counters': dict(self.stats),
+        })
+
+    async def stub_reset(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({'reset': True})
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.fault_middleware])
+        p = self.prefix
+        app.router.add_get(f'{p}/user/find', self.user_find, name='user.find')
+        app.router.add_post(f'{p}/user/create', self.user_create, name='user.create')
+        app.router.add_put(f'{p}/user/upsert', self.user_upsert, name='user.upsert')
+        app.router.add_put(f'{p}/user/{{user_id:\\d+}}/update', self.user_update, name='user.update')
+        app.router.add_post(f'{p}/user/session/auth-token', self.session_auth_token, name='user.session')
+        app.router.add_get(f'{p}/user/{{user_id:\\d+}}/state/get', self.state_get, name='user.state.get')
+        app.router.add_put(f'{p}/user/{{user_id:\\d+}}/state/set', self.state_set, name='user.state.set')
+        app.router.add_get('/__stub__/stats', self.stub_stats, name='stub.stats')
+        app.router.add_post('/__stub__/reset', self.stub_reset, name='stub.reset')
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        Start the server in the running event loop (for in-process tests).
+
+        Returns:
+            Base URL to use as EXODE_API_BASE_URL
+        """
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        return f'http://{host}:{bound_port}{self.prefix}'
+
+    async def stop(self):
+        if getattr(self, '_runner', None):
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _parse_route_latency(values: list) -> Dict[str, str]:
+    result = {}
+    for item in values or []:
+        route, _, spec = item.partition('=')
+        if not spec:
+            raise argparse.ArgumentTypeError(f"Expected ROUTE=SPEC, got: {item}")
+        result[route] = spec
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Exode API stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--prefix', default=DEFAULT_PREFIX)
+    parser.add_argument('--latency', default='none', help="none | fixed:MS | uniform:LO:HI | normal:MEAN:STD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--route-latency', action='append', metavar='ROUTE=SPEC',
+                        help="Per-route latency, e.g. user.find=fixed:800 (repeatable)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of 5xx responses")
+    parser.add_argument('--client-error-rate', type=float, default=0.0, help="Share of 400 responses")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="Share of hanging requests")
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    parser.add_argument('--quota', type=int, default=0, help="Requests per --quota-window (0 = unlimited)")
+    parser.add_argument('--quota-window', type=float, default=60.0)
+    parser.add_argument('--no-auth', action='store_true', help="Do not require the Authorization header")
+    parser.add_argument('--users', help="JSON file with a list of users to preload")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        route_latency=_parse_route_latency(args.route_latency),
+        error_rate=args.error_rate,
+        client_error_rate=args.client_error_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        quota=args.quota,
+        quota_window=args.quota_window,
+        require_auth=not args.no_auth,
+        seed=args.seed,
+    )
+    stub = ExodeStub(config, prefix=args.prefix)
+    if args.users:
+        with open(args.users, 'r', encoding='utf-8') as f:
+            stub.seed_users(json.load(f))
+
+    logger.info(f"Exode stand-in listening on http://{args.host}:{args.port}{stub.prefix}")
+    web.run_app(stub.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    main()
@@ -1,9 +1,11 @@
 import logging
+import threading
 from datetime import datetime 
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Sequence
 import gspread
 from google.oauth2.service_account import Credentials
 from app.core.config import GOOGLE_SHEETS_CREDENTIALS_PATH
+from app.utils.helpers import normalize_phone
 
 try:
     from app.utils.test_content import SCALES_INFO
@@ -18,25 +20,38 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 
+_client: Optional[gspread.Client] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> gspread.Client:
+    """Авторизованный клиент gspread, общий для всех менеджеров (одна авторизация на процесс)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            creds = Credentials.from_service_account_file(
+                GOOGLE_SHEETS_CREDENTIALS_PATH,
+                scopes=SCOPES
+            )
+            _client = gspread.authorize(creds)
+        return _client
+
 
 class GoogleSheetsManager:
     """Базовый класс для работы с Google Sheets."""
     
-    def __init__(self, sheet_id: str):
+    def __init__(self, sheet_id: str, connect: bool = True):
+        """connect=False: таблица открывается позже вызовом connect() (фоновый старт бота)."""
         self.sheet_id = sheet_id
         self.client = None
         self.sheet = None
-        if sheet_id: 
-            self._connect()
+        if sheet_id and connect: 
+            self.connect()
     
-    def _connect(self):
+    def connect(self):
         """Подключение к Google Sheets."""
         try:
-            creds = Credentials.from_service_account_file(
-                GOOGLE_SHEETS_CREDENTIALS_PATH,
-                scopes=SCOPES
-            )
-            self.client = gspread.authorize(creds)
+            self.client = get_client()
             self.sheet = self.client.open_by_key(self.sheet_id)
             logger.info(f"Successfully connected to Google Sheet: {self.sheet_id}")
         except Exception as e:
@@ -77,12 +92,52 @@ class GoogleSheetsManager:
         except Exception as e:
             logger.error(f"Error updating cell in {worksheet_name or 'default sheet'}: {e}")
 
+    def fetch_spreadsheet(self, sheet_id: Optional[str] = None, known_version: Optional[str] = None,
+                          only: Optional[List[str]] = None) -> Optional[tuple]:
+        """
+        Все вкладки таблицы за один batch-запрос (для каталогов в памяти).
+        sheet_id=None — таблица этого менеджера; общий self.sheet не меняется.
+
+        Returns:
+            (версия таблицы, {название вкладки: записи как у get_all_records()})
+            или None, если версия совпадает с known_version
+        """
+        spreadsheet = self.sheet if sheet_id is None else self.client.open_by_key(sheet_id)
+        try:
+            version = spreadsheet.get_lastUpdateTime()
+        except Exception as e:
+            # Нет доступа к Drive API: читаем таблицу целиком каждый раз
+            logger.warning(f"Could not get last update time of {sheet_id or self.sheet_id}: {e}")
+            version = None
+        if version is not None and version == known_version:
+            return None
+
+        titles = [ws.title for ws in spreadsheet.worksheets() if only is None or ws.title in only]
+        if not titles:
+            return version, {}
+        quoted = ["'{}'".format(title.replace("'", "''")) for title in titles]
+        value_ranges = spreadsheet.values_batch_get(quoted).get('valueRanges', [])
+
+        worksheets = {}
+        for title, value_range in zip(titles, value_ranges):
+            values = value_range.get('values', [])
+            if not values:
+                worksheets[title] = []
+                continue
+            headers = values[0]
+            width = len(headers)
+            worksheets[title] = [
+                dict(zip(headers, gspread.utils.numericise_all(row + [''] * (width - len(row)))))
+                for row in values[1:]
+            ]
+        return version, worksheets
+
 
 class RegistrationGSheet(GoogleSheetsManager):
     """Класс для работы с таблицей регистрации пользователей."""
     
-    def __init__(self, sheet_id: str):
-        super().__init__(sheet_id)
+    def __init__(self, sheet_id: str, connect: bool = True):
+        super().__init__(sheet_id, connect)
         self.parent_worksheet = 'Родитель'
         self.student_worksheet = 'Ученик'
         self.children_worksheet = 'Родитель-Ребенок'
@@ -240,6 +295,47 @@ class RegistrationGSheet(GoogleSheetsManager):
             logger.error(f"Error updating user data: {e}")
             return False
     
+    def find_registrations(self, telegram_id: Optional[int] = None, phone: Optional[str] = None,
+                           roles: Optional[Sequence[str]] = None) -> Dict[str, List[Dict]]:
+        """
+        Поиск записей о человеке в листах регистрации (по Telegram ID и/или
+        номеру телефона). Каждый лист читается один раз; roles ('parent',
+        'student', 'child') ограничивает поиск нужными листами, по умолчанию — все.
+        """
+        phone_key = normalize_phone(phone)
+        phone_columns = {
+            self.parent_worksheet: ('Номер телефона', 'Номер телефон'),
+            self.student_worksheet: ('Телефон',),
+            self.children_worksheet: ('Телефон ребенка',),
+        }
+        result = {'parent': [], 'student': [], 'child': []}
+        sheets = {
+            self.parent_worksheet: 'parent',
+            self.student_worksheet: 'student',
+            self.children_worksheet: 'child',
+        }
+        try:
+            for worksheet_name, role in sheets.items():
+                if roles is not None and role not in roles:
+                    continue
+                for record in self.get_all_records(worksheet_name):
+                    by_id = (
+                        telegram_id is not None
+                        and role != 'child'
+                        and str(record.get('Telegram ID')) == str(telegram_id)
+                    )
+                    by_phone = bool(phone_key) and any(
+                        normalize_phone(record.get(col)) == phone_key
+                        for col in phone_columns[worksheet_name]
+                    )
+                    if by_id or by_phone:
+                        record['role'] = role
+                        result[role].append(record)
+            return result
+        except Exception as e:
+            logger.error(f"Error finding registrations: {e}")
+            return result
+
     def get_student_parent_contact(self, student_id: int) -> Optional[str]:
         """Получение контакта родителя студента."""
         try:
@@ -259,48 +355,20 @@ class RegistrationGSheet(GoogleSheetsManager):
 class UniversitiesGSheet(GoogleSheetsManager):
 
     
-    def __init__(self, sheet_id: str):
-        # Инициализируем клиент, но не открываем конкретный sheet
-        self.client = None
-        if sheet_id: # sheet_id здесь - "фиктивный", для инициализации
-            try:
-                creds = Credentials.from_service_account_file(
-                    GOOGLE_SHEETS_CREDENTIALS_PATH,
-                    scopes=SCOPES
-                )
-                self.client = gspread.authorize(creds)
-                # Открываем "фиктивную" таблицу (e.g., REGISTRATION_SHEET_ID)
-                self.sheet = self.client.open_by_key(sheet_id) 
-                logger.info(f"UniversitiesGSheet manager initialized with base sheet: {sheet_id}")
-            except Exception as e:
-                logger.error(f"Failed to initialize UniversitiesGSheet manager: {e}")
-                raise
-    
-    def _open_sheet_by_id(self, sheet_id: str):
-        """Внутренний метод для открытия (или переключения) таблицы по ID."""
-        try:
-            self.sheet = self.client.open_by_key(sheet_id)
-            logger.info(f"Switched to Google Sheet: {sheet_id}")
-            return True
-        except gspread.exceptions.SpreadsheetNotFound:
-             logger.error(f"Spreadsheet with ID {sheet_id} not found or no access.")
-             self.sheet = None
-             return False
-        except Exception as e:
-            logger.error(f"Failed to open sheet by ID {sheet_id}: {e}")
-            self.sheet = None # Сбрасываем, если не удалось
-            return False
+    def __init__(self, sheet_id: str, connect: bool = True):
+        # sheet_id здесь - "фиктивный" (e.g., REGISTRATION_SHEET_ID), нужные таблицы открываются по запросу
+        super().__init__(sheet_id, connect)
     
     def get_universities_by_city_and_type(self, sheet_id: str, city: str = None) -> List[Dict]:
-
+        """
+        Вузы из вкладки "Universities" таблицы sheet_id. Таблица открывается
+        локально: метод выполняется в пуле потоков, и переключение общего
+        self.sheet смешало бы списки разных пользователей.
+        """
         try:
-            # <-- Переключаемся на нужную таблицу (e.g., Tashkent)
-            if not self._open_sheet_by_id(sheet_id): 
-                return []
-
-            universities = self.get_all_records("Universities") 
+            spreadsheet = self.client.open_by_key(sheet_id)
+            universities = spreadsheet.worksheet("Universities").get_all_records()
 
-            
             if city:
                 # Фильтруем по городу (важно для Частных и Иностранных)
                 universities = [
@@ -309,20 +377,34 @@ class UniversitiesGSheet(GoogleSheetsManager):
                 ]
             
             return universities
+        except gspread.exceptions.SpreadsheetNotFound:
+            logger.error(f"Spreadsheet with ID {sheet_id} not found or no access.")
+            return []
         except Exception as e:
             logger.error(f"Error getting universities: {e}")
             return []
     
 
-    def get_faculties_by_sheet_name(self, sheet_name: str) -> List[Dict]:
+    def get_faculties_by_sheet_name(self, sheet_name: str, sheet_id: Optional[str] = None) -> List[Dict]:
+        """
+        Программы вуза с вкладки sheet_name. Если передан sheet_id, таблица
+        открывается локально, без переключения общего self.sheet.
+        """
+        spreadsheet = self.sheet
+        if sheet_id:
+            try:
+                spreadsheet = self.client.open_by_key(sheet_id)
+            except Exception as e:
+                logger.error(f"Failed to open sheet by ID {sheet_id}: {e}")
+                return []
 
-        if not self.sheet:
-            logger.error("No sheet is currently open. Call get_universities... first.")
+        if not spreadsheet:
+            logger.error("No sheet is open: pass sheet_id of the universities spreadsheet.")
             return []
             
         try:
             # Ищем вкладку (worksheet) по ее ИМЕНИ (e.g., "НацУнивер")
-            worksheet = self.sheet.worksheet(sheet_name)
+            worksheet = spreadsheet.worksheet(sheet_name)
             # Получаем все строки из этой вкладки
             faculties_and_programs = worksheet.get_all_records()
             logger.info(f"Successfully loaded {len(faculties_and_programs)} programs from worksheet '{sheet_name}'")
@@ -331,7 +413,7 @@ class UniversitiesGSheet(GoogleSheetsManager):
             return faculties_and_programs
             
         except gspread.exceptions.WorksheetNotFound:
-            logger.error(f"Worksheet (вкладка) с именем '{sheet_name}' не найдена в файле {self.sheet.title}.")
+            logger.error(f"Worksheet (вкладка) с именем '{sheet_name}' не найдена в файле {spreadsheet.title}.")
             return []
         except Exception as e:
             logger.error(f"Error getting faculties from worksheet '{sheet_name}': {e}")
@@ -342,8 +424,8 @@ class UniversitiesGSheet(GoogleSheetsManager):
 class CoursesGSheet(GoogleSheetsManager):
     """Класс для работы с таблицей курсов."""
     
-    def __init__(self, sheet_id: str):
-        super().__init__(sheet_id)
+    def __init__(self, sheet_id: str, connect: bool = True):
+        super().__init__(sheet_id, connect)
 
         self.worksheet_name = 'Courses' 
 
@@ -381,6 +463,9 @@ class CoursesGSheet(GoogleSheetsManager):
 
 class ProfessionsGSheet(GoogleSheetsManager):
 
+    # Листы со шкалами теста; каждый лист — профессии одной шкалы
+    SCALE_SHEETS = ['human', 'tech', 'art', 'sign', 'nature']
+
     def get_professions_by_scale(self, scale_key: str) -> List[Dict]:
         """
         Получение профессий по ключу шкалы (scale_key ИСПОЛЬЗУЕТСЯ КАК ИМЯ ЛИСТА).
@@ -414,7 +499,7 @@ class ProfessionsGSheet(GoogleSheetsManager):
             sheet_names = [ws.title for ws in self.sheet.worksheets()]
             
             # Фильтруем, оставляя только листы со шкалами
-            scale_sheets = [name for name in sheet_names if name in ['human', 'tech', 'art', 'sign', 'nature']]
+            scale_sheets = [name for name in sheet_names if name in self.SCALE_SHEETS]
 
             for sheet_name in scale_sheets:
                 try:
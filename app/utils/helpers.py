@@ -10,4 +10,13 @@ def calculate_age(dob_string: str) -> int | None:
         age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
         return age
     except (ValueError, TypeError):
-        return None
\ No newline at end of file
+        return None
+
+def normalize_phone(phone) -> str:
+    """Приводит номер телефона к виду 998XXXXXXXXX (только цифры) для сравнения."""
+    if not phone:
+        return ''
+    digits = ''.join(c for c in str(phone) if c.isdigit())
+    if len(digits) == 9:
+        digits = '998' + digits
+    return digits
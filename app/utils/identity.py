@@ -0,0 +1,165 @@
+"""
+Unified identity resolution across Exode and the registration spreadsheet.
+
+Queries Exode by phone, Exode by Telegram ID and the registration worksheets
+concurrently and merges the answers into one ResolvedIdentity, so confirming a
+found user costs one parallel round-trip instead of several sequential ones.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.utils.backends import run_blocking, SHEETS, EXODE
+from app.utils.exode_api import find_user_by_phone, find_user_by_telegram_id
+from app.utils.google_sheets import RegistrationGSheet
+
+logger = logging.getLogger(__name__)
+
+
+class ResolvedIdentity:
+    """Merged view of a person found in Exode and/or the registration sheet."""
+
+    def __init__(
+        self,
+        phone: Optional[str],
+        tg_id: Optional[int],
+        exode_by_phone: Optional[Dict[str, Any]] = None,
+        exode_by_tg: Optional[Dict[str, Any]] = None,
+        registrations: Optional[Dict[str, List[Dict]]] = None
+    ):
+        self.phone = phone
+        self.tg_id = tg_id
+        self.exode_by_phone = exode_by_phone
+        self.exode_by_tg = exode_by_tg
+        self.registrations = registrations or {'parent': [], 'student': [], 'child': []}
+
+    # --- Источники ---
+
+    @property
+    def exode_user(self) -> Optional[Dict[str, Any]]:
+        """Exode user object; a match by phone wins over a match by tgId."""
+        return self.exode_by_phone or self.exode_by_tg
+
+    @property
+    def registration(self) -> Optional[Dict[str, Any]]:
+        """First matching registration row (student, child, then parent)."""
+        for role in ('student', 'child', 'parent'):
+            if self.registrations.get(role):
+                return self.registrations[role][0]
+        return None
+
+    @property
+    def is_found(self) -> bool:
+        """
+        Found only with an Exode account to link to: a sheet row without
+        'Exode ID' cannot be confirmed and goes to a new registration.
+        """
+        return bool(self.exode_id)
+
+    # --- Объединённые поля ---
+
+    @property
+    def exode_id(self) -> Optional[int]:
+        if self.exode_user and self.exode_user.get('id'):
+            return self.exode_user['id']
+        row = self.registration or {}
+        return row.get('Exode ID') or None
+
+    @property
+    def first_name(self) -> str:
+        profile = (self.exode_user or {}).get('profile') or {}
+        row = self.registration or {}
+        return profile.get('firstName') or row.get('Имя') or row.get('Имя ребенка') or ''
+
+    @property
+    def last_name(self) -> str:
+        profile = (self.exode_user or {}).get('profile') or {}
+        row = self.registration or {}
+        return profile.get('lastName') or row.get('Фамилия') or row.get('Фамилия ребенка') or ''
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.first_name} {self.last_name}".strip()
+
+    @property
+    def bdate(self) -> Optional[str]:
+        """Birth date in Exode format (YYYY-MM-DD)."""
+        profile = (self.exode_user or {}).get('profile') or {}
+        if profile.get('bdate'):
+            return profile['bdate']
+        dob = (self.registration or {}).get('Дата рождения')
+        try:
+            return datetime.strptime(str(dob), '%d.%m.%Y').strftime('%Y-%m-%d') if dob else None
+        except ValueError:
+            return None
+
+    def to_user_payload(self) -> Dict[str, Any]:
+        """
+        Exode-shaped user object ({'id', 'phone', 'profile': {...}}) with the
+        gaps filled from the registration sheet. Stored in FSM by the
+        registration handlers instead of the raw Exode payload.
+        """
+        user = dict(self.exode_user or {})
+        profile = dict(user.get('profile') or {})
+        profile.update({
+            'firstName': self.first_name or None,
+            'lastName': self.last_name or None,
+            'bdate': self.bdate,
+        })
+        user['profile'] = profile
+        user['id'] = self.exode_id
+        user['phone'] = user.get('phone') or self.phone
+        return user
+
+
+async def resolve_identity(
+    phone: Optional[str] = None,
+    tg_id: Optional[int] = None,
+    registration_manager: Optional[RegistrationGSheet] = None,
+    roles: Optional[Sequence[str]] = None
+) -> ResolvedIdentity:
+    """
+    Look a person up everywhere at once.
+
+    Args:
+        phone: Phone number typed or shared by the user
+        tg_id: Telegram ID of the person themself (not of a parent searching for a child)
+        registration_manager: Registration sheet manager; skipped if None
+        roles: Registration worksheets to search ('parent', 'student', 'child'); all if None
+
+    Returns:
+        ResolvedIdentity with whatever was found
+    """
+    async def exode_by_phone():
+        result = await run_blocking(EXODE, find_user_by_phone, phone)
+        return (result or {}).get('user')
+
+    async def exode_by_tg():
+        result = await run_blocking(EXODE, find_user_by_telegram_id, tg_id)
+        return (result or {}).get('user')
+
+    async def registrations():
+        return await run_blocking(
+            SHEETS, registration_manager.find_registrations,
+            telegram_id=tg_id, phone=phone, roles=roles
+        )
+
+    async def nothing():
+        return None
+
+    results = await asyncio.gather(
+        exode_by_phone() if phone else nothing(),
+        exode_by_tg() if tg_id is not None else nothing(),
+        registrations() if registration_manager else nothing(),
+        return_exceptions=True
+    )
+    by_phone, by_tg, rows = [
+        None if isinstance(r, BaseException) else r for r in results
+    ]
+    for r in results:
+        if isinstance(r, BaseException):
+            logger.error(f"Identity lookup failed: {r}")
+
+    return ResolvedIdentity(phone, tg_id, by_phone, by_tg, rows)
@@ -0,0 +1,148 @@
+"""
+Search behind the bot's inline mode (@bot <query> in any chat).
+
+Professions (sheet and built-in) and courses get their own SearchIndex,
+rebuilt when the content catalog changes; universities, faculties and
+programs come from the university catalog's index. Both are queried and
+merged by score, so an inline query never reads a spreadsheet.
+
+Results are cached per normalized query (folded tokens, so "Ташкент" and
+"toshkent" share an entry) for INLINE_CACHE_TTL seconds. The cache key
+includes the versions of both catalogs: a refresh that changes the data
+makes old entries unreachable instead of serving stale results.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from app.core.config import INLINE_CACHE_SIZE, INLINE_CACHE_TTL, INLINE_MAX_RESULTS
+from app.utils.content_catalog import ContentCatalog, DIRECTION, PROFESSION_TITLE
+from app.utils.metrics import REGISTRY
+from app.utils.search import SearchDocument, SearchIndex, fold, tokenize
+from app.utils.test_content import SCALES_INFO
+from app.utils.university_catalog import UniversityCatalog, UNIVERSITY, FACULTY, PROGRAM
+
+PROFESSION, COURSE = 'profession', 'course'
+# Порядок видов при равном счёте
+KIND_ORDER = (PROFESSION, UNIVERSITY, COURSE, FACULTY, PROGRAM)
+COURSE_TITLE = "Название курса"
+
+
+class ResultCache:
+    """LRU cache with per-entry expiry."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.stats['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats['evicted'] += 1
+
+
+class InlineSearch:
+    """Merged professions / courses / universities search with a per-query cache."""
+
+    def __init__(
+        self,
+        content_catalog: ContentCatalog,
+        university_catalog: UniversityCatalog,
+        cache_size: int = INLINE_CACHE_SIZE,
+        cache_ttl: float = INLINE_CACHE_TTL
+    ):
+        self.content_catalog = content_catalog
+        self.university_catalog = university_catalog
+        self.index = SearchIndex(kind_order=KIND_ORDER)
+        self.kind_rank = self.index.kind_rank
+        self.cache = ResultCache(cache_size, cache_ttl)
+        self._scales = set()
+        content_catalog.on_change(self._rebuild)
+        REGISTRY.add_collector('inline_search', self.collect_metrics)
+
+    @property
+    def ready(self) -> bool:
+        return self.content_catalog.loaded or self.university_catalog.loaded
+
+    def search(self, query: str, limit: int = INLINE_MAX_RESULTS) -> List[SearchDocument]:
+        """Best matches of both indexes; repeated queries are answered from the cache."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        key = (' '.join(terms), limit, self.content_catalog.version,
+               self.university_catalog.stats['worksheets_reindexed'])
+        results = self.cache.get(key)
+        if results is not None:
+            return results
+
+        ranked = self.index.ranked(query, limit) + self.university_catalog.index.ranked(query, limit)
+        last = len(self.kind_rank)
+        ranked.sort(key=lambda item: (-item[0], self.kind_rank.get(item[1].kind, last), len(item[1].title)))
+        results = [document for _, document in ranked[:limit]]
+        # Пока каталоги не загружены, пустой ответ не кэшируем
+        if self.ready:
+            self.cache.put(key, results)
+        return results
+
+    # --- Индексация ---
+
+    def _rebuild(self, catalog: ContentCatalog):
+        sheet_titles = set()
+        for scale, records in catalog.professions.items():
+            self.index.replace_source(('professions', scale), self._profession_documents(scale, records))
+            sheet_titles.update(fold(r.get(PROFESSION_TITLE, '')).strip() for r in records)
+        for scale in self._scales - set(catalog.professions):
+            self.index.remove_source(('professions', scale))
+        self._scales = set(catalog.professions)
+        # Встроенные описания — только для профессий, которых нет в таблице
+        for scale, records in catalog.builtin.items():
+            unique = [r for r in records if fold(r.get(PROFESSION_TITLE, '')).strip() not in sheet_titles]
+            self.index.replace_source(('builtin', scale), self._profession_documents(scale, unique))
+        self.index.replace_source('courses', self._course_documents(catalog.courses))
+
+    @staticmethod
+    def _profession_documents(scale: str, records):
+        scale_title = SCALES_INFO.get(scale, {}).get('title', scale)
+        for record in records:
+            title = record.get(PROFESSION_TITLE)
+            if not title:
+                continue
+            direction = str(record.get(DIRECTION, ''))
+            subtitle = f"{direction} · {scale_title}" if direction else scale_title
+            yield (SearchDocument(PROFESSION, str(title), subtitle, record),
+                   f"{direction} {scale_title} {record.get('Факультеты', '')}")
+
+    @staticmethod
+    def _course_documents(records):
+        for record in records:
+            title = record.get(COURSE_TITLE)
+            if not title:
+                continue
+            category, subcategory = record.get('Категория', ''), record.get('Подкатегория', '')
+            subtitle = " · ".join(str(part) for part in (category, subcategory) if part)
+            yield SearchDocument(COURSE, str(title), subtitle, record), f"{category} {subcategory}"
+
+    def collect_metrics(self):
+        yield 'bot_inline_search_documents', 'gauge', {}, len(self.index)
+        yield 'bot_inline_cache_entries', 'gauge', {}, len(self.cache)
+        for result in ('hits', 'misses'):
+            yield 'bot_inline_cache_requests_total', 'counter', {'result': result}, self.cache.stats[result]
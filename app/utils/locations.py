@@ -13,4 +13,13 @@ CITIES_UZ = [
     "Qo'qon", "Marg'ilon", "Angren", "Jizzax",
     "Chirchiq", "Urganch", "Termiz", "Navoiy",
     "Olmaliq", "Shahrisabz"
-]
\ No newline at end of file
+]
+
+# Узбекские названия регионов (ключи STATE_UNIVERSITIES_BY_CITY в app/core/config.py)
+REGIONS_UZ = {
+    "Qoraqalpog'iston": "Каракалпакстан",
+    "Qashqadaryo": "Кашкадарья",
+    "Surxondaryo": "Сурхандарья",
+    "Sirdaryo": "Сырдарья",
+    "Xorazm": "Хорезм",
+}
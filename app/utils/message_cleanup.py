@@ -0,0 +1,122 @@
+"""
+Bulk deletion of the bot's tracked messages.
+
+Registration keeps the IDs of prompts and answers in FSM and removes them at
+each step. Deleting them one by one costs a Bot API round-trip per message;
+here they go out in deleteMessages batches of up to 100 IDs (missing or
+already deleted IDs are skipped by Telegram). If a batch is refused, its
+messages are deleted individually with bounded concurrency, ignoring the ones
+that are already gone. Cleanup can run in the background, so the next prompt
+is sent without waiting for it.
+"""
+
+import asyncio
+import logging
+from typing import Iterable, List, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from app.core.config import CLEANUP_CONCURRENCY, CLEANUP_IN_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+BULK_DELETE_LIMIT = 100  # максимум ID в одном deleteMessages
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def _delete_one(bot: Bot, chat_id: int, message_id: int, semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        try:
+            return await bot.delete_message(chat_id, message_id)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            try:
+                return await bot.delete_message(chat_id, message_id)
+            except TelegramAPIError:
+                return False
+        except TelegramAPIError:
+            # Уже удалено пользователем, слишком старое и т.п.
+            return False
+
+
+async def delete_messages(
+    bot: Bot,
+    chat_id: int,
+    message_ids: Iterable[int],
+    concurrency: int = CLEANUP_CONCURRENCY
+) -> int:
+    """
+    Delete messages in a chat as fast as the Bot API allows.
+
+    Args:
+        bot: Bot instance
+        chat_id: Chat the messages belong to
+        message_ids: IDs to delete; duplicates and falsy values are ignored
+        concurrency: Parallel single deletes when a bulk request is refused
+
+    Returns:
+        Number of Bot API requests made
+    """
+    ids: List[int] = sorted({int(m) for m in message_ids if m})
+    if not ids:
+        return 0
+
+    requests_made = 0
+    fallback: List[int] = []
+    for start in range(0, len(ids), BULK_DELETE_LIMIT):
+        batch = ids[start:start + BULK_DELETE_LIMIT]
+        requests_made += 1
+        try:
+            await bot.delete_messages(chat_id, batch)
+        except TelegramAPIError as e:
+            logger.debug(f"Bulk delete refused in chat {chat_id}, deleting one by one: {e}")
+            fallback.extend(batch)
+
+    if fallback:
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(_delete_one(bot, chat_id, m, semaphore) for m in fallback))
+        requests_made += len(fallback)
+    return requests_made
+
+
+def _log_task_failure(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background message cleanup failed: {task.exception()}")
+
+
+async def cleanup_messages(
+    bot: Bot,
+    chat_id: int,
+    message_ids: Iterable[int],
+    background: bool = CLEANUP_IN_BACKGROUND
+):
+    """
+    Delete messages, in the background by default.
+
+    Args:
+        bot: Bot instance
+        chat_id: Chat the messages belong to
+        message_ids: IDs to delete
+        background: Return immediately and delete in a separate task
+    """
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    if not background:
+        await delete_messages(bot, chat_id, message_ids)
+        return
+    task = asyncio.create_task(delete_messages(bot, chat_id, message_ids))
+    _background_tasks.add(task)
+    task.add_done_callback(_log_task_failure)
+
+
+async def drain_cleanups(timeout: float = 10.0):
+    """Wait for background cleanups still running (called on shutdown)."""
+    if not _background_tasks:
+        return
+    done, pending = await asyncio.wait(set(_background_tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
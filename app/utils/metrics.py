@@ -0,0 +1,279 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+A deliberately small registry (counters, gauges, bucketed histograms with
+labels) so the bot does not need prometheus_client. Handlers, backends and
+Bot API calls record into the module-level metrics below; render() produces
+the Prometheus text format and summary() a compact dict for log dumps.
+Components that already keep their own counters (backends, Exode circuit,
+webhook queue) are exported through collectors evaluated at render time.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(v) for v in labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    type_name = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def items(self) -> List[Tuple[LabelValues, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.items())
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type_name = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed histogram (seconds by default)."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [count per bucket..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, *labels: str, value: float):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def items(self) -> List[Tuple[LabelValues, List[float]]]:
+        with self._lock:
+            return [(key, list(row)) for key, row in self._values.items()]
+
+    def quantile(self, row: List[float], q: float) -> float:
+        """Approximate quantile from bucket counts (linear interpolation inside a bucket)."""
+        counts = row[:-1]
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            if count and seen + count >= rank:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, row in sorted(self.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), row[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+Collector = Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]
+
+
+class MetricsRegistry:
+    """Holds metrics and collectors and renders them in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Collector] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, name: str, collector: Collector):
+        """
+        Register a callable evaluated on every render.
+
+        The collector yields (metric_name, type, labels, value) tuples; use it
+        for values that already live elsewhere (queue depth, circuit state).
+        Registering again under the same name replaces the previous collector.
+        """
+        self._collectors[name] = collector
+
+    def remove_collector(self, name: str):
+        self._collectors.pop(name, None)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+
+        collected: Dict[str, Tuple[str, List[str]]] = {}
+        for name, collector in list(self._collectors.items()):
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector '{name}' failed: {e}")
+                continue
+            for metric_name, type_name, labels, value in samples:
+                entry = collected.setdefault(metric_name, (type_name, []))
+                entry[1].append(
+                    f"{metric_name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}"
+                )
+        for metric_name, (type_name, samples) in collected.items():
+            lines.append(f"# TYPE {metric_name} {type_name}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, top: int = 10) -> Dict[str, List[Dict[str, object]]]:
+        """Slowest label sets of every histogram by p95, for periodic log dumps."""
+        result = {}
+        for metric in self._metrics.values():
+            if not isinstance(metric, Histogram):
+                continue
+            rows = []
+            for key, row in metric.items():
+                count = sum(row[:-1])
+                rows.append({
+                    'labels': '/'.join(key),
+                    'count': count,
+                    'mean': row[-1] / count if count else 0.0,
+                    'p95': metric.quantile(row, 0.95),
+                })
+            rows.sort(key=lambda r: r['p95'], reverse=True)
+            if rows:
+                result[metric.name] = rows[:top]
+        return result
+
+
+REGISTRY = MetricsRegistry()
+
+# --- Обработка апдейтов ---
+UPDATE_DURATION = REGISTRY.histogram(
+    'bot_update_duration_seconds', 'Time from receiving an update to the end of its processing', ('event_type',)
+)
+UPDATES_TOTAL = REGISTRY.counter(
+    'bot_updates_total', 'Updates processed', ('event_type', 'outcome')
+)
+HANDLER_DURATION = REGISTRY.histogram(
+    'bot_handler_duration_seconds', 'Handler execution time', ('router', 'handler')
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    'bot_handler_errors_total', 'Exceptions raised by handlers', ('router', 'handler', 'error')
+)
+HANDLERS_IN_FLIGHT = REGISTRY.gauge(
+    'bot_handlers_in_flight', 'Handlers currently executing', ('router', 'handler')
+)
+
+# --- Внешние вызовы ---
+BACKEND_CALL_DURATION = REGISTRY.histogram(
+    'bot_backend_call_duration_seconds', 'Blocking Sheets/Exode call time, excluding the wait for a slot',
+    ('backend', 'call')
+)
+BACKEND_WAIT_DURATION = REGISTRY.histogram(
+    'bot_backend_wait_seconds', 'Time spent waiting for a free backend slot', ('backend',)
+)
+BACKEND_ERRORS = REGISTRY.counter(
+    'bot_backend_errors_total', 'Failed or rejected backend calls', ('backend', 'error')
+)
+BOT_API_DURATION = REGISTRY.histogram(
+    'bot_telegram_api_duration_seconds', 'Telegram Bot API request time', ('method',)
+)
+BOT_API_ERRORS = REGISTRY.counter(
+    'bot_telegram_api_errors_total', 'Failed Telegram Bot API requests', ('method', 'error')
+)
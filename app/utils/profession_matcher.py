@@ -0,0 +1,170 @@
+"""
+Professions that fit a STEM-navigator result, by vector similarity.
+
+Every profession (sheet rows of the professions spreadsheet and the built-in
+descriptions in professions_data.PROFESSIONS) becomes a feature vector: one
+dimension per test scale (the worksheet / category it belongs to) and one
+per interest (IT, engineering, medicine, ...), found by keyword stems in its
+title, direction and descriptions. Rows are L2-normalized into one matrix
+when the content catalog changes, so a match is a single matrix-vector
+product followed by a top-k selection. The matrix version is a hash of its
+rows, so "match_<version>_<row>" buttons sent before a restart resolve to the
+same profession or are reported as stale.
+
+A student is described the same way: per-scale scores as a share of the
+scale's answers, and interests from the answers that point to them. The
+matrix product runs on numpy (a dependency in requirements.txt); if it can't
+be imported, the same arithmetic runs on lists.
+"""
+
+import heapq
+import logging
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from app.core.config import PROFESSION_MATCHES
+from app.utils.catalog import CatalogRegistry
+from app.utils.content_catalog import ContentCatalog, DIRECTION, PROFESSION_TITLE
+from app.utils.metrics import REGISTRY
+from app.utils.scoring import SCALES, answer_codes
+from app.utils.search import fold, tokenize
+from app.utils.test_content import SCORING_KEY
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Интерес -> (ответы теста, которые на него указывают; начала слов в описании профессии)
+INTERESTS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    'it': (('1_A', '2_C', '4_A', '9_C', '12_A'),
+           ('программ', 'разработ', 'it', 'айти', 'компьютер', 'данн', 'кибер', 'информац', 'сайт', 'приложен',
+            'алгоритм', 'веб', 'dastur', 'kompyuter')),
+    'engineering': (('1_C', '4_B', '5_B', '10_C', '11_C'),
+                    ('инженер', 'техни', 'механ', 'строит', 'робот', 'электр', 'конструк', 'машин', 'энерг',
+                     'станк', 'injener', 'muhandis')),
+    'medicine': (('6_A', '11_B'),
+                 ('врач', 'медиц', 'лечен', 'лечат', 'пациент', 'здоров', 'стомат', 'фарм', 'хирург', 'медсест',
+                  'shifokor', 'tibbiy')),
+    'nature': (('2_B', '3_B', '5_C', '6_B', '7_C', '9_A', '10_B'),
+               ('живот', 'растен', 'биолог', 'эколог', 'агро', 'ветерин', 'зоолог', 'природ', 'сельск', 'лес',
+                'ферм', 'biolog', 'tabiat')),
+    'creativity': (('2_A', '3_A', '5_A', '7_A', '10_A', '11_A'),
+                   ('дизайн', 'художн', 'актёр', 'актер', 'режисс', 'музык', 'фото', 'творч', 'искусств', 'рису',
+                    'писател', 'сцен', 'кино', 'dizayn', 'ijod')),
+    'society': (('1_B', '4_C', '7_B', '8_A', '9_B', '12_B'),
+                ('юрист', 'прав', 'закон', 'суд', 'полит', 'диплом', 'психолог', 'педагог', 'учител', 'общени',
+                 'люд', 'социал', 'huquq', "o'qituvchi")),
+    'economics': (('3_C', '12_C'),
+                  ('эконом', 'финанс', 'банк', 'бухгалт', 'бизнес', 'маркет', 'менедж', 'бюджет', 'iqtisod',
+                   'moliya')),
+}
+INTEREST_NAMES: Tuple[str, ...] = tuple(INTERESTS)
+# Начала слов после fold, как в поисковом индексе
+_INTEREST_STEMS = tuple(tuple(fold(stem) for stem in INTERESTS[name][1]) for name in INTEREST_NAMES)
+_INTEREST_ANSWERS = {
+    code: position for position, name in enumerate(INTEREST_NAMES) for code in INTERESTS[name][0]
+}
+# Поля профессии, по которым ищутся интересы
+TEXT_FIELDS = (PROFESSION_TITLE, DIRECTION, "О чём профессия?", "Чем занимаются?", "Факультеты")
+# Вес интересов относительно шкалы: шкала задаёт основу, интересы — порядок внутри неё
+INTEREST_WEIGHT = 0.6
+# Совпадений слов, после которых интерес считается выраженным полностью
+INTEREST_SATURATION = 3
+
+
+def _normalized(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+
+def profession_vector(scale: str, record: Dict[str, Any]) -> List[float]:
+    """Features of one profession: its scale and the interests its description mentions, L2-normalized."""
+    vector = [1.0 if s == scale else 0.0 for s in SCALES]
+    tokens = tokenize(' '.join(str(record.get(field) or '') for field in TEXT_FIELDS))
+    for stems in _INTEREST_STEMS:
+        hits = sum(1 for token in tokens if token.startswith(stems))
+        vector.append(INTEREST_WEIGHT * min(hits, INTEREST_SATURATION) / INTEREST_SATURATION)
+    return _normalized(vector)
+
+
+def student_vector(scores: Sequence[int], answers: Optional[Union[str, Sequence[str]]] = None) -> List[float]:
+    """Features of a test result: each scale's share of its answers, interests from the answers themselves."""
+    vector = [scores[i] / len(SCORING_KEY[scale]) for i, scale in enumerate(SCALES)]
+    interests = [0.0] * len(INTEREST_NAMES)
+    for code in answer_codes(answers or ()):
+        position = _INTEREST_ANSWERS.get(code)
+        if position is not None:
+            interests[position] += 1
+    for position, name in enumerate(INTEREST_NAMES):
+        vector.append(INTEREST_WEIGHT * interests[position] / len(INTERESTS[name][0]))
+    return _normalized(vector)
+
+
+class ProfessionMatcher:
+    """Normalized profession matrix, rebuilt when the content catalog changes."""
+
+    def __init__(self, content_catalog: ContentCatalog):
+        self.content_catalog = content_catalog
+        # Строка матрицы -> (шкала, запись профессии)
+        self.rows: Tuple[Tuple[str, Dict[str, Any]], ...] = ()
+        self._matrix: Any = None
+        # Хэш строк матрицы; по нему кнопки подборки узнают, что устарели
+        self.version = ''
+        self.stats = {'rebuilds': 0, 'matches': 0}
+        # Встроенные описания доступны сразу, лист профессий — после загрузки каталога
+        self._rebuild(content_catalog)
+        content_catalog.on_change(self._rebuild)
+        REGISTRY.add_collector('profession_matcher', self.collect_metrics)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def match(self, scores: Sequence[int], answers: Optional[Union[str, Sequence[str]]] = None,
+              k: int = PROFESSION_MATCHES) -> List[Tuple[float, int]]:
+        """(similarity, row) of the `k` closest professions, best first; ties in row order."""
+        if not self.rows or not any(scores):
+            return []
+        self.stats['matches'] += 1
+        user = student_vector(scores, answers)
+        k = min(k, len(self.rows))
+        if np is not None:
+            similarities = self._matrix @ np.asarray(user, dtype=self._matrix.dtype)
+            candidates = np.argpartition(-similarities, k - 1)[:k] if k < len(self.rows) else np.arange(len(self.rows))
+            best = sorted(candidates.tolist(), key=lambda row: (-similarities[row], row))
+            return [(float(similarities[row]), row) for row in best]
+        similarities = [sum(a * b for a, b in zip(vector, user)) for vector in self._matrix]
+        best = heapq.nsmallest(k, range(len(similarities)), key=lambda row: (-similarities[row], row))
+        return [(similarities[row], row) for row in best]
+
+    def profession(self, version: str, row: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(scale, record) of a row of matrix `version`, or None if it has been rebuilt since."""
+        if version != self.version or not 0 <= row < len(self.rows):
+            return None
+        return self.rows[row]
+
+    def _rebuild(self, catalog: ContentCatalog):
+        rows, seen = [], set()
+        # Профессии из таблицы важнее встроенных описаний с тем же названием
+        for source in (catalog.professions, catalog.builtin):
+            for scale, records in source.items():
+                if scale not in SCALES:
+                    continue
+                for record in records:
+                    title = fold(str(record.get(PROFESSION_TITLE) or '')).strip()
+                    if title and title not in seen:
+                        seen.add(title)
+                        rows.append((scale, record))
+        vectors = [profession_vector(scale, record) for scale, record in rows]
+        self.rows = tuple(rows)
+        self._matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1) if np is not None else vectors
+        self.version = CatalogRegistry.snapshot_id([{'scale': scale, 'record': record} for scale, record in rows])
+        self.stats['rebuilds'] += 1
+        logger.info(f"Profession matcher rebuilt: {len(rows)} professions")
+
+    def collect_metrics(self):
+        yield 'bot_profession_matcher_professions', 'gauge', {}, len(self.rows)
+        yield 'bot_profession_matcher_rebuilds_total', 'counter', {}, self.stats['rebuilds']
+        yield 'bot_profession_matches_total', 'counter', {}, self.stats['matches']
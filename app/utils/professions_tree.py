@@ -0,0 +1,111 @@
+"""
+Scale -> direction -> professions tree for the professions menus.
+
+The STEM-navigator results ("Посмотреть профессии: ...") and the
+"💼 Профессии" menu both list the directions ('Направление') of the
+professions spreadsheet and the professions of each direction. The tree is
+built once per content catalog change: directions sorted, professions in
+sheet order, both per scale and merged over all scales, all in tuples. A
+click is an index into it, without reading the sheet or filtering lists.
+
+FSM keeps the tree version with the indices. The version is a hash of the
+professions content (CatalogRegistry.snapshot_id), so an index saved before
+a restart still points into the same tree, or into none. The last few trees
+stay available, so a menu opened before a refresh keeps working until the
+user leaves it; older versions are reported as stale.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.utils.catalog import CatalogRegistry
+from app.utils.content_catalog import ContentCatalog, DIRECTION
+from app.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Предыдущие версии дерева, по которым ещё работают открытые меню
+KEPT_VERSIONS = 4
+
+
+class Direction:
+    """One direction and its professions, in sheet order."""
+
+    __slots__ = ('title', 'professions')
+
+    def __init__(self, title: str, professions: Tuple[Dict[str, Any], ...]):
+        self.title = title
+        self.professions = professions
+
+
+def _directions(records) -> Tuple[Direction, ...]:
+    groups: Dict[str, list] = {}
+    for record in records:
+        title = record.get(DIRECTION)
+        if title:
+            groups.setdefault(title, []).append(record)
+    return tuple(Direction(title, tuple(groups[title])) for title in sorted(groups))
+
+
+class ProfessionsTree:
+    """Immutable snapshot: directions per scale and over all scales."""
+
+    __slots__ = ('version', 'by_scale', 'all')
+
+    def __init__(self, version: str, professions: Dict[str, Tuple[Dict[str, Any], ...]]):
+        self.version = version
+        self.by_scale: Dict[str, Tuple[Direction, ...]] = {
+            scale: _directions(records) for scale, records in professions.items()
+        }
+        self.all = _directions(record for records in professions.values() for record in records)
+
+    def directions(self, scale: Optional[str] = None) -> Tuple[Direction, ...]:
+        """Directions of `scale`, or of all scales if None."""
+        return self.all if scale is None else self.by_scale.get(scale, ())
+
+    def direction(self, scale: Optional[str], index: int) -> Optional[Direction]:
+        directions = self.directions(scale)
+        return directions[index] if 0 <= index < len(directions) else None
+
+    def profession(self, scale: Optional[str], direction_index: int, index: int) -> Optional[Dict[str, Any]]:
+        direction = self.direction(scale, direction_index)
+        if direction is None or not 0 <= index < len(direction.professions):
+            return None
+        return direction.professions[index]
+
+
+class ProfessionsNavigator:
+    """Current professions tree, rebuilt when the content catalog changes."""
+
+    def __init__(self, content_catalog: ContentCatalog):
+        self.content_catalog = content_catalog
+        self.tree = ProfessionsTree('', {})
+        self._trees: 'OrderedDict[str, ProfessionsTree]' = OrderedDict()
+        content_catalog.on_change(self._rebuild)
+        REGISTRY.add_collector('professions_tree', self.collect_metrics)
+
+    @property
+    def ready(self) -> bool:
+        return self.content_catalog.loaded
+
+    def get(self, version: Optional[str]) -> Optional[ProfessionsTree]:
+        """Tree `version` if it is still kept, else None (the menu is stale)."""
+        return self._trees.get(version)
+
+    def _rebuild(self, catalog: ContentCatalog):
+        version = CatalogRegistry.snapshot_id(
+            [{'scale': scale, 'records': records} for scale, records in sorted(catalog.professions.items())]
+        )
+        tree = self._trees.get(version)
+        if tree is None:
+            tree = self._trees[version] = ProfessionsTree(version, catalog.professions)
+            logger.info(f"Professions tree {version}: {len(tree.all)} directions")
+        self._trees.move_to_end(version)
+        self.tree = tree
+        while len(self._trees) > KEPT_VERSIONS:
+            self._trees.popitem(last=False)
+
+    def collect_metrics(self):
+        yield 'bot_professions_tree_directions', 'gauge', {}, len(self.tree.all)
+        yield 'bot_professions_tree_versions', 'gauge', {}, len(self._trees)
@@ -0,0 +1,311 @@
+"""
+Faceted filtering of study programs.
+
+Program worksheets keep admission details as free text ("от 12 500 000 сум",
+"Математика, физика", "Ha", "есть"). When the university catalog loads a
+worksheet, every program row is parsed once into typed facets: minimum score
+and cost as numbers, exams and study forms as sets of normalized keys,
+scholarship, dormitory and budget places as booleans (None when the cell says
+nothing usable).
+
+FacetIndex keeps, per facet, a sorted list of (value, id) for numeric
+facets (a "cost under X" filter is one bisect) and value -> IDs sets for
+categorical ones; a query intersects the sets starting from the smallest
+and walks the sorted score list to return the first page already ordered.
+Like SearchIndex, entries are grouped by source so a changed worksheet is
+replaced without rebuilding the rest.
+"""
+
+import bisect
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+from app.utils.search import fold, tokenize
+
+# Ключи форм обучения и их подписи
+STUDY_FORMS = {
+    'full_time': "очная",
+    'extramural': "заочная",
+    'evening': "вечерняя",
+    'online': "онлайн",
+}
+# Начала слов (после fold) для каждой формы, RU и UZ
+_FORM_WORDS = {
+    'full_time': ('ochn', 'kunduz', 'dnevn'),
+    'extramural': ('zaochn', 'sirtk'),
+    'evening': ('vecher', 'kechk'),
+    'online': ('onlain', 'online', 'masofav', 'distan'),
+}
+# Отдельные колонки "да/нет" для форм обучения
+_FORM_COLUMNS = {
+    'extramural': "Заочное обучение",
+    'evening': "Вечернее обучение",
+    'online': "Онлайн обучение",
+}
+
+# Первое слово ячейки (после fold) целиком; длинные слова — по началу
+_YES_WORDS = frozenset({'da', 'est', 'ha', 'bor', 'yes', 'mavjud'})
+_YES_STEMS = ('imeet', 'imeyut', 'predostav')
+_NO_WORDS = frozenset({'net', 'ne', 'yok', 'no', 'emas'})
+_NO_STEMS = ('otsutstv',)
+# "Нет данных", "уточняется", "noma'lum": ячейка ничего не говорит
+_UNKNOWN_STEMS = ('dannih', 'dannie', 'utochn', 'neizvest', 'nomalum', 'malumot')
+_NUMBER = re.compile(r'\d+(?:[ \u00a0]\d{3})*(?:[.,]\d+)?')
+# Разделители, после которых число уже не из того же диапазона ("5-7 млн", "от 5 до 10 млн")
+_RANGE_BREAK = re.compile(r'[,;/\n()]')
+_EXAM_SEPARATORS = re.compile(r'[,;/+\n]|\s(?:и|va)\s', re.IGNORECASE)
+_CURRENCIES = (('USD', ('$', 'usd', 'doll')), ('EUR', ('€', 'eur', 'evro')))
+
+MAX_SCORE = 300  # баллы DTM; большие числа в колонке баллов — не баллы
+EXAM_KEY_LENGTH = 40  # ключ экзамена передаётся в callback_data
+
+
+def parse_numbers(text: Any) -> List[float]:
+    """
+    Numbers in a cell, '12 500 000' and '12,5' included; 'млн'/'тыс' multiplies
+    the number before it and the bare numbers of the same range ("5-7 млн",
+    "от 5 до 10 млн").
+    """
+    if isinstance(text, (int, float)):
+        return [float(text)]
+    text = str(text or '')
+    numbers = []
+    # Числа диапазона без своего множителя: их умножит множитель после диапазона
+    pending: List[int] = []
+    previous_end = 0
+    for match in _NUMBER.finditer(text):
+        if _RANGE_BREAK.search(text[previous_end:match.start()]):
+            pending = []
+        previous_end = match.end()
+        value = float(match.group().replace(' ', '').replace('\u00a0', '').replace(',', '.'))
+        suffix = fold(text[match.end():match.end() + 5]).strip()
+        if suffix.startswith(('mln', 'million')):
+            multiplier = 1_000_000
+        elif suffix.startswith(('tis', 'ming')):
+            multiplier = 1_000
+        else:
+            numbers.append(value)
+            if value < 1000:
+                pending.append(len(numbers) - 1)
+            continue
+        for index in pending:
+            numbers[index] *= multiplier
+        pending = []
+        numbers.append(value * multiplier)
+    return numbers
+
+
+def parse_flag(text: Any) -> Optional[bool]:
+    """'да' / 'Ha' / 'есть' / positive number -> True, 'нет' / "yo'q" / 0 -> False, else None."""
+    if isinstance(text, (int, float)):
+        return text > 0
+    folded = fold(text).strip()
+    if folded in ('+', '-'):
+        return folded == '+'
+    words = tokenize(folded)
+    if not words or any(word.startswith(_UNKNOWN_STEMS) for word in words):
+        return None
+    # "mavjud emas" — отрицание стоит вторым словом
+    if words[0] in _NO_WORDS or words[0].startswith(_NO_STEMS) or 'emas' in words:
+        return False
+    if words[0] in _YES_WORDS or words[0].startswith(_YES_STEMS):
+        return True
+    numbers = parse_numbers(text)
+    return numbers[0] > 0 if numbers else None
+
+
+def parse_cost(text: Any) -> Tuple[Optional[float], Optional[str]]:
+    """(lowest cost, currency) of a 'Стоимость' cell; 'бесплатно' is 0 UZS."""
+    folded = fold(text)
+    if folded.startswith(('besplat', 'bepul')):
+        return 0.0, 'UZS'
+    numbers = parse_numbers(text)
+    if not numbers:
+        return None, None
+    raw = str(text).lower()
+    currency = next((code for code, marks in _CURRENCIES if any(m in raw or m in folded for m in marks)), 'UZS')
+    return min(numbers), currency
+
+
+def parse_exams(text: Any) -> Dict[str, str]:
+    """Normalized key -> original name for every exam in a cell."""
+    exams = {}
+    for part in _EXAM_SEPARATORS.split(str(text or '')):
+        name = part.strip(' .()')
+        key = ' '.join(tokenize(name))[:EXAM_KEY_LENGTH]
+        if key and not key.isdigit():
+            exams.setdefault(key, name)
+    return exams
+
+
+def parse_forms(program: Dict[str, Any]) -> FrozenSet[str]:
+    words = tokenize(program.get("Форма обучения", ''))
+    forms = {form for form, starts in _FORM_WORDS.items() if any(w.startswith(starts) for w in words)}
+    for form, column in _FORM_COLUMNS.items():
+        if parse_flag(program.get(column)):
+            forms.add(form)
+    return frozenset(forms)
+
+
+class ProgramFacets:
+    """Typed admission details of one program."""
+
+    __slots__ = ('city', 'uni_type', 'min_score', 'cost', 'currency', 'exams', 'forms',
+                 'stipend', 'dormitory', 'budget')
+
+    def __init__(self, program: Dict[str, Any], city: str, uni_type: str):
+        self.city = city
+        self.uni_type = uni_type
+        scores = [n for n in parse_numbers(program.get("Минимальные баллы для поступления")) if 0 < n <= MAX_SCORE]
+        self.min_score = min(scores) if scores else None
+        self.cost, self.currency = parse_cost(program.get("Стоимость"))
+        self.exams = parse_exams(program.get("Экзамены"))
+        self.forms = parse_forms(program)
+        self.stipend = parse_flag(program.get("Стипендия"))
+        self.dormitory = parse_flag(program.get("Наличие общежития"))
+        budget = parse_flag(program.get("Квота на бюджет"))
+        self.budget = budget if budget is not None else (self.cost == 0 or None)
+
+
+class FacetIndex:
+    """Sorted numeric and value -> IDs categorical indexes over ProgramFacets."""
+
+    CATEGORICAL = ('city', 'uni_type', 'stipend', 'dormitory', 'budget')
+
+    def __init__(self):
+        self._facets: Dict[int, ProgramFacets] = {}
+        self._sources: Dict[Hashable, List[int]] = {}
+        self._categories: Dict[str, Dict[Any, Set[int]]] = {f: defaultdict(set) for f in self.CATEGORICAL}
+        self._forms: Dict[str, Set[int]] = defaultdict(set)
+        self._exams: Dict[str, Set[int]] = defaultdict(set)
+        self.exam_names: Dict[str, Counter] = defaultdict(Counter)
+        # Отсортированные (значение, id); стоимость — только в сумах
+        self._scores: List[Tuple[float, int]] = []
+        self._costs: List[Tuple[float, int]] = []
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._facets)
+
+    def get(self, entry_id: int) -> Optional[ProgramFacets]:
+        return self._facets.get(entry_id)
+
+    def replace_source(self, source: Hashable, entries: Iterable[Tuple[int, ProgramFacets]]):
+        """Replace all entries of a source; IDs are the program documents' IDs in the search index."""
+        for entry_id in self._sources.pop(source, ()):
+            self._remove(entry_id)
+        ids = []
+        for entry_id, facets in entries:
+            self._add(entry_id, facets)
+            ids.append(entry_id)
+        if ids:
+            self._sources[source] = ids
+        self._dirty = True
+
+    def remove_source(self, source: Hashable):
+        self.replace_source(source, ())
+
+    def top_exams(self, limit: int) -> List[Tuple[str, str]]:
+        """(key, display name) of the most frequent exams."""
+        ranked = sorted(self._exams, key=lambda key: (-len(self._exams[key]), key))[:limit]
+        return [(key, self.exam_names[key].most_common(1)[0][0]) for key in ranked]
+
+    def query(self, filters: Dict[str, Any], limit: int) -> Tuple[int, List[int]]:
+        """
+        Programs matching all filters, lowest admission score first.
+
+        Args:
+            filters: JSON-friendly dict as kept in FSM: city, uni_type, budget, dormitory,
+                stipend (exact values), form (STUDY_FORMS key), max_cost (UZS),
+                score (user's score: programs with a minimum score up to it),
+                exams (keys the user takes: programs requiring nothing else)
+            limit: Number of IDs to return
+
+        Returns:
+            (total number of matches, first `limit` IDs)
+        """
+        if self._dirty:
+            self._scores = sorted((f.min_score, i) for i, f in self._facets.items() if f.min_score is not None)
+            self._costs = sorted((f.cost, i) for i, f in self._facets.items()
+                                 if f.cost is not None and f.currency == 'UZS')
+            self._dirty = False
+
+        sets = []
+        for field in self.CATEGORICAL:
+            if filters.get(field) is not None:
+                sets.append(self._categories[field].get(filters[field], set()))
+        if filters.get('form'):
+            sets.append(self._forms.get(filters['form'], set()))
+        if filters.get('max_cost') is not None:
+            sets.append(self._up_to(self._costs, filters['max_cost']))
+        if filters.get('score') is not None:
+            sets.append(self._up_to(self._scores, filters['score']))
+
+        if sets:
+            sets.sort(key=len)
+            matches = set(sets[0]).intersection(*sets[1:])
+        else:
+            matches = set(self._facets)
+        if filters.get('exams'):
+            allowed = set(filters['exams'])
+            for key, ids in self._exams.items():
+                if key not in allowed:
+                    matches -= ids
+                    if not matches:
+                        break
+
+        ordered = []
+        for _, entry_id in self._scores if limit else ():
+            if entry_id in matches:
+                ordered.append(entry_id)
+                if len(ordered) == limit:
+                    break
+        if len(ordered) < limit:
+            ordered += sorted(i for i in matches if self._facets[i].min_score is None)[:limit - len(ordered)]
+        return len(matches), ordered
+
+    # --- Внутреннее ---
+
+    @staticmethod
+    def _up_to(values: List[Tuple[float, int]], limit: float) -> Set[int]:
+        end = bisect.bisect_right(values, (limit, float('inf')))
+        return {i for _, i in values[:end]}
+
+    def _add(self, entry_id: int, facets: ProgramFacets):
+        self._facets[entry_id] = facets
+        for field in self.CATEGORICAL:
+            value = getattr(facets, field)
+            if value is not None:
+                self._categories[field][value].add(entry_id)
+        for form in facets.forms:
+            self._forms[form].add(entry_id)
+        for key, name in facets.exams.items():
+            self._exams[key].add(entry_id)
+            self.exam_names[key][name] += 1
+
+    def _remove(self, entry_id: int):
+        facets = self._facets.pop(entry_id, None)
+        if facets is None:
+            return
+        for field in self.CATEGORICAL:
+            value = getattr(facets, field)
+            if value is not None:
+                self._discard(self._categories[field], value, entry_id)
+        for form in facets.forms:
+            self._discard(self._forms, form, entry_id)
+        for key, name in facets.exams.items():
+            self._discard(self._exams, key, entry_id)
+            self.exam_names[key][name] -= 1
+            if self.exam_names[key][name] <= 0:
+                del self.exam_names[key][name]
+            if not self.exam_names[key]:
+                del self.exam_names[key]
+
+    @staticmethod
+    def _discard(index: Dict[Any, Set[int]], key: Any, entry_id: int):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del index[key]
@@ -0,0 +1,268 @@
+"""
+Background reconciliation of the 'Родитель-Ребенок' worksheet with Exode.
+
+A child row can be left with an empty 'Exode ID' (the row is written before
+the Exode account is created, and a failed upsert is never retried). The
+reconciler streams the worksheet in row chunks, looks every child phone up in
+Exode with bounded concurrency and writes the missing IDs back with batched
+sheet updates. A child often shares a phone with a parent or a sibling, so an
+existing ID is never overwritten: a different account found by phone is only
+counted and logged as a mismatch, and an empty ID is filled only if the
+account's first name does not contradict the child's. Progress is checkpointed to a JSON file after every chunk, so a
+large run interrupted by a restart resumes from the last finished chunk.
+
+Can also be run once from the command line:
+    python -m app.utils.reconciliation [--dry-run]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from gspread.utils import rowcol_to_a1
+
+from app.core.config import (
+    RECONCILE_INTERVAL, RECONCILE_CONCURRENCY, RECONCILE_CHUNK_ROWS,
+    RECONCILE_BATCH_SIZE, RECONCILE_CHECKPOINT_PATH
+)
+from app.utils.backends import run_blocking, SHEETS, EXODE
+from app.utils.exode_api import find_user_by_phone, get_exode_stats
+from app.utils.google_sheets import RegistrationGSheet
+from app.utils.helpers import normalize_phone
+from app.utils.search import fold
+
+logger = logging.getLogger(__name__)
+
+EXODE_ID_COLUMN = 'Exode ID'
+PHONE_COLUMN = 'Телефон ребенка'
+NAME_COLUMN = 'Имя ребенка'
+
+
+class SheetsExodeReconciler:
+    """Fills missing Exode links of registered children and reports mismatched ones."""
+
+    def __init__(
+        self,
+        registration_manager: RegistrationGSheet,
+        interval: float = RECONCILE_INTERVAL,
+        concurrency: int = RECONCILE_CONCURRENCY,
+        chunk_rows: int = RECONCILE_CHUNK_ROWS,
+        batch_size: int = RECONCILE_BATCH_SIZE,
+        checkpoint_path: str = RECONCILE_CHECKPOINT_PATH,
+        dry_run: bool = False
+    ):
+        """
+        Args:
+            registration_manager: Registration sheet manager
+            interval: Seconds between runs of the periodic job (0 disables it)
+            concurrency: Max Exode lookups in flight
+            chunk_rows: Rows read from the sheet per request
+            batch_size: Max cell updates per batch_update call
+            checkpoint_path: JSON file with the progress of the current run
+            dry_run: Only report what would be changed
+        """
+        self.registration_manager = registration_manager
+        self.interval = interval
+        self.concurrency = concurrency
+        self.chunk_rows = chunk_rows
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.dry_run = dry_run
+        self._task: Optional[asyncio.Task] = None
+        self.last_stats: Dict[str, Any] = {}
+
+    # --- Периодический запуск ---
+
+    async def start(self):
+        """Start the periodic job; registered on dispatcher startup."""
+        if self.interval <= 0 or self._task:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop the periodic job; the checkpoint lets the next start resume."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reconciliation run failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    # --- Один проход ---
+
+    async def run_once(self) -> Dict[str, Any]:
+        """
+        Reconcile the whole worksheet, resuming from the checkpoint if any.
+
+        Returns:
+            Run statistics
+        """
+        worksheet = await run_blocking(
+            SHEETS, self.registration_manager.sheet.worksheet, self.registration_manager.children_worksheet
+        )
+        headers = await run_blocking(SHEETS, worksheet.row_values, 1)
+        if EXODE_ID_COLUMN not in headers or PHONE_COLUMN not in headers:
+            logger.error(f"Reconciliation skipped: columns '{EXODE_ID_COLUMN}'/'{PHONE_COLUMN}' not found")
+            return {}
+        id_col = headers.index(EXODE_ID_COLUMN) + 1
+        phone_col = headers.index(PHONE_COLUMN) + 1
+        name_col = headers.index(NAME_COLUMN) + 1 if NAME_COLUMN in headers else None
+        last_col_letter = rowcol_to_a1(1, len(headers)).rstrip('0123456789')
+
+        checkpoint = self._load_checkpoint()
+        stats = checkpoint.get('stats') or {
+            'rows': 0, 'no_phone': 0, 'linked': 0, 'mismatched': 0, 'unresolved': 0, 'ok': 0, 'errors': 0
+        }
+        next_row = checkpoint.get('next_row', 2)
+        started = time.monotonic()
+        if next_row > 2:
+            logger.info(f"Resuming reconciliation from row {next_row}")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            end_row = next_row + self.chunk_rows - 1
+            rows = await run_blocking(SHEETS, worksheet.get, f"A{next_row}:{last_col_letter}{end_row}")
+            if not rows:
+                break
+
+            stats_before_chunk = dict(stats)
+            updates = await self._reconcile_chunk(rows, next_row, id_col, phone_col, name_col, semaphore, stats)
+            for i in range(0, len(updates), self.batch_size):
+                batch = updates[i:i + self.batch_size]
+                if not self.dry_run:
+                    await run_blocking(SHEETS, worksheet.batch_update, batch)
+
+            if get_exode_stats()['circuit']['state'] == 'open':
+                # Exode недоступен: чанк не засчитываем, продолжим со следующего запуска
+                self._save_checkpoint({'next_row': next_row, 'stats': stats_before_chunk})
+                logger.warning(f"Reconciliation paused at row {next_row}: Exode circuit is open")
+                self.last_stats = dict(stats, paused_at_row=next_row)
+                return self.last_stats
+
+            next_row += len(rows)
+            self._save_checkpoint({'next_row': next_row, 'stats': stats})
+            if len(rows) < self.chunk_rows:
+                break
+
+        stats['duration'] = round(time.monotonic() - started, 2)
+        self.last_stats = stats
+        self._clear_checkpoint()
+        logger.info(f"Reconciliation finished: {stats}")
+        return stats
+
+    async def _reconcile_chunk(
+        self,
+        rows: List[List[str]],
+        first_row: int,
+        id_col: int,
+        phone_col: int,
+        name_col: Optional[int],
+        semaphore: asyncio.Semaphore,
+        stats: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Resolve one chunk concurrently; returns the cell updates to write."""
+
+        async def resolve(row_number: int, row: List[str]) -> Optional[Dict[str, Any]]:
+            current_id = row[id_col - 1].strip() if len(row) >= id_col else ''
+            phone = normalize_phone(row[phone_col - 1] if len(row) >= phone_col else '')
+            stats['rows'] += 1
+            if not phone:
+                stats['no_phone'] += 1
+                return None
+            async with semaphore:
+                result = await run_blocking(EXODE, find_user_by_phone, phone)
+            user = (result or {}).get('user') or {}
+            exode_id = user.get('id')
+            if not exode_id:
+                # find_user_by_phone не различает "не найден" и ошибку API
+                stats['unresolved'] += 1
+                return None
+            if str(exode_id) == current_id:
+                stats['ok'] += 1
+                return None
+
+            # По телефону ребенка может найтись аккаунт родителя или брата/сестры
+            child_name = fold(row[name_col - 1]).strip() if name_col and len(row) >= name_col else ''
+            exode_name = fold((user.get('profile') or {}).get('firstName') or '').strip()
+            if current_id or (child_name and exode_name and child_name != exode_name):
+                stats['mismatched'] += 1
+                logger.warning(
+                    f"Row {row_number}: Exode ID '{current_id}' left as is, phone belongs to {exode_id}"
+                )
+                return None
+
+            stats['linked'] += 1
+            logger.info(f"Row {row_number}: linked to Exode ID {exode_id}")
+            return {'range': rowcol_to_a1(row_number, id_col), 'values': [[exode_id]]}
+
+        results = await asyncio.gather(
+            *(resolve(first_row + i, row) for i, row in enumerate(rows)),
+            return_exceptions=True
+        )
+        updates = []
+        for result in results:
+            if isinstance(result, BaseException):
+                stats['errors'] += 1
+                logger.error(f"Reconciliation of a row failed: {result}")
+            elif result:
+                updates.append(result)
+        return updates
+
+    # --- Чекпоинт ---
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Ignoring unreadable reconciliation checkpoint: {e}")
+            return {}
+        if checkpoint.get('sheet_id') != self.registration_manager.sheet_id:
+            return {}
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        checkpoint['sheet_id'] = self.registration_manager.sheet_id
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from app.core.config import REGISTRATION_SHEET_ID
+
+    parser = argparse.ArgumentParser(description="Reconcile 'Родитель-Ребенок' Exode IDs once")
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be changed')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    reconciler = SheetsExodeReconciler(RegistrationGSheet(REGISTRATION_SHEET_ID), dry_run=args.dry_run)
+    print(json.dumps(asyncio.run(reconciler.run_once()), ensure_ascii=False, indent=2))
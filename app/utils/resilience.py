@@ -0,0 +1,267 @@
+"""
+Resilience primitives for calls to external HTTP APIs.
+
+Provides a circuit breaker, a jittered retry policy with a per-call deadline
+budget and per-endpoint latency statistics. Used by app.utils.exode_api so
+that every Exode call goes through one shared policy.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _on_event_loop() -> bool:
+    """True if called from a thread that is running an asyncio event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the per-call deadline budget is used up."""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker (closed -> open -> half-open).
+
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_timeout` seconds, then lets a single probe call through. A
+    successful probe closes the circuit, a failed one opens it again.
+    Thread-safe: sync clients are called from worker threads.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.transitions: Deque[Tuple[float, str, str]] = deque(maxlen=100)
+        self._listeners: List[Callable[[str, str, str], None]] = []
+
+    def add_listener(self, listener: Callable[[str, str, str], None]):
+        """Register a callback(name, old_state, new_state) for state transitions."""
+        self._listeners.append(listener)
+
+    def _transition(self, new_state: str):
+        old_state = self.state
+        if old_state == new_state:
+            return
+        self.state = new_state
+        self.transitions.append((time.time(), old_state, new_state))
+        logger.warning(f"Circuit '{self.name}': {old_state} -> {new_state}")
+        for listener in self._listeners:
+            try:
+                listener(self.name, old_state, new_state)
+            except Exception as e:
+                logger.error(f"Circuit listener failed: {e}")
+
+    def allow(self) -> bool:
+        """Check whether a call may be made right now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition(self.HALF_OPEN)
+            # HALF_OPEN: only one probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.3, max_delay: float = 3.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class EndpointStats:
+    """Per-endpoint call counters and latency samples."""
+
+    def __init__(self, sample_size: int = 500):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, endpoint: str, latency: float, outcome: str):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0,
+                    'outcomes': {}, 'samples': deque(maxlen=self.sample_size),
+                }
+            stats['count'] += 1
+            stats['total'] += latency
+            stats['max'] = max(stats['max'], latency)
+            stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+            stats['samples'].append(latency)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Summary per endpoint: count, mean/p50/p95/max latency (seconds) and outcomes."""
+        result = {}
+        with self._lock:
+            for endpoint, stats in self._endpoints.items():
+                samples = sorted(stats['samples'])
+                result[endpoint] = {
+                    'count': stats['count'],
+                    'mean': stats['total'] / stats['count'] if stats['count'] else 0.0,
+                    'p50': _percentile(samples, 0.50),
+                    'p95': _percentile(samples, 0.95),
+                    'max': stats['max'],
+                    'outcomes': dict(stats['outcomes']),
+                }
+        return result
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return sorted_samples[index]
+
+
+class ResilientCaller:
+    """
+    Runs a call through the circuit breaker, retry policy and deadline budget.
+
+    The wrapped function receives the per-attempt timeout (seconds) and returns
+    a result; `classify` maps a result to 'ok', 'retry' (transient failure, the
+    API is unhealthy) or 'fail' (permanent failure, the API itself is healthy).
+    Exceptions listed in `transient_exceptions` are treated as 'retry'.
+
+    Backoff sleeps block the calling thread, so retries happen only on worker
+    threads (run_blocking / run_in_executor). Called directly from the event
+    loop, a call makes a single attempt instead of stalling every update.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        retry_policy: RetryPolicy,
+        stats: EndpointStats,
+        transient_exceptions: Tuple[type, ...] = (),
+        default_deadline: float = 15.0,
+        attempt_timeout: float = 10.0,
+    ):
+        self.breaker = breaker
+        self.retry_policy = retry_policy
+        self.stats = stats
+        self.transient_exceptions = transient_exceptions
+        self.default_deadline = default_deadline
+        self.attempt_timeout = attempt_timeout
+
+    def call(
+        self,
+        endpoint: str,
+        func: Callable[[float], Any],
+        classify: Callable[[Any], str],
+        idempotent: bool,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """
+        Execute `func` with retries (idempotent calls only) inside the deadline.
+
+        Returns:
+            The last result returned by `func`
+
+        Raises:
+            CircuitOpenError: the circuit is open
+            DeadlineExceeded: no time left for another attempt
+            The last transient exception if all attempts failed with one;
+            any other exception from `func` or `classify` immediately (counted
+            as a failure)
+        """
+        budget = deadline if deadline is not None else self.default_deadline
+        deadline_at = time.monotonic() + budget
+        max_attempts = self.retry_policy.max_attempts if idempotent else 1
+        if max_attempts > 1 and _on_event_loop():
+            logger.warning(f"{endpoint} called on the event loop thread, retries disabled; use run_blocking")
+            max_attempts = 1
+        attempt = 0
+
+        while True:
+            attempt += 1
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.stats.record(endpoint, 0.0, 'deadline')
+                raise DeadlineExceeded(f"{endpoint}: deadline of {budget:.1f}s exceeded")
+            if not self.breaker.allow():
+                self.stats.record(endpoint, 0.0, 'circuit_open')
+                raise CircuitOpenError(f"{endpoint}: circuit '{self.breaker.name}' is open")
+
+            started = time.monotonic()
+            try:
+                result = func(min(self.attempt_timeout, remaining))
+                outcome = classify(result)
+                error = None
+            except self.transient_exceptions as e:
+                result, outcome, error = None, 'retry', e
+            except BaseException:
+                # Иначе пробный вызов в half-open так и остался бы "в полёте"
+                self.breaker.record_failure()
+                self.stats.record(endpoint, time.monotonic() - started, 'error')
+                raise
+            latency = time.monotonic() - started
+
+            if outcome == 'retry':
+                self.breaker.record_failure()
+                self.stats.record(endpoint, latency, 'error' if error else 'transient')
+            else:
+                self.breaker.record_success()
+                self.stats.record(endpoint, latency, outcome)
+                return result
+
+            delay = self.retry_policy.backoff(attempt)
+            if attempt >= max_attempts or time.monotonic() + delay >= deadline_at:
+                if error:
+                    raise error
+                return result
+
+            logger.info(f"Retrying {endpoint} (attempt {attempt + 1}/{max_attempts}) in {delay:.2f}s")
+            time.sleep(delay)
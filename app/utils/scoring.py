@@ -0,0 +1,116 @@
+"""
+Scoring of the STEM-navigator test.
+
+SCORING_KEY lists, per scale, the answer codes ("7_B") that count for it.
+It is compiled once into an inverted map answer code -> scale positions, so
+an answer is scored with one dict lookup instead of a scan over every list,
+and a ScoreCard keeps running per-scale counters while the test is taken.
+
+Ties are broken by the order of scales in SCORING_KEY, so equal scores
+always give the same ranking whatever order the answers came in.
+
+In FSM the test keeps only the answered letters as a string ("ABCA...":
+position = question) and the counters, both a few bytes; answer codes are
+rebuilt from the letters when needed. score_batch() re-scores stored answer
+sets in bulk for analytics.
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.utils.test_content import QUESTIONS, SCORING_KEY
+
+# Порядок шкал — он же приоритет при равном счёте
+SCALES: Tuple[str, ...] = tuple(SCORING_KEY)
+# Код ответа -> позиции шкал, за которые он засчитывается
+ANSWER_SCALES: Dict[str, Tuple[int, ...]] = {}
+for _position, _scale in enumerate(SCALES):
+    for _code in SCORING_KEY[_scale]:
+        ANSWER_SCALES[_code] = ANSWER_SCALES.get(_code, ()) + (_position,)
+# Коды ответов каждого вопроса
+QUESTION_ANSWERS: Tuple[Tuple[str, ...], ...] = tuple(
+    tuple(answer['data'] for answer in question['answers']) for question in QUESTIONS
+)
+
+
+def answer_letter(code: str, question_index: int) -> Optional[str]:
+    """Letter of `code` if it answers question `question_index` (0-based), else None (stale button)."""
+    if not 0 <= question_index < len(QUESTION_ANSWERS) or code not in QUESTION_ANSWERS[question_index]:
+        return None
+    return code.rsplit('_', 1)[1]
+
+
+def answer_codes(answers: Union[str, Sequence[str]]) -> List[str]:
+    """Answer codes from the letters kept in FSM ("AB..." -> ["1_A", "2_B", ...]); lists of codes pass through."""
+    if isinstance(answers, str):
+        return [f"{i + 1}_{letter}" for i, letter in enumerate(answers)]
+    return list(answers)
+
+
+def answer_string(answers: Union[str, Sequence[str], None]) -> str:
+    """Letters kept in FSM; sessions saved before the letters format hold a list of codes (["1_A", ...])."""
+    if not answers:
+        return ""
+    if isinstance(answers, str):
+        return answers
+    return ''.join(str(code).rsplit('_', 1)[-1] for code in answers)
+
+
+def top_scales(scores: Sequence[int], limit: int = 3) -> List[Tuple[str, int]]:
+    """(scale, score) of the best scales with a non-zero score, ties in SCALES order."""
+    ranked = sorted(range(len(SCALES)), key=lambda i: (-scores[i], i))
+    return [(SCALES[i], scores[i]) for i in ranked[:limit] if scores[i] > 0]
+
+
+class ScoreCard:
+    """Running per-scale counters of one test attempt."""
+
+    __slots__ = ('scores',)
+
+    def __init__(self, scores: Optional[Sequence[int]] = None):
+        self.scores = list(scores) if scores and len(scores) == len(SCALES) else [0] * len(SCALES)
+
+    @classmethod
+    def from_answers(cls, answers: Union[str, Sequence[str]]) -> 'ScoreCard':
+        card = cls()
+        for code in answer_codes(answers):
+            card.add(code)
+        return card
+
+    def add(self, code: str):
+        for position in ANSWER_SCALES.get(code, ()):
+            self.scores[position] += 1
+
+    def top(self, limit: int = 3) -> List[Tuple[str, int]]:
+        return top_scales(self.scores, limit)
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(zip(SCALES, self.scores))
+
+
+def score_batch(answer_sets: Iterable[Union[str, Sequence[str]]]) -> List[Tuple[int, ...]]:
+    """Per-scale scores of many stored answer sets (letters or codes), in input order."""
+    # Одинаковые наборы ответов встречаются часто: каждый считается один раз
+    known: Dict[Tuple[str, ...], Tuple[int, ...]] = {}
+    results = []
+    for answers in answer_sets:
+        key = tuple(answers)
+        scores = known.get(key)
+        if scores is None:
+            totals = [0] * len(SCALES)
+            for code in answer_codes(answers):
+                for position in ANSWER_SCALES.get(code, ()):
+                    totals[position] += 1
+            scores = known[key] = tuple(totals)
+        results.append(scores)
+    return results
+
+
+def leading_scales(answer_sets: Iterable[Union[str, Sequence[str]]]) -> Counter:
+    """How many answer sets have each scale in first place."""
+    leaders = Counter()
+    for scores in score_batch(answer_sets):
+        top = top_scales(scores, 1)
+        if top:
+            leaders[top[0][0]] += 1
+    return leaders
@@ -0,0 +1,209 @@
+"""
+In-memory full-text search with Russian/Uzbek transliteration folding.
+
+Text is folded to one Latin spelling before tokenizing: Russian and Uzbek
+Cyrillic are transliterated, Uzbek Latin apostrophes are dropped and letters
+spelled differently by the two alphabets are merged (х/x/kh -> h, қ/q -> k,
+ж/zh -> j, ...), so "Ташкент", "toshkent" and "Тошкент" meet. Every token is
+also indexed by its consonant skeleton ("tshknt"), which catches vowel
+differences between Russian and Uzbek names (Андижан / Andijon) as a weaker
+match.
+
+The index is inverted (token -> document IDs) with sorted vocabularies, so a
+query term is matched as a prefix with bisect. Documents are grouped by
+source (e.g. one worksheet); replace_source() swaps the documents of one
+source without touching the rest, which makes rebuilds incremental.
+"""
+
+import bisect
+import functools
+import heapq
+import itertools
+import re
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ғ': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'қ': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ў': 'o', 'ф': 'f', 'х': 'h', 'ҳ': 'h',
+    'ц': 's', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+}
+_TRANSLIT = str.maketrans(CYRILLIC_TO_LATIN)
+_APOSTROPHES = re.compile(r"[ʻʼ'`’‘]")
+# Разные латинские записи одного звука
+_LATIN_FOLDS = [('kh', 'h'), ('zh', 'j'), ('dj', 'j'), ('x', 'h'), ('q', 'k'), ('w', 'v')]
+_TOKEN = re.compile(r'[a-z0-9]+')
+_VOWELS = re.compile(r'[aeiouy]')
+
+MIN_PREFIX = 2
+
+# Баллы за совпадение одного слова запроса
+EXACT, PREFIX, SKELETON, TITLE_BONUS = 3.0, 2.0, 1.0, 0.5
+
+
+def fold(text: str) -> str:
+    """Lowercase Latin spelling of RU/UZ text used for matching."""
+    text = _APOSTROPHES.sub('', str(text).lower()).translate(_TRANSLIT)
+    for source, target in _LATIN_FOLDS:
+        text = text.replace(source, target)
+    return text
+
+
+@functools.lru_cache(maxsize=65536)
+def tokenize(text: str) -> Tuple[str, ...]:
+    # Названия вуза и города повторяются в каждом документе его программ
+    return tuple(_TOKEN.findall(fold(text)))
+
+
+@functools.lru_cache(maxsize=65536)
+def skeleton(token: str) -> str:
+    """Consonants of a folded token with repeats collapsed ('toshkent' -> 'tshknt')."""
+    consonants = _VOWELS.sub('', token)
+    return ''.join(ch for ch, _ in itertools.groupby(consonants))
+
+
+class SearchDocument:
+    """One search hit: what to show and what to do when it is picked."""
+
+    __slots__ = ('doc_id', 'kind', 'title', 'subtitle', 'payload')
+
+    def __init__(self, kind: str, title: str, subtitle: str = '', payload: Any = None):
+        self.doc_id = 0
+        self.kind = kind
+        self.title = title
+        self.subtitle = subtitle
+        self.payload = payload
+
+
+class SearchIndex:
+    """Inverted index with prefix and skeleton matching, updated per source."""
+
+    def __init__(self, kind_order: Sequence[str] = ()):
+        """
+        Args:
+            kind_order: Document kinds from most to least preferred on equal score
+        """
+        self.kind_rank = {kind: i for i, kind in enumerate(kind_order)}
+        self._ids = itertools.count(1)
+        self._docs: Dict[int, SearchDocument] = {}
+        self._sources: Dict[Hashable, List[int]] = {}
+        # doc_id -> (все токены, токены заголовка, скелеты, скелеты заголовка)
+        self._doc_terms: Dict[int, Tuple[Set[str], Set[str], Set[str], Set[str]]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._skeletons: Dict[str, Set[int]] = defaultdict(set)
+        self._vocab: List[str] = []
+        self._skeleton_vocab: List[str] = []
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def get(self, doc_id: int) -> Optional[SearchDocument]:
+        return self._docs.get(doc_id)
+
+    def replace_source(self, source: Hashable, documents: Iterable[Tuple[SearchDocument, str]]):
+        """
+        Replace all documents of a source.
+
+        Args:
+            source: Key of the source (e.g. (sheet_id, worksheet title))
+            documents: (document, extra searchable text) pairs; the title is always searchable
+        """
+        for doc_id in self._sources.pop(source, ()):
+            self._remove(doc_id)
+        ids = []
+        for document, extra_text in documents:
+            document.doc_id = next(self._ids)
+            self._add(document, extra_text)
+            ids.append(document.doc_id)
+        if ids:
+            self._sources[source] = ids
+        self._dirty = True
+
+    def remove_source(self, source: Hashable):
+        self.replace_source(source, ())
+
+    def search(self, query: str, limit: int = 10) -> List[SearchDocument]:
+        """Documents matching every word of the query (as a prefix), best first."""
+        return [document for _, document in self.ranked(query, limit)]
+
+    def ranked(self, query: str, limit: int = 10) -> List[Tuple[float, SearchDocument]]:
+        """Same as search() with scores, for merging results of several indexes."""
+        terms = tokenize(query)
+        # Отдельные буквы почти ничего не отсекают; числа (номера вузов) оставляем
+        terms = [t for t in terms if len(t) >= MIN_PREFIX or t.isdigit()] or terms
+        if not terms:
+            return []
+        if self._dirty:
+            self._vocab = sorted(self._postings)
+            self._skeleton_vocab = sorted(self._skeletons)
+            self._dirty = False
+
+        scores: Optional[Dict[int, float]] = None
+        for term in dict.fromkeys(terms):
+            term_scores = self._match(term, candidates=scores)
+            scores = term_scores if scores is None else {
+                doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores
+            }
+            if not scores:
+                return []
+
+        last = len(self.kind_rank)
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (
+            -item[1], self.kind_rank.get(self._docs[item[0]].kind, last), len(self._docs[item[0]].title), item[0]
+        ))
+        return [(score, self._docs[doc_id]) for doc_id, score in best]
+
+    # --- Внутреннее ---
+
+    def _match(self, term: str, candidates: Optional[Dict[int, float]]) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for token in self._prefixed(self._vocab, term):
+            self._score(scores, self._postings[token], token, 1, EXACT if token == term else PREFIX, candidates)
+        term_skeleton = skeleton(term)
+        if len(term_skeleton) >= MIN_PREFIX:
+            for key in self._prefixed(self._skeleton_vocab, term_skeleton):
+                self._score(scores, self._skeletons[key], key, 3, SKELETON, candidates)
+        return scores
+
+    def _score(self, scores: Dict[int, float], doc_ids: Set[int], key: str, title_field: int, weight: float,
+               candidates: Optional[Dict[int, float]]):
+        """Keep the best weight per document; matches in the title get a bonus."""
+        for doc_id in doc_ids:
+            if candidates is not None and doc_id not in candidates:
+                continue
+            score = weight + TITLE_BONUS if key in self._doc_terms[doc_id][title_field] else weight
+            if score > scores.get(doc_id, 0):
+                scores[doc_id] = score
+
+    @staticmethod
+    def _prefixed(vocab: List[str], prefix: str) -> Iterable[str]:
+        i = bisect.bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            yield vocab[i]
+            i += 1
+
+    def _add(self, document: SearchDocument, extra_text: str):
+        title_tokens = set(tokenize(document.title))
+        tokens = title_tokens | set(tokenize(extra_text))
+        skeletons = {s for s in map(skeleton, tokens) if len(s) >= MIN_PREFIX}
+        title_skeletons = {s for s in map(skeleton, title_tokens) if len(s) >= MIN_PREFIX}
+        self._docs[document.doc_id] = document
+        self._doc_terms[document.doc_id] = (tokens, title_tokens, skeletons, title_skeletons)
+        for token in tokens:
+            self._postings[token].add(document.doc_id)
+        for key in skeletons:
+            self._skeletons[key].add(document.doc_id)
+
+    def _remove(self, doc_id: int):
+        self._docs.pop(doc_id, None)
+        tokens, _, skeletons, _ = self._doc_terms.pop(doc_id, (set(), set(), set(), set()))
+        for index, keys in ((self._postings, tokens), (self._skeletons, skeletons)):
+            for key in keys:
+                postings = index.get(key)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del index[key]
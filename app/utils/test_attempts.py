@@ -0,0 +1,235 @@
+"""
+Append-only log of STEM-navigator test attempts and scale analytics over it.
+
+Every finished test becomes one JSON line (time, Telegram ID, role, child,
+city, age, answers, per-scale scores and leading scales) in
+TEST_ATTEMPTS_PATH. record() only queues the attempt; a background writer
+appends the queue every TEST_ATTEMPTS_FLUSH_INTERVAL seconds on a worker
+thread, so a finished test never waits for the disk.
+
+ScaleAggregates keeps attempts, leading-scale counts and score sums per
+city, age and role, updated one attempt at a time. Next to the log it is
+checkpointed together with the log size it covers; on startup the
+checkpoint is loaded and only the lines appended after it are replayed,
+instead of rescanning the whole history.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import TEST_ATTEMPTS_PATH, TEST_ATTEMPTS_FLUSH_INTERVAL
+from app.utils.locations import CITIES_RU, CITIES_UZ, REGIONS_UZ
+from app.utils.metrics import REGISTRY
+from app.utils.scoring import SCALES, ScoreCard
+from app.utils.university_overview import CityNormalizer
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('all', 'city', 'age', 'role')
+UNKNOWN = 'не указано'
+
+_normalize_city = CityNormalizer({
+    **{city: city for city in CITIES_RU}, **dict(zip(CITIES_UZ, CITIES_RU)), **REGIONS_UZ
+})
+
+
+def make_attempt(user_id: int, role: str, answers: str, card: ScoreCard, child: Optional[str] = None,
+                 city: Optional[str] = None, age: Optional[int] = None) -> Dict[str, Any]:
+    """One log line: identity, answers and scores of a finished test."""
+    return {
+        'ts': datetime.now().isoformat(timespec='seconds'),
+        'user_id': user_id,
+        'role': role,
+        'child': child,
+        'city': _normalize_city(city) if city else None,
+        'age': age,
+        'answers': answers,
+        'scores': card.as_dict(),
+        'top': [scale for scale, _ in card.top(3)],
+    }
+
+
+class ScaleAggregates:
+    """Attempts, leading scales and score sums per dimension value."""
+
+    def __init__(self, data: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None):
+        # измерение -> значение -> {'attempts': n, 'leaders': {шкала: n}, 'scores': {шкала: сумма}}
+        self.data = data or {dimension: {} for dimension in DIMENSIONS}
+
+    def add(self, attempt: Dict[str, Any]):
+        scores = attempt.get('scores') or {}
+        leader = (attempt.get('top') or [None])[0]
+        for dimension in DIMENSIONS:
+            value = 'all' if dimension == 'all' else attempt.get(dimension)
+            bucket = self.data.setdefault(dimension, {}).setdefault(
+                UNKNOWN if value in (None, '') else str(value),
+                {'attempts': 0, 'leaders': {}, 'scores': {}}
+            )
+            bucket['attempts'] += 1
+            if leader:
+                bucket['leaders'][leader] = bucket['leaders'].get(leader, 0) + 1
+            for scale, score in scores.items():
+                bucket['scores'][scale] = bucket['scores'].get(scale, 0) + score
+
+    def distribution(self, dimension: str) -> List[Tuple[str, int, Dict[str, float]]]:
+        """(value, attempts, share of attempts led by each scale), most attempts first."""
+        rows = []
+        for value, bucket in self.data.get(dimension, {}).items():
+            attempts = bucket['attempts']
+            shares = {scale: bucket['leaders'].get(scale, 0) / attempts for scale in SCALES}
+            rows.append((value, attempts, shares))
+        return sorted(rows, key=lambda row: (-row[1], row[0]))
+
+    def mean_scores(self, dimension: str, value: str) -> Dict[str, float]:
+        bucket = self.data.get(dimension, {}).get(value)
+        if not bucket:
+            return {}
+        return {scale: bucket['scores'].get(scale, 0) / bucket['attempts'] for scale in SCALES}
+
+    def copy(self) -> 'ScaleAggregates':
+        return ScaleAggregates(json.loads(json.dumps(self.data)))
+
+
+class TestAttemptStore:
+    """Queue -> background writer -> JSONL log, with live and checkpointed aggregates."""
+
+    def __init__(self, path: str = TEST_ATTEMPTS_PATH, flush_interval: float = TEST_ATTEMPTS_FLUSH_INTERVAL):
+        """
+        Args:
+            path: JSONL log; the aggregates checkpoint is kept next to it
+            flush_interval: Seconds attempts are queued before being appended
+        """
+        self.path = path
+        self.checkpoint_path = f"{path}.aggregates.json"
+        self.flush_interval = flush_interval
+        # Все принятые попытки, в том числе ещё не записанные
+        self.aggregates = ScaleAggregates()
+        # Только записанные в лог: их и сохраняем вместе с размером лога
+        self._persisted = ScaleAggregates()
+        self._offset = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'recorded': 0, 'written': 0, 'replayed': 0, 'errors': 0}
+        REGISTRY.add_collector('test_attempts', self.collect_metrics)
+
+    def record(self, attempt: Dict[str, Any]):
+        """Queue an attempt for the log and count it in the aggregates right away."""
+        self._pending.append(attempt)
+        self.stats['recorded'] += 1
+        if self._loaded:
+            self.aggregates.add(attempt)
+
+    async def start(self):
+        """Load the checkpoint, replay the log after it and start the writer; registered on startup."""
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._load)
+        except OSError as e:
+            logger.error(f"Test attempts log unreadable, analytics start empty: {e}")
+        # Попытки, принятые до загрузки, добавляются поверх истории
+        self.aggregates = self._persisted.copy()
+        for attempt in self._pending:
+            self.aggregates.add(attempt)
+        self._loaded = True
+        self._task = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._loaded:
+            await self.flush()
+
+    async def flush(self):
+        """Append queued attempts to the log and checkpoint the aggregates."""
+        if not self._pending:
+            return
+        attempts, self._pending = self._pending, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._append, attempts)
+        except OSError as e:
+            self.stats['errors'] += 1
+            logger.error(f"Failed to write {len(attempts)} test attempts, will retry: {e}")
+            self._pending[:0] = attempts
+            return
+        self.stats['written'] += len(attempts)
+
+    async def _writer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # --- Файлы (выполняются в потоке) ---
+
+    def _load(self):
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            self._persisted = ScaleAggregates(checkpoint['aggregates'])
+            self._offset = checkpoint['offset']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logger.error(f"Ignoring unreadable test attempts checkpoint: {e}")
+            self._persisted, self._offset = ScaleAggregates(), 0
+        if not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) < self._offset:
+            # Лог заменили или обрезали: считаем заново
+            self._persisted, self._offset = ScaleAggregates(), 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Недописанная строка после сбоя — допишется следующая запись
+                    break
+                self._offset += len(line)
+                try:
+                    self._persisted.add(json.loads(line))
+                    self.stats['replayed'] += 1
+                except ValueError:
+                    logger.warning(f"Skipping malformed test attempt at byte {self._offset - len(line)}")
+        if self.stats['replayed']:
+            self._save_checkpoint()
+
+    def _append(self, attempts: List[Dict[str, Any]]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = ''.join(json.dumps(attempt, ensure_ascii=False) + '\n' for attempt in attempts).encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            self._offset = f.tell()
+        for attempt in attempts:
+            self._persisted.add(attempt)
+        try:
+            self._save_checkpoint()
+        except OSError as e:
+            # Попытки уже в логе; при следующем старте они просто будут дочитаны из него
+            logger.error(f"Failed to checkpoint test attempt aggregates: {e}")
+
+    def _save_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'offset': self._offset, 'aggregates': self._persisted.data}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def collect_metrics(self):
+        yield 'bot_test_attempts_pending', 'gauge', {}, len(self._pending)
+        for result in ('recorded', 'written', 'errors'):
+            yield 'bot_test_attempts_total', 'counter', {'result': result}, self.stats[result]
+        leaders = self.aggregates.data.get('all', {}).get('all', {}).get('leaders', {})
+        for scale in SCALES:
+            yield 'bot_test_attempts_leading_scale', 'gauge', {'scale': scale}, leaders.get(scale, 0)
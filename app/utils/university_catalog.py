@@ -0,0 +1,328 @@
+"""
+In-memory copy of every university spreadsheet, kept for search.
+
+The drill-down (city -> type -> university -> faculty -> program) reads one
+worksheet per step. Search needs all of them at once, so the catalog loads
+every state (per city), private and foreign spreadsheet with one batch
+request each, concurrently, and feeds a SearchIndex with one document per
+university, faculty and program. Program rows are also parsed into typed
+facets (score, cost, exams, ...) for filtering, keyed by the same document IDs,
+and every university is summarized into the nationwide view
+(app/utils/university_overview.py). Spreadsheets are fetched with at most
+UNIVERSITY_CATALOG_CONCURRENCY requests in flight, leaving the rest of the
+Sheets slots to user requests.
+
+Refreshes are incremental: a spreadsheet whose Drive modification time has
+not changed is skipped without reading its values, and inside a changed
+spreadsheet only worksheets whose content hash changed are reindexed (all of
+them if the 'Universities' list itself changed, since university names and
+cities are part of every program document).
+
+Records are stored exactly as get_all_records() returns them, so snapshots
+registered from the catalog share IDs with the ones the drill-down creates
+while the catalog is still loading. The drill-down gets its university and
+program lists as snapshot IDs from here: each list is hashed into the
+CatalogRegistry once after its worksheet changes, not on every click.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import (
+    UNIVERSITY_CATALOG_REFRESH, UNIVERSITY_CATALOG_CONCURRENCY,
+    PRIVATE_UNIVERSITIES_SHEET_ID, FOREIGN_UNIVERSITIES_SHEET_ID
+)
+from app.utils.backends import run_blocking, SHEETS
+from app.utils.catalog import CatalogRegistry
+from app.utils.google_sheets import UniversitiesGSheet
+from app.utils.locations import CITIES_RU, CITIES_UZ, REGIONS_UZ
+from app.utils.metrics import REGISTRY
+from app.utils.program_filters import FacetIndex, ProgramFacets
+from app.utils.search import SearchDocument, SearchIndex
+from app.utils.university_overview import (
+    STATE, PRIVATE, FOREIGN, TYPE_COLUMNS, CityNormalizer, NationwideView, UniversitySummary, normalize_type
+)
+
+logger = logging.getLogger(__name__)
+
+UNIVERSITIES_WORKSHEET = 'Universities'
+
+# Виды документов в порядке показа при равном счёте
+UNIVERSITY, FACULTY, PROGRAM = 'university', 'faculty', 'program'
+KIND_ORDER = (UNIVERSITY, FACULTY, PROGRAM)
+
+
+def new_search_index() -> SearchIndex:
+    return SearchIndex(kind_order=KIND_ORDER)
+
+
+class UniversityCatalog:
+    """All university spreadsheets in memory plus their search index."""
+
+    def __init__(
+        self,
+        universities_manager: UniversitiesGSheet,
+        state_uni_ids_by_city: Dict[str, Optional[str]],
+        index: SearchIndex,
+        interval: float = UNIVERSITY_CATALOG_REFRESH,
+        concurrency: int = UNIVERSITY_CATALOG_CONCURRENCY
+    ):
+        """
+        Args:
+            universities_manager: Manager whose gspread client is used for reading
+            state_uni_ids_by_city: City -> spreadsheet ID of its state universities
+            index: Index the documents are written to
+            interval: Seconds between refreshes (0 loads once)
+            concurrency: Spreadsheets fetched at the same time
+        """
+        self.universities_manager = universities_manager
+        self.index = index
+        self.facets = FacetIndex()
+        self.overview = NationwideView()
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        # sheet_id -> (тип вуза, город для государственных)
+        self.sources: Dict[str, Tuple[str, Optional[str]]] = {}
+        for city, sheet_id in state_uni_ids_by_city.items():
+            if sheet_id and sheet_id not in self.sources:
+                self.sources[sheet_id] = (STATE, city)
+        for sheet_id, uni_type in ((PRIVATE_UNIVERSITIES_SHEET_ID, PRIVATE), (FOREIGN_UNIVERSITIES_SHEET_ID, FOREIGN)):
+            if sheet_id and sheet_id not in self.sources:
+                self.sources[sheet_id] = (uni_type, None)
+
+        aliases = {city: city for city in state_uni_ids_by_city}
+        aliases.update({city: city for city in CITIES_RU})
+        aliases.update(zip(CITIES_UZ, CITIES_RU))
+        aliases.update(REGIONS_UZ)
+        self.normalize_city = CityNormalizer(aliases)
+
+        # (sheet_id, название вкладки) -> записи
+        self.worksheets: Dict[Tuple[str, str], Tuple[Dict[str, Any], ...]] = {}
+        self._versions: Dict[str, Optional[str]] = {}
+        self._hashes: Dict[Tuple[str, str], str] = {}
+        # Для сводки вузов: фасеты программ вкладки и ID документов вузов в порядке строк
+        self._worksheet_facets: Dict[Tuple[str, str], List[ProgramFacets]] = {}
+        self._worksheet_faculties: Dict[Tuple[str, str], int] = {}
+        self._university_docs: Dict[str, List[int]] = {}
+        # (sheet_id, вкладка, город) -> ID снимка в CatalogRegistry; сбрасывается, когда вкладка меняется
+        self._snapshot_ids: Dict[Tuple[str, str, Optional[str]], str] = {}
+        self.loaded = False
+        self.stats = {'refreshes': 0, 'sheets_changed': 0, 'worksheets_reindexed': 0, 'errors': 0,
+                      'last_refresh_seconds': 0.0}
+        self._task: Optional[asyncio.Task] = None
+        REGISTRY.add_collector('university_catalog', self.collect_metrics)
+
+    # --- Периодическое обновление ---
+
+    async def start(self):
+        """Load the catalog and keep it fresh; registered on dispatcher startup."""
+        if self._task is None and self.sources:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"University catalog refresh failed: {e}", exc_info=True)
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Fetch all spreadsheets concurrently and reindex what changed."""
+        started = time.perf_counter()
+        sheet_ids = list(self.sources)
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(sheet_id: str):
+            async with limit:
+                return await run_blocking(
+                    SHEETS, self.universities_manager.fetch_spreadsheet, sheet_id, self._versions.get(sheet_id)
+                )
+
+        results = await asyncio.gather(*map(fetch, sheet_ids), return_exceptions=True)
+
+        for sheet_id, result in zip(sheet_ids, results):
+            if isinstance(result, Exception):
+                # Старые данные таблицы остаются в индексе до следующей попытки
+                self.stats['errors'] += 1
+                logger.error(f"Failed to load university sheet {sheet_id}: {result}")
+            elif result is not None:
+                version, worksheets = result
+                self._apply(sheet_id, worksheets)
+                self._versions[sheet_id] = version
+                # Индексация идёт в цикле событий: отдаём управление между таблицами
+                await asyncio.sleep(0)
+
+        self.loaded = True
+        self.stats['refreshes'] += 1
+        self.stats['last_refresh_seconds'] = time.perf_counter() - started
+        logger.info(f"University catalog refreshed in {self.stats['last_refresh_seconds']:.2f}s: "
+                    f"{len(self.index)} documents")
+        return self.stats
+
+    # --- Данные для обработчиков ---
+
+    def universities(self, sheet_id: str, city: Optional[str]) -> List[Dict[str, Any]]:
+        """Same list get_universities_by_city_and_type() returns (city filter for private/foreign)."""
+        records = self.worksheets.get((sheet_id, UNIVERSITIES_WORKSHEET), ())
+        if self.sources.get(sheet_id, (STATE,))[0] == STATE:
+            return list(records)
+        city = (city or '').lower()
+        return [uni for uni in records if str(uni.get('Город', '')).lower() == city]
+
+    def programs(self, sheet_id: str, sheet_name: str) -> List[Dict[str, Any]]:
+        return list(self.worksheets.get((sheet_id, sheet_name), ()))
+
+    def has(self, sheet_id: str) -> bool:
+        """True once the spreadsheet has been loaded, so the drill-down can be served from memory."""
+        return (sheet_id, UNIVERSITIES_WORKSHEET) in self.worksheets
+
+    def universities_snapshot(self, registry: CatalogRegistry, sheet_id: str, city: Optional[str]) -> Optional[str]:
+        """Snapshot ID of universities(sheet_id, city), or None if the list is empty."""
+        key_city = None if self.sources.get(sheet_id, (STATE,))[0] == STATE else (city or '').lower()
+        return self._snapshot(registry, (sheet_id, UNIVERSITIES_WORKSHEET, key_city),
+                              lambda: self.universities(sheet_id, city))
+
+    def programs_snapshot(self, registry: CatalogRegistry, sheet_id: str, sheet_name: str) -> Optional[str]:
+        """Snapshot ID of programs(sheet_id, sheet_name), or None if the worksheet is empty or missing."""
+        return self._snapshot(registry, (sheet_id, sheet_name, None), lambda: self.programs(sheet_id, sheet_name))
+
+    def _snapshot(self, registry: CatalogRegistry, key: Tuple[str, str, Optional[str]], records) -> Optional[str]:
+        snapshot_id = self._snapshot_ids.get(key)
+        # Реестр ограничен по размеру: вытесненный снимок регистрируется заново
+        if snapshot_id is not None and registry.get(snapshot_id) is not None:
+            return snapshot_id
+        found = records()
+        if not found:
+            return None
+        snapshot_id = self._snapshot_ids[key] = registry.put(found)
+        return snapshot_id
+
+    # --- Индексация ---
+
+    def _apply(self, sheet_id: str, worksheets: Dict[str, List[Dict[str, Any]]]):
+        """Store a fetched spreadsheet and reindex its changed worksheets."""
+        hashes = {title: CatalogRegistry.snapshot_id(records) for title, records in worksheets.items()}
+        known = {title for (sid, title) in self._hashes if sid == sheet_id}
+        changed = {title for title, digest in hashes.items() if self._hashes.get((sheet_id, title)) != digest}
+        removed = known - set(hashes)
+        if not changed and not removed:
+            return
+        self.stats['sheets_changed'] += 1
+        for key in [key for key in self._snapshot_ids if key[0] == sheet_id and key[1] in changed | removed]:
+            del self._snapshot_ids[key]
+
+        for title in removed:
+            self.worksheets.pop((sheet_id, title), None)
+            self._hashes.pop((sheet_id, title), None)
+            self.index.remove_source((sheet_id, title))
+            self.facets.remove_source((sheet_id, title))
+            self._worksheet_facets.pop((sheet_id, title), None)
+            self._worksheet_faculties.pop((sheet_id, title), None)
+        for title in changed:
+            self.worksheets[(sheet_id, title)] = tuple(worksheets[title])
+            self._hashes[(sheet_id, title)] = hashes[title]
+
+        universities = self._university_rows(sheet_id)
+        if UNIVERSITIES_WORKSHEET in changed or UNIVERSITIES_WORKSHEET in removed:
+            reindex = set(hashes)
+        else:
+            reindex = changed
+        for title in reindex:
+            if title == UNIVERSITIES_WORKSHEET:
+                docs = [self._university_document(sheet_id, *row) for row in universities]
+            else:
+                docs = [doc for row in universities if row[2].get('sheet_name') == title
+                        for doc in self._program_documents(sheet_id, *row)]
+            self.index.replace_source((sheet_id, title), docs)
+            if title == UNIVERSITIES_WORKSHEET:
+                self._university_docs[sheet_id] = [doc.doc_id for doc, _ in docs]
+            else:
+                programs = self.worksheets.get((sheet_id, title), ())
+                entries = [
+                    (doc.doc_id, ProgramFacets(programs[doc.payload['program_row']], doc.payload['city'], doc.payload['uni_type']))
+                    for doc, _ in docs if doc.kind == PROGRAM
+                ]
+                self.facets.replace_source((sheet_id, title), entries)
+                self._worksheet_facets[(sheet_id, title)] = [facets for _, facets in entries]
+                self._worksheet_faculties[(sheet_id, title)] = sum(1 for doc, _ in docs if doc.kind == FACULTY)
+            self.stats['worksheets_reindexed'] += 1
+        self.overview.replace_source(sheet_id, self._summaries(sheet_id, universities))
+
+    def _university_rows(self, sheet_id: str) -> List[Tuple[str, int, Dict[str, Any]]]:
+        """(город, номер вуза в списке этого города, запись) для строк 'Universities'."""
+        uni_type, state_city = self.sources[sheet_id]
+        positions: Dict[str, int] = {}
+        rows = []
+        for uni in self.worksheets.get((sheet_id, UNIVERSITIES_WORKSHEET), ()):
+            city = state_city or str(uni.get('Город', ''))
+            # Для частных и иностранных список фильтруется по городу, как в обычной навигации
+            key = '' if state_city else city.lower()
+            position = positions.get(key, 0)
+            positions[key] = position + 1
+            rows.append((city, position, uni))
+        return rows
+
+    def _summaries(self, sheet_id: str, universities: List[Tuple[str, int, Dict[str, Any]]]):
+        """Rows of the nationwide view for one spreadsheet."""
+        uni_type = self.sources[sheet_id][0]
+        doc_ids = self._university_docs.get(sheet_id, [])
+        for (city, _, uni), doc_id in zip(universities, doc_ids):
+            key = (sheet_id, uni.get('sheet_name'))
+            type_value = next((uni[c] for c in TYPE_COLUMNS if uni.get(c)), None)
+            yield UniversitySummary(
+                doc_id, str(uni.get('Наименования ВОУ', 'N/A')), self.normalize_city(city),
+                normalize_type(type_value, uni_type), self._worksheet_faculties.get(key, 0),
+                self._worksheet_facets.get(key, ())
+            )
+
+    def _payload(self, sheet_id: str, city: str, uni_index: int, uni: Dict[str, Any], **extra) -> Dict[str, Any]:
+        return {'sheet_id': sheet_id, 'uni_type': self.sources[sheet_id][0], 'city': city,
+                'uni_index': uni_index, 'sheet_name': uni.get('sheet_name'), **extra}
+
+    def _university_document(self, sheet_id: str, city: str, uni_index: int, uni: Dict[str, Any]):
+        name = str(uni.get('Наименования ВОУ', 'N/A'))
+        uni_type = self.sources[sheet_id][0]
+        document = SearchDocument(UNIVERSITY, name, f"{city}, {uni_type.lower()}",
+                                  self._payload(sheet_id, city, uni_index, uni))
+        return document, f"{city} {uni_type}"
+
+    def _program_documents(self, sheet_id: str, city: str, uni_index: int, uni: Dict[str, Any]):
+        name = str(uni.get('Наименования ВОУ', 'N/A'))
+        programs = self.worksheets.get((sheet_id, uni.get('sheet_name')), ())
+        faculties = set()
+        for row, program in enumerate(programs):
+            faculty = program.get('Название факультета')
+            if not faculty:
+                continue
+            if faculty not in faculties:
+                faculties.add(faculty)
+                yield (SearchDocument(FACULTY, str(faculty), name,
+                                      self._payload(sheet_id, city, uni_index, uni, faculty=faculty)),
+                       f"{name} {city}")
+            title = program.get('Название программы')
+            if title:
+                yield (SearchDocument(PROGRAM, str(title), f"{name}, {faculty}",
+                                      self._payload(sheet_id, city, uni_index, uni, faculty=faculty, program_row=row)),
+                       f"{faculty} {name} {city} {program.get('Язык обучения', '')}")
+
+    def collect_metrics(self):
+        yield 'bot_university_search_documents', 'gauge', {}, len(self.index)
+        yield 'bot_university_catalog_worksheets', 'gauge', {}, len(self.worksheets)
+        yield 'bot_university_catalog_refresh_seconds', 'gauge', {}, self.stats['last_refresh_seconds']
+        yield 'bot_university_catalog_errors_total', 'counter', {}, self.stats['errors']
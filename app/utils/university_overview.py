@@ -0,0 +1,162 @@
+"""
+Nationwide view of all universities, materialized from the university catalog.
+
+Each state spreadsheet covers one city and the private and foreign ones mix
+cities, each typed by hand ("г. Ташкент", "Toshkent sh.", "TASHKENT"). The
+view keeps one summary row per university with the city and type
+normalized to one spelling and the program facets aggregated (number of
+programs, budget programs, lowest admission score and cost), so "all
+regions" screens and rankings are answered from memory.
+
+Rows are replaced per spreadsheet when the catalog reindexes it; sorted
+orders and region totals are rebuilt lazily on the first read after a
+change, and filtered rankings are memoized until the next change.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.utils.program_filters import ProgramFacets
+from app.utils.search import fold, skeleton, tokenize
+
+STATE, PRIVATE, FOREIGN = 'Государственный', 'Частный', 'Иностранный'
+
+# Колонки листа 'Universities', в которых может быть указан тип вуза
+TYPE_COLUMNS = ("Тип вуза", "Тип", "Форма собственности")
+# Начала слов (после fold) для каждого типа; 'негосударственный' проверяется раньше 'государственного'
+_TYPE_WORDS = (
+    (PRIVATE, ('chast', 'negos', 'hususiy', 'nodavlat', 'private')),
+    (FOREIGN, ('inostr', 'zarubej', 'horijiy', 'foreign', 'filial', 'mejdunar', 'halkaro')),
+    (STATE, ('gos', 'davlat', 'state')),
+)
+# Слова вокруг названия города: "г. Ташкент", "Toshkent shahri", "Самаркандская область"
+_CITY_NOISE = {'g', 'gorod', 'sh', 'shahri', 'shahar', 'city', 'oblast', 'viloyati', 'viloyat', 'region',
+               'respublika', 'respublikasi', 'tumani', 'rayon'}
+_ADJECTIVE_ENDING = re.compile(r'(skaya|skiy|sk)$')
+
+SORTS = ('name', 'score', 'cost', 'budget', 'programs')
+
+
+class CityNormalizer:
+    """Maps any RU/UZ spelling of a known city to its canonical (Russian) name."""
+
+    def __init__(self, aliases: Dict[str, str]):
+        """
+        Args:
+            aliases: Spelling -> canonical name; canonical names map to themselves
+        """
+        self._exact: Dict[str, str] = {}
+        self._skeletons: Dict[str, str] = {}
+        for alias, canonical in aliases.items():
+            key = self._key(alias)
+            self._exact.setdefault(key, canonical)
+            self._skeletons.setdefault(skeleton(key), canonical)
+
+    @staticmethod
+    def _key(name: str) -> str:
+        tokens = [t for t in tokenize(name) if t not in _CITY_NOISE]
+        return _ADJECTIVE_ENDING.sub('', ''.join(tokens)) if len(tokens) == 1 else ''.join(tokens)
+
+    def __call__(self, name: str) -> str:
+        name = str(name or '').strip()
+        key = self._key(name)
+        if not key:
+            return name
+        return self._exact.get(key) or self._skeletons.get(skeleton(key)) or name[:1].upper() + name[1:]
+
+
+def normalize_type(value, default: str) -> str:
+    """Type written in a 'Тип' column (any language), or the spreadsheet's type."""
+    for word in tokenize(str(value or '')):
+        for uni_type, starts in _TYPE_WORDS:
+            if word.startswith(starts):
+                return uni_type
+    return default
+
+
+class UniversitySummary:
+    """One university with its programs' facets aggregated."""
+
+    __slots__ = ('doc_id', 'name', 'city', 'uni_type', 'faculties', 'programs', 'budget_programs',
+                 'min_score', 'min_cost', 'dormitory', 'stipend', 'sort_name')
+
+    def __init__(self, doc_id: int, name: str, city: str, uni_type: str, faculties: int,
+                 facets: Sequence[ProgramFacets]):
+        self.doc_id = doc_id
+        self.name = name
+        self.city = city
+        self.uni_type = uni_type
+        self.faculties = faculties
+        self.programs = len(facets)
+        self.budget_programs = sum(1 for f in facets if f.budget)
+        scores = [f.min_score for f in facets if f.min_score is not None]
+        costs = [f.cost for f in facets if f.cost is not None and f.currency == 'UZS']
+        self.min_score = min(scores) if scores else None
+        self.min_cost = min(costs) if costs else None
+        self.dormitory = any(f.dormitory for f in facets)
+        self.stipend = any(f.stipend for f in facets)
+        self.sort_name = fold(name)
+
+
+def _sort_key(sort: str):
+    missing = float('inf')
+    if sort == 'score':
+        return lambda s: (s.min_score if s.min_score is not None else missing, s.sort_name)
+    if sort == 'cost':
+        return lambda s: (s.min_cost if s.min_cost is not None else missing, s.sort_name)
+    if sort == 'budget':
+        return lambda s: (-s.budget_programs, s.sort_name)
+    if sort == 'programs':
+        return lambda s: (-s.programs, s.sort_name)
+    return lambda s: s.sort_name
+
+
+class NationwideView:
+    """Summaries of all universities with precomputed orders and region totals."""
+
+    def __init__(self):
+        self._sources: Dict[str, Tuple[UniversitySummary, ...]] = {}
+        self._orders: Dict[str, Tuple[UniversitySummary, ...]] = {}
+        self._regions: List[Tuple[str, int, int]] = []
+        self._rankings: Dict[Tuple[str, Optional[str], Optional[str]], Tuple[UniversitySummary, ...]] = {}
+        self._dirty = False
+        # Растёт при каждом изменении
+        self.version = 0
+
+    def __len__(self) -> int:
+        return sum(map(len, self._sources.values()))
+
+    def replace_source(self, source: str, summaries: Iterable[UniversitySummary]):
+        self._sources[source] = tuple(summaries)
+        self._dirty = True
+        self.version += 1
+
+    def regions(self) -> List[Tuple[str, int, int]]:
+        """(city, universities, programs), most universities first."""
+        self._rebuild()
+        return self._regions
+
+    def ranking(self, sort: str, uni_type: Optional[str] = None, city: Optional[str] = None) -> Tuple[UniversitySummary, ...]:
+        """Universities in `sort` order ('name', 'score', 'cost', 'budget', 'programs'), optionally filtered."""
+        self._rebuild()
+        key = (sort if sort in SORTS else 'name', uni_type, city)
+        ranking = self._rankings.get(key)
+        if ranking is None:
+            ranking = tuple(s for s in self._orders[key[0]]
+                            if (uni_type is None or s.uni_type == uni_type) and (city is None or s.city == city))
+            self._rankings[key] = ranking
+        return ranking
+
+    def _rebuild(self):
+        if not self._dirty:
+            return
+        summaries = [s for source in self._sources.values() for s in source]
+        self._orders = {sort: tuple(sorted(summaries, key=_sort_key(sort))) for sort in SORTS}
+        totals: Dict[str, List[int]] = {}
+        for s in summaries:
+            counts = totals.setdefault(s.city, [0, 0])
+            counts[0] += 1
+            counts[1] += s.programs
+        self._regions = sorted(((city, n, p) for city, (n, p) in totals.items()), key=lambda r: (-r[1], fold(r[0])))
+        self._rankings = {}
+        self._dirty = False
@@ -0,0 +1,309 @@
+"""
+Offline stand-ins for Telegram and Google Sheets used by the load test.
+
+FakeTelegramSession replaces the aiohttp Bot API session: every method is
+answered locally after a sampled delay, and the last inline keyboard shown in
+each chat is remembered so scripted users can press real buttons.
+FakeSheetsClient mimics the part of gspread the sheet managers use
+(open_by_key -> worksheet -> get_all_records / append_row / update_cell, plus
+the batch reads of the university catalog), so
+the real RegistrationGSheet, UniversitiesGSheet, CoursesGSheet and
+ProfessionsGSheet run unchanged on synthetic data with realistic latency.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+import typing
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import gspread
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import InlineKeyboardMarkup, Message, MessageId
+
+from app.handlers.universities import VISIBLE_PROGRAM_FIELDS
+from app.utils.google_sheets import RegistrationGSheet, UniversitiesGSheet, CoursesGSheet, ProfessionsGSheet
+from app.utils.locations import CITIES_RU
+from app.utils.test_content import SCALES_INFO
+
+Sampler = Callable[[], float]
+
+
+# --- Telegram ---
+
+class FakeTelegramSession(BaseSession):
+    """Bot API session that never touches the network."""
+
+    def __init__(self, latency: Sampler):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids: Dict[int, itertools.count] = defaultdict(lambda: itertools.count(10_000))
+        # chat_id -> (message_id, text, keyboard) последнего сообщения с inline-кнопками
+        self.keyboards: Dict[int, Tuple[int, str, InlineKeyboardMarkup]] = {}
+        # inline_query_id -> число результатов ответа
+        self.inline_answers: Dict[str, int] = {}
+
+    def next_message_id(self, chat_id: int) -> int:
+        return next(self._message_ids[chat_id])
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        delay = self.latency()
+        if delay:
+            await asyncio.sleep(delay)
+        self.calls[method.__api_method__] += 1
+        result = self._result(bot, method)
+        response = self.check_response(
+            bot=bot, method=method, status_code=200, content=json.dumps({'ok': True, 'result': result})
+        )
+        return response.result
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError("File downloads are not simulated")
+        yield b''  # pragma: no cover
+
+    async def close(self):
+        pass
+
+    def _result(self, bot: Bot, method: TelegramMethod) -> Any:
+        chat_id = getattr(method, 'chat_id', None)
+        name = method.__api_method__
+
+        if name in ('deleteMessage', 'deleteMessages'):
+            deleted = getattr(method, 'message_ids', None) or [method.message_id]
+            current = self.keyboards.get(chat_id)
+            if current and current[0] in deleted:
+                del self.keyboards[chat_id]
+            return True
+
+        if name == 'getMe':
+            return {'id': bot.id, 'is_bot': True, 'first_name': 'Stemio', 'username': 'stemio_load_bot'}
+        if name == 'answerInlineQuery':
+            self.inline_answers[method.inline_query_id] = len(method.results)
+            return True
+
+        returning = method.__returning__
+        if returning is MessageId:
+            return {'message_id': self.next_message_id(chat_id)}
+        if returning is not Message and Message not in typing.get_args(returning):
+            return True
+
+        message_id = getattr(method, 'message_id', None) or self.next_message_id(chat_id)
+        text = getattr(method, 'text', None) or getattr(method, 'caption', None) or ''
+        markup = getattr(method, 'reply_markup', None)
+        if isinstance(markup, InlineKeyboardMarkup):
+            self.keyboards[chat_id] = (message_id, text, markup)
+        elif name.startswith('edit') and self.keyboards.get(chat_id, (None,))[0] == message_id:
+            # Сообщение отредактировано без кнопок
+            del self.keyboards[chat_id]
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': bot.id, 'is_bot': True, 'first_name': 'Stemio'},
+            'text': text,
+        }
+
+
+# --- Google Sheets ---
+
+class FakeWorksheet:
+    """One worksheet: header row plus records; every call costs one sampled delay."""
+
+    def __init__(self, title: str, headers: List[str], records: List[Dict[str, Any]], client: 'FakeSheetsClient'):
+        self.title = title
+        self.headers = headers
+        self.records = records
+        self._io = client.io
+        self.spreadsheet: Optional['FakeSpreadsheet'] = None
+
+    def values(self) -> List[List[str]]:
+        """Header row plus data rows as the Sheets API returns them (strings)."""
+        return [list(self.headers)] + [[str(r.get(h, '')) for h in self.headers] for r in self.records]
+
+    def get_all_records(self) -> List[Dict[str, Any]]:
+        self._io('get_all_records')
+        return [dict(r) for r in self.records]
+
+    def row_values(self, row: int) -> List[str]:
+        self._io('row_values')
+        if row == 1:
+            return list(self.headers)
+        record = self.records[row - 2]
+        return [str(record.get(h, '')) for h in self.headers]
+
+    def append_row(self, values: List[Any]):
+        self._io('append_row')
+        self.records.append(dict(zip(self.headers, values)))
+        self.spreadsheet.touch()
+
+    def update_cell(self, row: int, col: int, value: Any):
+        self._io('update_cell')
+        self.records[row - 2][self.headers[col - 1]] = value
+        self.spreadsheet.touch()
+
+
+class FakeSpreadsheet:
+    def __init__(self, key: str, worksheets: List[FakeWorksheet], client: 'FakeSheetsClient'):
+        self.id = key
+        self.title = key
+        self._worksheets = {ws.title: ws for ws in worksheets}
+        self._io = client.io
+        # Аналог modifiedTime из Drive API
+        self.version = 1
+        for ws in worksheets:
+            ws.spreadsheet = self
+
+    def touch(self):
+        self.version += 1
+
+    def get_lastUpdateTime(self) -> str:
+        self._io('get_lastUpdateTime')
+        return str(self.version)
+
+    def values_batch_get(self, ranges: List[str]) -> Dict[str, Any]:
+        self._io('values_batch_get')
+        titles = [r.strip("'").replace("''", "'") for r in ranges]
+        return {'valueRanges': [{'range': r, 'values': self._worksheets[t].values()} for r, t in zip(ranges, titles)]}
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        # gspread запрашивает метаданные таблицы при каждом вызове
+        self._io('worksheet')
+        if title not in self._worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def get_worksheet(self, index: int) -> FakeWorksheet:
+        return list(self._worksheets.values())[index]
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        self._io('worksheets')
+        return list(self._worksheets.values())
+
+
+class FakeSheetsClient:
+    """gspread.Client look-alike over in-memory spreadsheets."""
+
+    def __init__(self, latency: Sampler):
+        self.latency = latency
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+        self.calls: Counter = Counter()
+
+    def add(self, key: str, worksheets: List[Tuple[str, List[str], List[Dict[str, Any]]]]) -> FakeSpreadsheet:
+        spreadsheet = FakeSpreadsheet(key, [FakeWorksheet(t, h, r, self) for t, h, r in worksheets], self)
+        self.spreadsheets[key] = spreadsheet
+        return spreadsheet
+
+    def io(self, name: str):
+        """Count one simulated Sheets API call and block the worker thread for its latency."""
+        self.calls[name] += 1
+        delay = self.latency()
+        if delay:
+            time.sleep(delay)
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.io('open_by_key')
+        if key not in self.spreadsheets:
+            raise gspread.exceptions.SpreadsheetNotFound(key)
+        return self.spreadsheets[key]
+
+
+# --- Синтетические данные ---
+
+PARENT_HEADERS = ['Telegram ID', 'Имя', 'Фамилия', 'Номер телефон', 'Email', 'Язык', 'role', 'Время']
+STUDENT_HEADERS = ['Telegram ID', 'Имя', 'Фамилия', 'Дата рождения', 'Город', 'Телефон', 'Язык', 'role',
+                   'Время', 'Имя родителя', 'Телефон родителя']
+CHILD_HEADERS = ['Parent Telegram ID', 'Имя ребенка', 'Фамилия ребенка', 'Дата рождения', 'Телефон ребенка', 'Exode ID']
+UNIVERSITY_HEADERS = ['Наименования ВОУ', 'Город', 'sheet_name']
+PROFESSION_HEADERS = ['Название профессии', 'Направление', 'О чём профессия?', 'Чем занимаются?', 'Где учиться']
+COURSE_HEADERS = ['course_id', 'Название курса', 'Категория', 'Подкатегория', 'language']
+
+
+def _phone(rnd: random.Random) -> str:
+    return f"+99890{rnd.randrange(10 ** 7):07d}"
+
+
+def build_registration(rnd: random.Random, users: int) -> list:
+    parents = [dict(zip(PARENT_HEADERS, [
+        10 ** 9 + i, f"Родитель{i}", "Тестов", _phone(rnd), f"p{i}@example.com", 'ru', 'parent', '2024-01-01 10:00:00'
+    ])) for i in range(users // 2)]
+    students = [dict(zip(STUDENT_HEADERS, [
+        2 * 10 ** 9 + i, f"Ученик{i}", "Тестов", '01.02.2008', rnd.choice(CITIES_RU), _phone(rnd), 'ru', 'student',
+        '2024-01-01 10:00:00', '', ''
+    ])) for i in range(users)]
+    children = [dict(zip(CHILD_HEADERS, [
+        10 ** 9 + i % max(1, users // 2), f"Ребенок{i}", "Тестов", '01.02.2012', _phone(rnd), ''
+    ])) for i in range(users // 2)]
+    return [('Родитель', PARENT_HEADERS, parents), ('Ученик', STUDENT_HEADERS, students),
+            ('Родитель-Ребенок', CHILD_HEADERS, children)]
+
+
+def build_universities(rnd: random.Random, city: str, count: int, programs: int) -> list:
+    worksheets = []
+    universities = []
+    for u in range(count):
+        sheet_name = f"uni{u}"
+        universities.append({'Наименования ВОУ': f"{city}: университет №{u + 1}", 'Город': city, 'sheet_name': sheet_name})
+        rows = []
+        for p in range(programs):
+            row = {field: f"{field} {p}" for field in VISIBLE_PROGRAM_FIELDS}
+            row['Название факультета'] = f"Факультет {p % 6 + 1}"
+            row['Название программы'] = f"Программа {p + 1}"
+            row['Список документов'] = "Паспорт, аттестат" if p % 2 else ''
+            rows.append(row)
+        worksheets.append((sheet_name, VISIBLE_PROGRAM_FIELDS + ['Список документов'], rows))
+    return [('Universities', UNIVERSITY_HEADERS, universities)] + worksheets
+
+
+def build_professions(rnd: random.Random, per_scale: int) -> list:
+    worksheets = []
+    for scale in SCALES_INFO:
+        rows = [dict(zip(PROFESSION_HEADERS, [
+            f"{scale}-профессия {i + 1}", f"Направление {scale} {i % 5 + 1}", "Описание", "Задачи", "Вузы"
+        ])) for i in range(per_scale)]
+        worksheets.append((scale, PROFESSION_HEADERS, rows))
+    return worksheets
+
+
+def build_courses(rnd: random.Random, count: int) -> list:
+    rows = [dict(zip(COURSE_HEADERS, [
+        i, f"Курс {i}", f"Категория {i % 4}", f"Подкатегория {i % 3}", rnd.choice(['ru', 'uz'])
+    ])) for i in range(count)]
+    return [('Courses', COURSE_HEADERS, rows)]
+
+
+def build_fake_managers(client: FakeSheetsClient, seed: int = 1, users: int = 2000) -> Dict[str, Any]:
+    """
+    Fill `client` with synthetic spreadsheets and wire real managers to it.
+
+    Returns:
+        Keyword arguments for bot.build_dispatcher (managers and state_uni_ids_by_city)
+    """
+    rnd = random.Random(seed)
+    client.add('registration', build_registration(rnd, users))
+    client.add('courses', build_courses(rnd, 60))
+    client.add('professions', build_professions(rnd, 40))
+    state_ids = {}
+    for city in CITIES_RU:
+        key = f"state-{city}"
+        client.add(key, build_universities(rnd, city, count=12, programs=30))
+        state_ids[city] = key
+
+    def wire(manager, key: str):
+        # sheet_id=None: менеджер не подключается к Google, клиент подменяется
+        manager.client = client
+        manager.sheet = client.spreadsheets[key]
+        return manager
+
+    return {
+        'registration_manager': wire(RegistrationGSheet(None), 'registration'),
+        'universities_manager': wire(UniversitiesGSheet(None), 'registration'),
+        'courses_manager': wire(CoursesGSheet(None), 'courses'),
+        'professions_manager': wire(ProfessionsGSheet(None), 'professions'),
+        'state_uni_ids_by_city': state_ids,
+    }
@@ -0,0 +1,89 @@
+"""
+FSM storage benchmark: MemoryStorage vs SQLiteStorage.
+
+Simulates handler traffic (get_data followed by update_data) for many users
+and reports per-call latency. SQLiteStorage is measured twice: with a warm
+cache (the normal case) and with every user evicted before being read
+(cache_size=1, i.e. every read goes to SQLite). Only clean keys can be
+evicted, so the cold case flushes after every update, outside the timed
+section; its stats line should show about one miss per op.
+
+    python -m benchmarks.fsm_storage [--users 2000] [--ops 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.core.storage import SQLiteStorage
+
+
+def _payload(i: int) -> dict:
+    # Похоже на реальные данные: язык, роль, ответы теста, id сообщений
+    return {
+        'language': 'ru', 'role': 'student', 'answers': list(range(i % 12)),
+        'message_ids_to_delete': [i, i + 1, i + 2], 'student_city': 'Ташкент',
+    }
+
+
+async def _run(storage, users: int, ops: int, cold: bool = False, seed: int = 1):
+    rnd = random.Random(seed)
+    keys = [StorageKey(bot_id=1, chat_id=u, user_id=u) for u in range(users)]
+    for i, key in enumerate(keys):
+        await storage.set_data(key, _payload(i))
+    if cold:
+        await storage.flush()
+        storage.stats.update(hits=0, misses=0)
+
+    get_lat, upd_lat = [], []
+    for i in range(ops):
+        key = keys[rnd.randrange(users)]
+        t = time.perf_counter()
+        data = await storage.get_data(key)
+        get_lat.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        await storage.update_data(key, {'answers': data.get('answers', []) + [i % 5]})
+        upd_lat.append(time.perf_counter() - t)
+        if cold:
+            # Записанный ключ снова чистый и вытесняется следующим промахом
+            await storage.flush()
+    await storage.close()
+    return get_lat, upd_lat
+
+
+def _fmt(name: str, samples: list) -> str:
+    s = sorted(samples)
+    us = lambda v: f"{v * 1e6:8.1f}"
+    return (f"{name:<40} mean {us(statistics.fmean(s))} µs  p50 {us(s[len(s) // 2])} µs  "
+            f"p95 {us(s[int(len(s) * 0.95)])} µs  p99 {us(s[int(len(s) * 0.99)])} µs")
+
+
+async def main(users: int, ops: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [
+            ('MemoryStorage', MemoryStorage(), False),
+            ('SQLiteStorage (warm cache)', SQLiteStorage(os.path.join(tmp, 'warm.sqlite3'), cache_size=users), False),
+            ('SQLiteStorage (cold reads)', SQLiteStorage(os.path.join(tmp, 'cold.sqlite3'), cache_size=1), True),
+        ]
+        print(f"users={users} ops={ops}")
+        for name, storage, cold in cases:
+            get_lat, upd_lat = await _run(storage, users, ops, cold)
+            print(_fmt(f"{name} get_data", get_lat))
+            print(_fmt(f"{name} update_data", upd_lat))
+            if isinstance(storage, SQLiteStorage):
+                print(f"{'':<40} {storage.stats}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--ops', type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.ops))
@@ -0,0 +1,299 @@
+"""
+Offline load test: scripted users drive full conversations through the real
+Dispatcher.
+
+Synthetic Updates are fed straight into dp.feed_update; the bot talks to a
+FakeTelegramSession, the sheet managers read synthetic spreadsheets with
+simulated Google latency and Exode calls go to the in-process Exode stub. No
+Telegram or Google network is used. Every virtual user runs one journey:
+
+    registration  /start -> language -> role -> student registration -> Exode consent -> goal
+    stem_test     /start -> ... -> STEM navigator -> 12 answers -> directions -> profession card
+    universities  /start -> ... -> city -> type -> university -> faculty -> program card
+    search        /start -> ... -> /search -> a search result
+    nationwide    /start -> ... -> all regions -> a region -> sort -> a university
+    inline        inline queries (@bot врач, a repeat in Latin, a university)
+
+Buttons are pressed by matching the callback data of the keyboard the bot
+actually sent, so a broken flow shows up as a failed step. The report lists
+throughput and p50/p95/p99 latency per step, plus the slowest handlers and
+external calls from app.utils.metrics.
+
+    python -m benchmarks.load_test [--users 200] [--journeys registration,stem_test,universities,search,nationwide,inline]
+        [--sheets-latency lognormal:250:0.4] [--exode-latency lognormal:80:0.5]
+        [--telegram-latency uniform:30:80] [--ai-delay 0.3] [--think 0] [--storage memory|sqlite]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# support.py читает ID группы поддержки при импорте
+os.environ.setdefault('SUPPORT_GROUP_ID', '0')
+# Журнал прохождений теста — во временный каталог, а не в data/ бота
+os.environ.setdefault('TEST_ATTEMPTS_PATH', os.path.join(tempfile.mkdtemp(), 'test_attempts.jsonl'))
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+
+import app.utils.exode_api as exode_api
+from app.core.storage import SQLiteStorage
+from app.utils.ai_helpers import LocalRecommendationBackend
+from app.utils.backends import get_backend_stats
+from app.utils.exode_stub import ExodeStub, StubConfig, parse_latency
+from app.utils.metrics import REGISTRY
+from benchmarks.fakes import FakeSheetsClient, FakeTelegramSession, build_fake_managers
+from bot import build_dispatcher
+
+Step = Tuple[str, str, str]  # (имя шага, 'text' | 'click' | 'inline', текст, regex callback_data или запрос)
+
+ONBOARDING: List[Step] = [
+    ('start', 'text', '/start'),
+    ('language', 'click', 'lang_ru'),
+    ('role', 'click', 'role_student'),
+]
+TO_MAIN_MENU: List[Step] = ONBOARDING + [('postpone', 'click', 'postpone_registration')]
+
+JOURNEYS: Dict[str, List[Step]] = {
+    'registration': ONBOARDING + [
+        ('create_profile', 'click', 'student_create_profile'),
+        ('not_registered', 'click', 'no'),
+        ('first_name', 'text', 'Алишер'),
+        ('last_name', 'text', 'Каримов'),
+        ('dob_manual', 'click', 'manual_dob_input'),
+        ('dob', 'text', '01.02.2008'),
+        ('city', 'click', 'city:.+'),
+        ('phone', 'text', '{phone}'),
+        ('parent_name', 'text', 'Дилноза'),
+        ('parent_phone', 'text', '+998901112233'),
+        ('confirm_profile', 'click', 'student_confirm_profile'),
+        ('exode_consent', 'click', 'consent_yes'),
+        ('goal', 'click', 'goal_.+'),
+    ],
+    'stem_test': TO_MAIN_MENU + [
+        ('stem_menu', 'text', '🧭 STEM-навигатор'),
+        ('begin_test', 'click', 'begin_stem_test'),
+    ] + [(f'answer_{i}', 'click', r'\d+_[A-Z]') for i in range(1, 13)] + [
+        ('directions', 'click', 'view_directions_.+'),
+        ('professions', 'click', r'view_profs_\d+'),
+        ('profession_card', 'click', r'show_prof_\d+'),
+    ],
+    'universities': TO_MAIN_MENU + [
+        ('universities_menu', 'text', '🎓 Вузы'),
+        ('city', 'click', 'uni_city:.+'),
+        ('uni_type', 'click', 'uni_type_Государственный'),
+        ('university', 'click', r'uni_\d+'),
+        ('faculty', 'click', r'faculty_\d+'),
+        ('program', 'click', r'program_\d+'),
+    ],
+    'search': TO_MAIN_MENU + [
+        ('search', 'text', '/search университет'),
+        ('result', 'click', 'srch:.+'),
+    ],
+    'nationwide': TO_MAIN_MENU + [
+        ('universities_menu', 'text', '🎓 Вузы'),
+        ('regions', 'click', 'nw:open:0'),
+        ('region', 'click', 'nw_region:.+'),
+        ('sort', 'click', 'nw:sort:0'),
+        ('university', 'click', 'srch:.+'),
+    ],
+    'inline': [
+        ('profession', 'inline', 'профессия'),
+        ('repeat_latin', 'inline', 'professiya'),
+        ('university', 'inline', 'университет'),
+    ],
+}
+
+
+class StepFailed(Exception):
+    """The expected button was not on the screen."""
+
+
+class VirtualUser:
+    """One private chat: sends messages and presses buttons of the last keyboard."""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id: int, bot: Bot, session: FakeTelegramSession, rnd: random.Random):
+        self.user_id = user_id
+        self.bot = bot
+        self.session = session
+        self.rnd = rnd
+        self.phone = f"+99893{user_id % 10 ** 7:07d}"
+        self._user = {'id': user_id, 'is_bot': False, 'first_name': f'Load{user_id}', 'language_code': 'ru'}
+        self._chat = {'id': user_id, 'type': 'private'}
+
+    def _update(self, payload: dict) -> Update:
+        return Update.model_validate({'update_id': next(self._update_ids), **payload}, context={'bot': self.bot})
+
+    def text_update(self, text: str) -> Update:
+        entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] if text.startswith('/') else None
+        return self._update({'message': {
+            'message_id': self.session.next_message_id(self.user_id), 'date': int(time.time()),
+            'chat': self._chat, 'from': self._user, 'text': text, 'entities': entities,
+        }})
+
+    def inline_update(self, query: str) -> Update:
+        self.inline_query_id = str(next(self._update_ids))
+        return self._update({'inline_query': {
+            'id': self.inline_query_id, 'from': self._user, 'query': query, 'offset': '', 'chat_type': 'private',
+        }})
+
+    def check_inline_answer(self):
+        if not self.session.inline_answers.get(self.inline_query_id):
+            raise StepFailed("inline query answered without results")
+
+    def click_update(self, pattern: str) -> Update:
+        current = self.session.keyboards.get(self.user_id)
+        if not current:
+            raise StepFailed(f"no inline keyboard on screen (wanted '{pattern}')")
+        message_id, text, markup = current
+        regex = re.compile(pattern)
+        options = [b.callback_data for row in markup.inline_keyboard for b in row
+                   if b.callback_data and regex.fullmatch(b.callback_data)]
+        if not options:
+            raise StepFailed(f"no button matching '{pattern}'")
+        return self._update({'callback_query': {
+            'id': str(next(self._update_ids)), 'from': self._user, 'chat_instance': str(self.user_id),
+            'data': self.rnd.choice(options),
+            'message': {'message_id': message_id, 'date': int(time.time()), 'chat': self._chat,
+                        'from': {'id': self.bot.id, 'is_bot': True, 'first_name': 'Stemio'}, 'text': text},
+        }})
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.latencies: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        self.failures: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        self.completed: Dict[str, int] = defaultdict(int)
+        self.updates = 0
+
+    async def run_user(self, dp, bot: Bot, session: FakeTelegramSession, user_id: int, journey: str):
+        rnd = random.Random(user_id)
+        user = VirtualUser(user_id, bot, session, rnd)
+        for step_name, kind, value in JOURNEYS[journey]:
+            key = (journey, step_name)
+            if self.args.think:
+                await asyncio.sleep(rnd.uniform(0.5, 1.5) * self.args.think)
+            try:
+                if kind == 'text':
+                    update = user.text_update(value.format(phone=user.phone))
+                elif kind == 'inline':
+                    update = user.inline_update(value)
+                else:
+                    update = user.click_update(value)
+                started = time.perf_counter()
+                await dp.feed_update(bot, update)
+                self.latencies[key].append(time.perf_counter() - started)
+                if kind == 'inline':
+                    user.check_inline_answer()
+                self.updates += 1
+            except Exception as e:
+                self.failures[key].append(f"{type(e).__name__}: {e}")
+                return
+        self.completed[journey] += 1
+
+    async def run(self):
+        args = self.args
+        stub = ExodeStub(StubConfig(latency=args.exode_latency))
+        exode_api.EXODE_API_BASE_URL = await stub.start('127.0.0.1', 0)
+
+        session = FakeTelegramSession(parse_latency(args.telegram_latency))
+        bot = Bot(token='42:LOADTEST', session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        sheets = FakeSheetsClient(parse_latency(args.sheets_latency))
+        storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(), 'fsm.sqlite3')) if args.storage == 'sqlite' else MemoryStorage()
+        with open('texts.json', 'r', encoding='utf-8') as f:
+            lexicon = json.load(f)
+        dp = build_dispatcher(bot, storage, lexicon, **build_fake_managers(sheets, seed=args.seed))
+        # Совет на экране результатов пишет локальная заглушка модели
+        dp['recommendations'].backend = LocalRecommendationBackend(args.ai_delay)
+
+        journeys = args.journeys.split(',')
+        await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+        # В боте каталог грузится в фоне после подключения таблиц; здесь — до первых апдейтов
+        if {'search', 'nationwide', 'inline'} & set(journeys):
+            await dp['university_catalog'].refresh()
+        if {'stem_test', 'inline'} & set(journeys):
+            await dp['content_catalog'].refresh()
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(
+                self.run_user(dp, bot, session, 5 * 10 ** 8 + i, journeys[i % len(journeys)])
+                for i in range(args.users)
+            ))
+        finally:
+            elapsed = time.perf_counter() - started
+            await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+            await stub.stop()
+        self.report(elapsed, session, sheets)
+        if 'stem_test' in journeys:
+            attempts = dp['test_attempts']
+            print(f"Test attempts: {attempts.stats}, log {attempts.path}")
+
+    def report(self, elapsed: float, session: FakeTelegramSession, sheets: FakeSheetsClient):
+        ms = lambda v: f"{v * 1000:8.1f}"
+        print(f"\n{self.args.users} users, {self.updates} updates in {elapsed:.1f}s: "
+              f"{self.updates / elapsed:.1f} updates/s, "
+              f"{sum(self.completed.values()) / elapsed:.2f} journeys/s")
+        for journey in self.args.journeys.split(','):
+            print(f"\n== {journey}: {self.completed[journey]} completed")
+            print(f"{'step':<20} {'n':>5} {'fail':>5}   {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  ms")
+            for step_name, _, _ in JOURNEYS[journey]:
+                samples = sorted(self.latencies.get((journey, step_name), []))
+                failures = self.failures.get((journey, step_name), [])
+                if not samples and not failures:
+                    continue
+                row = f"{step_name:<20} {len(samples):>5} {len(failures):>5}"
+                if samples:
+                    pct = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+                    row += f"   {ms(statistics.fmean(samples))} {ms(pct(0.5))} {ms(pct(0.95))} {ms(pct(0.99))}"
+                print(row)
+                for reason in sorted(set(failures))[:3]:
+                    print(f"    ! {reason}")
+
+        print("\nSlowest handlers / external calls (p95):")
+        for metric_name, rows in REGISTRY.summary(top=5).items():
+            print(f"  {metric_name}")
+            for r in rows:
+                print(f"    {r['labels']:<55} n={r['count']:<6} mean={ms(r['mean'])} p95={ms(r['p95'])} ms")
+        print(f"\nSheets API calls: {dict(sheets.calls)}")
+        print(f"Bot API calls: {dict(session.calls)}")
+        print(f"Backends: {get_backend_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='concurrent virtual users')
+    parser.add_argument('--journeys', default=','.join(JOURNEYS), help='comma-separated journeys to mix')
+    parser.add_argument('--sheets-latency', default='lognormal:250:0.4', help='Google Sheets call latency spec')
+    parser.add_argument('--exode-latency', default='lognormal:80:0.5', help='Exode API latency spec')
+    parser.add_argument('--telegram-latency', default='uniform:30:80', help='Bot API latency spec')
+    parser.add_argument('--ai-delay', type=float, default=0.3, help='seconds between chunks of the local AI stand-in')
+    parser.add_argument('--think', type=float, default=0.0, help='mean pause between steps, seconds')
+    parser.add_argument('--storage', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    unknown = set(args.journeys.split(',')) - set(JOURNEYS)
+    if unknown:
+        parser.error(f"unknown journeys: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(LoadTest(args).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Profession matcher benchmark.
+
+Builds a content catalog of synthetic professions (the built-in descriptions
+repeated under new titles, spread over the five scale worksheets), feeds it
+to the real ProfessionMatcher and reports:
+
+1. build - time to rebuild the normalized matrix, as after a catalog change;
+2. match - p50/p99 latency of the top-k lookup for random test results, with
+           numpy when installed or the list fallback (--no-numpy forces it).
+
+    python -m benchmarks.profession_matcher [--professions 2000] [--queries 2000] [--k 5] [--no-numpy]
+"""
+
+import argparse
+import os
+import random
+import time
+from unittest.mock import MagicMock
+
+os.environ.setdefault('SUPPORT_GROUP_ID', '0')
+
+import app.utils.profession_matcher as profession_matcher
+from app.utils.content_catalog import ContentCatalog, PROFESSION_TITLE
+from app.utils.profession_matcher import ProfessionMatcher
+from app.utils.scoring import SCALES, ScoreCard
+from app.utils.test_content import QUESTIONS
+
+
+def synthetic_catalog(size: int, rnd: random.Random) -> ContentCatalog:
+    catalog = ContentCatalog(MagicMock(), MagicMock(), interval=0)
+    templates = [record for records in catalog.builtin.values() for record in records]
+    professions = {scale: [] for scale in SCALES}
+    for i in range(size):
+        record = dict(rnd.choice(templates))
+        record[PROFESSION_TITLE] = f"{record[PROFESSION_TITLE]} #{i}"
+        professions[rnd.choice(SCALES)].append(record)
+    catalog.professions = {scale: tuple(records) for scale, records in professions.items()}
+    return catalog
+
+
+def main(args):
+    if args.no_numpy:
+        profession_matcher.np = None
+    rnd = random.Random(args.seed)
+    catalog = synthetic_catalog(args.professions, rnd)
+
+    started = time.perf_counter()
+    matcher = ProfessionMatcher(catalog)
+    build = time.perf_counter() - started
+    backend = 'numpy' if profession_matcher.np is not None else 'lists'
+    print(f"build: {len(matcher)} professions in {build * 1000:.1f} ms ({backend})")
+
+    latencies = []
+    for _ in range(args.queries):
+        answers = ''.join(rnd.choice(q['answers'])['data'].rsplit('_', 1)[1] for q in QUESTIONS)
+        scores = ScoreCard.from_answers(answers).scores
+        started = time.perf_counter()
+        matcher.match(scores, answers, args.k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    print(f"match: {len(latencies)} queries, top {args.k}, p50 {pct(0.5):.3f} ms, p99 {pct(0.99):.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--professions', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=5, help='professions per match')
+    parser.add_argument('--no-numpy', action='store_true', help='use the list fallback even if numpy is installed')
+    parser.add_argument('--seed', type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+"""
+STEM-navigator scoring benchmark.
+
+Generates random answer sets (one answer per question, as the test keyboard
+allows) and reports:
+
+1. test    - time to score one finished test with the old linear scan over
+             SCORING_KEY and with the inverted map, and whether both give
+             the same top 3 (the scan's ties depend on dict order, so only
+             the scores are compared);
+2. answer  - time of one incremental ScoreCard update, i.e. the work done per
+             button press;
+3. batch   - throughput of score_batch() over stored answer sets, with the
+             share of duplicates that are scored once;
+4. leaders - how many sets have each scale in first place.
+
+    python -m benchmarks.scoring [--sets 100000] [--distinct 20000]
+"""
+
+import argparse
+import collections
+import random
+import time
+
+from app.utils.scoring import SCALES, ScoreCard, answer_codes, leading_scales, score_batch
+from app.utils.test_content import QUESTIONS, SCORING_KEY
+
+
+def legacy_results(answers):
+    """Подсчёт до появления app.utils.scoring: каждый ответ ищется во всех списках."""
+    scores = collections.defaultdict(int)
+    for answer in answers:
+        for scale, keys in SCORING_KEY.items():
+            if answer in keys:
+                scores[scale] += 1
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:3]
+
+
+def random_letters(rnd: random.Random) -> str:
+    return ''.join(rnd.choice(q['answers'])['data'].rsplit('_', 1)[1] for q in QUESTIONS)
+
+
+def timed(fn, repeat: int) -> float:
+    """Milliseconds per call."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main(args):
+    rnd = random.Random(args.seed)
+    distinct = [random_letters(rnd) for _ in range(args.distinct)]
+    stored = [rnd.choice(distinct) for _ in range(args.sets)]
+
+    sample = [answer_codes(letters) for letters in distinct[:1000]]
+    legacy = timed(lambda: [legacy_results(codes) for codes in sample], 10) / len(sample)
+    engine = timed(lambda: [ScoreCard.from_answers(codes).top(3) for codes in sample], 10) / len(sample)
+    mismatches = sum(
+        sorted(s for _, s in legacy_results(codes)) != sorted(s for _, s in ScoreCard.from_answers(codes).top(3))
+        for codes in sample
+    )
+    print(f"test: {len(QUESTIONS)} answers, linear scan {legacy * 1000:.1f} us, "
+          f"inverted map {engine * 1000:.1f} us ({legacy / engine:.1f}x), {mismatches} score mismatches")
+
+    card, code = ScoreCard(), sample[0][0]
+    per_answer = timed(lambda: card.add(code), 100_000)
+    print(f"answer: incremental update {per_answer * 1_000_000:.0f} ns")
+
+    started = time.perf_counter()
+    results = score_batch(stored)
+    batch = time.perf_counter() - started
+    print(f"batch: {len(results)} sets ({len(set(stored))} distinct) in {batch * 1000:.0f} ms, "
+          f"{len(results) / batch:,.0f} sets/s")
+
+    leaders = leading_scales(stored)
+    print("leaders: " + ", ".join(f"{scale} {leaders[scale]}" for scale in SCALES))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sets', type=int, default=100_000, help="stored answer sets to re-score")
+    parser.add_argument('--distinct', type=int, default=20_000, help="distinct answer sets among them")
+    parser.add_argument('--seed', type=int, default=1)
+    main(parser.parse_args())
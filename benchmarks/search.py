@@ -0,0 +1,199 @@
+"""
+University search and program filter benchmark.
+
+Builds the university catalog from synthetic spreadsheets (one state sheet per
+city plus private and foreign sheets, Russian and Uzbek names mixed) through
+the real UniversityCatalog and FakeSheetsClient, then reports:
+
+1. build  - time of the first full load and the index size;
+2. query  - p50/p99 latency of typical queries in both alphabets, full words
+            and prefixes, and how many return results;
+3. filters - p50/p99 latency of faceted program filters (budget, cost, score,
+            exams, ...) nationwide and per city;
+4. overview - regions found after city normalization (private and foreign
+            sheets spell cities in both alphabets, with "г." / "shahri"), and
+            p50/p99 latency of nationwide rankings (first read after a change
+            includes the rebuild);
+5. refresh - time of a refresh with nothing changed (no values read) and
+            after one program worksheet changed (only it is reindexed).
+
+    python -m benchmarks.search [--universities 15] [--programs 40] [--queries 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault('SUPPORT_GROUP_ID', '0')
+
+import app.utils.university_catalog as university_catalog
+from app.utils.google_sheets import UniversitiesGSheet
+from app.utils.locations import CITIES_RU, CITIES_UZ
+from app.utils.university_catalog import UniversityCatalog, new_search_index
+from benchmarks.fakes import FakeSheetsClient, UNIVERSITY_HEADERS
+from app.handlers.universities import VISIBLE_PROGRAM_FIELDS
+
+UNIVERSITY_KINDS = [
+    "государственный технический университет", "государственный педагогический институт",
+    "медицинский институт", "davlat universiteti", "axborot texnologiyalari universiteti",
+    "iqtisodiyot va pedagogika instituti", "инженерно-строительный институт", "qishloq xo'jaligi instituti",
+]
+FACULTIES = [
+    "Математика и информатика", "Fizika-matematika", "Филология", "Iqtisodiyot", "Биология и химия",
+    "Kompyuter injiniringi", "Юридический", "Xorijiy tillar", "Энергетика", "Pedagogika va psixologiya",
+]
+PROGRAMS = [
+    "Прикладная математика", "Amaliy matematika", "Физика", "Kompyuter injiniringi", "Dasturiy injiniring",
+    "Информационная безопасность", "Филология (русский язык)", "Ingliz tili filologiyasi", "Экономика",
+    "Bank ishi", "Бухгалтерский учёт", "Юриспруденция", "Xalqaro huquq", "Биотехнология", "Kimyo",
+    "Химическая технология", "Электроэнергетика", "Qayta tiklanuvchi energiya", "Психология",
+    "Maktabgacha ta'lim", "Журналистика", "Туризм", "Agronomiya", "Veterinariya", "Архитектура",
+]
+EXAMS = ["Математика", "Физика", "Химия", "Биология", "Русский язык", "Ona tili", "Ingliz tili", "Tarix", "Matematika"]
+FORMS = ["Очная", "Очная, заочная", "Kunduzgi", "Kunduzgi, sirtqi", "Очная, вечерняя", "Masofaviy"]
+FLAGS = ["Да", "Нет", "Ha", "Yo'q", "есть", ""]
+FILTERS = [
+    {}, {'budget': True}, {'dormitory': True, 'max_cost': 15_000_000}, {'score': 150, 'stipend': True},
+    {'city': "Ташкент", 'form': 'extramural'}, {'exams': ['matematika', 'fizika']},
+    {'budget': True, 'dormitory': True, 'max_cost': 20_000_000, 'score': 125},
+    {'city': "Самарканд", 'budget': True, 'exams': ['matematika', 'fizika', 'ona tili']},
+]
+CITY_SPELLINGS = [
+    lambda ru, uz: ru, lambda ru, uz: uz, lambda ru, uz: f"г. {ru}", lambda ru, uz: f"{uz} shahri", lambda ru, uz: ru.upper(),
+]
+RANKINGS = [('name', None, None), ('score', None, None), ('cost', 'Частный', None), ('budget', None, "Ташкент"),
+            ('programs', 'Государственный', "Самарканд")]
+QUERIES = [
+    "ташкент", "toshkent", "тошкент", "самарканд", "samarqand", "бухара", "buxoro", "фергана", "farg'ona",
+    "математика", "matematika", "amaliy mat", "прикладная", "компьютер", "kompyuter inj", "физика", "fizika",
+    "университет", "universiteti", "педагог", "pedagogika", "химия", "kimyo", "экон", "iqtisod",
+    "ташкент информационная", "toshkent axborot", "джизак", "jizzax", "хорезм", "xorazm", "ph", "ю",
+]
+
+
+def build_sheets(client: FakeSheetsClient, rnd: random.Random, universities: int, programs: int) -> dict:
+    program_headers = VISIBLE_PROGRAM_FIELDS + ['Список документов']
+
+    def program_sheets(prefix: str):
+        sheets = []
+        for u in range(universities):
+            rows = []
+            for p in range(programs):
+                row = {field: '' for field in program_headers}
+                row['Название факультета'] = FACULTIES[(u + p) % len(FACULTIES)]
+                row['Название программы'] = f"{rnd.choice(PROGRAMS)}" + (f" ({p})" if p >= len(PROGRAMS) else '')
+                row['Язык обучения'] = rnd.choice(['Русский', "O'zbek"])
+                row['Минимальные баллы для поступления'] = f"{rnd.uniform(55, 185):.1f}"
+                row['Стоимость'] = (f"${rnd.randrange(2, 6)} 000" if prefix == 'f' else
+                                    f"{rnd.choice([8, 10, 12, 14, 16, 18, 22, 25, 30])} 000 000 сум")
+                row['Экзамены'] = ", ".join(rnd.sample(EXAMS, rnd.randrange(1, 4)))
+                row['Форма обучения'] = rnd.choice(FORMS)
+                row['Стипендия'] = rnd.choice(FLAGS)
+                row['Наличие общежития'] = rnd.choice(FLAGS)
+                row['Квота на бюджет'] = rnd.choice(['0', '15', '25', ''])
+                rows.append(row)
+            sheets.append((f"{prefix}{u}", program_headers, rows))
+        return sheets
+
+    state_ids = {}
+    for city_ru, city_uz in zip(CITIES_RU, CITIES_UZ):
+        city = rnd.choice([city_ru, city_uz])
+        unis = [{'Наименования ВОУ': f"{city} {UNIVERSITY_KINDS[u % len(UNIVERSITY_KINDS)]} №{u + 1}",
+                 'Город': city_ru, 'sheet_name': f"u{u}"} for u in range(universities)]
+        client.add(f"state-{city_ru}", [('Universities', UNIVERSITY_HEADERS, unis)] + program_sheets('u'))
+        state_ids[city_ru] = f"state-{city_ru}"
+    for key in ('private', 'foreign'):
+        unis = [{'Наименования ВОУ': f"{key.title()} University {u + 1}",
+                 'Город': rnd.choice(CITY_SPELLINGS)(CITIES_RU[u % len(CITIES_RU)], CITIES_UZ[u % len(CITIES_UZ)]),
+                 'sheet_name': f"{key[0]}{u}"} for u in range(universities)]
+        client.add(key, [('Universities', UNIVERSITY_HEADERS, unis)] + program_sheets(key[0]))
+    return state_ids
+
+
+async def main(args):
+    rnd = random.Random(args.seed)
+    client = FakeSheetsClient(lambda: 0.0)
+    state_ids = build_sheets(client, rnd, args.universities, args.programs)
+    university_catalog.PRIVATE_UNIVERSITIES_SHEET_ID = 'private'
+    university_catalog.FOREIGN_UNIVERSITIES_SHEET_ID = 'foreign'
+    manager = UniversitiesGSheet(None)
+    manager.client = client
+    catalog = UniversityCatalog(manager, state_ids, new_search_index())
+
+    started = time.perf_counter()
+    await catalog.refresh()
+    build = time.perf_counter() - started
+    print(f"build: {build * 1000:.0f} ms, {len(catalog.sources)} sheets, {len(catalog.worksheets)} worksheets, "
+          f"{len(catalog.index)} documents")
+
+    latencies, empty = [], 0
+    for i in range(args.queries):
+        query = QUERIES[i % len(QUERIES)]
+        t = time.perf_counter()
+        results = catalog.index.search(query, limit=10)
+        latencies.append(time.perf_counter() - t)
+        empty += not results
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"query: {len(latencies)} queries, p50 {pct(0.5):.3f} ms, p99 {pct(0.99):.3f} ms, "
+          f"max {latencies[-1] * 1000:.3f} ms, {empty} without results")
+    for query in ("toshkent axborot", "тошкент", "jizzax", "amaliy mat"):
+        titles = [f"{d.kind}:{d.title}" for d in catalog.index.search(query, limit=3)]
+        print(f"  {query!r:<20} -> {titles}")
+
+    latencies = []
+    for i in range(args.queries):
+        filters = FILTERS[i % len(FILTERS)]
+        t = time.perf_counter()
+        catalog.facets.query(filters, limit=10)
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+    print(f"filters: {len(catalog.facets)} programs, p50 {pct(0.5):.3f} ms, p99 {pct(0.99):.3f} ms, "
+          f"max {latencies[-1] * 1000:.3f} ms")
+    for filters in FILTERS[1:]:
+        print(f"  {str(filters):<90} -> {catalog.facets.query(filters, limit=0)[0]} programs")
+
+    overview = catalog.overview
+    latencies = []
+    for i in range(args.queries):
+        t = time.perf_counter()
+        overview.ranking(*RANKINGS[i % len(RANKINGS)])
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+    first = latencies[-1]
+    print(f"overview: {len(overview)} universities in {len(overview.regions())} regions, "
+          f"rankings p50 {pct(0.5):.4f} ms, p99 {pct(0.99):.4f} ms, first (rebuild) {first * 1000:.2f} ms")
+    for sort, uni_type, city in RANKINGS[1:]:
+        top = overview.ranking(sort, uni_type, city)[:1]
+        print(f"  {sort:<9} {str(uni_type):<16} {str(city):<10} -> "
+              f"{[(s.name, s.city, s.min_score, s.min_cost, s.budget_programs) for s in top]}")
+
+    before = dict(catalog.stats)
+    t = time.perf_counter()
+    await catalog.refresh()
+    unchanged = time.perf_counter() - t
+    calls = dict(client.calls)
+    print(f"refresh, nothing changed: {unchanged * 1000:.1f} ms, "
+          f"worksheets reindexed {catalog.stats['worksheets_reindexed'] - before['worksheets_reindexed']}, "
+          f"values_batch_get calls {calls.get('values_batch_get', 0)}")
+
+    worksheet = client.spreadsheets[f"state-{CITIES_RU[0]}"].worksheet('u0')
+    worksheet.update_cell(2, 2, "Искусственный интеллект")
+    before = dict(catalog.stats)
+    t = time.perf_counter()
+    await catalog.refresh()
+    changed = time.perf_counter() - t
+    print(f"refresh, one worksheet changed: {changed * 1000:.1f} ms, "
+          f"worksheets reindexed {catalog.stats['worksheets_reindexed'] - before['worksheets_reindexed']}, "
+          f"found: {[d.title for d in catalog.index.search('intellekt', limit=3)]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--universities', type=int, default=15, help='universities per sheet')
+    parser.add_argument('--programs', type=int, default=40, help='programs per university')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,154 @@
+"""
+Startup benchmark: serial vs staged initialization.
+
+1. Imports: wall time of `import bot` in a fresh interpreter (median of
+   several runs) and the heaviest app modules by cumulative import time.
+2. Start: time until the bot accepts updates and until all sheet managers are
+   connected, with simulated Google latency (FakeSheetsClient from
+   benchmarks/fakes.py plus a delay per OAuth authorization).
+   serial  - the old main(): set_my_commands, then four managers each
+             authorizing and opening its spreadsheet one after another;
+   staged  - main() now: one shared authorization, managers connected
+             concurrently after the dispatcher has started, /start answered
+             while the sheets are still connecting.
+
+    python -m benchmarks.startup [--auth-latency fixed:600] [--sheets-latency lognormal:400:0.3]
+        [--telegram-latency uniform:40:90] [--import-runs 5]
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+os.environ.setdefault('SUPPORT_GROUP_ID', '0')
+
+from aiogram import Bot
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import app.utils.google_sheets as google_sheets
+from app.core.startup import StartupTimer, BackendInitializer
+from app.middlewares.backend_ready import setup_backend_ready_middleware
+from app.utils.exode_stub import parse_latency
+from app.utils.google_sheets import RegistrationGSheet, UniversitiesGSheet, CoursesGSheet, ProfessionsGSheet
+from benchmarks.fakes import FakeSheetsClient, FakeTelegramSession, build_fake_managers
+from benchmarks.load_test import VirtualUser
+from bot import build_dispatcher, set_main_menu
+
+# (ключ диспетчера, класс менеджера, ключ таблицы в FakeSheetsClient)
+MANAGERS = [
+    ('registration_manager', RegistrationGSheet, 'registration'),
+    ('courses_manager', CoursesGSheet, 'courses'),
+    ('professions_manager', ProfessionsGSheet, 'professions'),
+    ('universities_manager', UniversitiesGSheet, 'registration'),
+]
+
+
+def measure_imports(runs: int):
+    env = {**os.environ, 'PYTHONPATH': os.getcwd()}
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import bot'], env=env, check=True)
+        times.append(time.perf_counter() - started)
+    print(f"import bot: median {statistics.median(times) * 1000:.0f} ms over {runs} runs (interpreter start included)")
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import bot'],
+                            env=env, check=True, capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s+(app\.\S+)$', line)
+        if match:
+            modules.append((int(match.group(1)), match.group(2)))
+    print("heaviest app modules (cumulative):")
+    for us, name in sorted(modules, reverse=True)[:8]:
+        print(f"  {name:<45} {us / 1000:8.1f} ms")
+
+
+def patch_authorization(client: FakeSheetsClient, auth_latency, shared: bool):
+    """Replace google_sheets.get_client with a fake OAuth handshake returning `client`."""
+    lock = threading.Lock()
+    state = {'authorized': False}
+
+    def get_client():
+        with lock:
+            if not (shared and state['authorized']):
+                client.calls['authorize'] += 1
+                time.sleep(auth_latency())
+                state['authorized'] = True
+        return client
+    google_sheets.get_client = get_client
+
+
+async def run_serial(args, lexicon: dict) -> dict:
+    client = FakeSheetsClient(parse_latency(args.sheets_latency))
+    build_fake_managers(client)
+    patch_authorization(client, parse_latency(args.auth_latency), shared=False)
+    bot = Bot(token='42:STARTUP', session=FakeTelegramSession(parse_latency(args.telegram_latency)))
+
+    started = time.perf_counter()
+    await set_main_menu(bot, lexicon)
+    for _, manager_cls, key in MANAGERS:
+        manager_cls(key)
+    ready = time.perf_counter() - started
+    return {'accepting_updates': ready, 'first_reply': None, 'sheets_ready': ready, 'calls': dict(client.calls)}
+
+
+async def run_staged(args, lexicon: dict) -> dict:
+    client = FakeSheetsClient(parse_latency(args.sheets_latency))
+    fake = build_fake_managers(client)
+    patch_authorization(client, parse_latency(args.auth_latency), shared=True)
+    session = FakeTelegramSession(parse_latency(args.telegram_latency))
+    bot = Bot(token='42:STARTUP', session=session)
+
+    timer = StartupTimer()
+    managers = {name: manager_cls(key, connect=False) for name, manager_cls, key in MANAGERS}
+    initializer = BackendInitializer(timer)
+    for name, manager in managers.items():
+        initializer.add(name, manager)
+    dp = build_dispatcher(bot, MemoryStorage(), lexicon, state_uni_ids_by_city=fake['state_uni_ids_by_city'],
+                          **managers)
+    setup_backend_ready_middleware(dp, initializer)
+    dp.startup.register(initializer.start)
+    dp.shutdown.register(initializer.stop)
+    dp.startup.register(initializer.defer(functools.partial(set_main_menu, bot, lexicon)))
+    await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+    accepting = timer.mark('accepting_updates')
+
+    user = VirtualUser(7 * 10 ** 8, bot, session, None)
+    await dp.feed_update(bot, user.text_update('/start'))
+    first_reply = time.perf_counter() - timer.started
+
+    await initializer.wait()
+    await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+    return {'accepting_updates': accepting, 'first_reply': first_reply,
+            'sheets_ready': timer.phases['sheets_ready'], 'calls': dict(client.calls)}
+
+
+async def main(args):
+    with open('texts.json', 'r', encoding='utf-8') as f:
+        lexicon = json.load(f)
+    results = {'serial': await run_serial(args, lexicon), 'staged': await run_staged(args, lexicon)}
+
+    ms = lambda v: f"{v * 1000:10.0f}" if v is not None else f"{'-':>10}"
+    print(f"\n{'mode':<8} {'accepting':>10} {'/start':>10} {'sheets':>10}  ms   Sheets calls")
+    for mode, r in results.items():
+        print(f"{mode:<8} {ms(r['accepting_updates'])} {ms(r['first_reply'])} {ms(r['sheets_ready'])}       {r['calls']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--auth-latency', default='fixed:600', help='OAuth handshake latency spec')
+    parser.add_argument('--sheets-latency', default='lognormal:400:0.3', help='Google Sheets call latency spec')
+    parser.add_argument('--telegram-latency', default='uniform:40:90', help='Bot API latency spec')
+    parser.add_argument('--import-runs', type=int, default=5)
+    args = parser.parse_args()
+    measure_imports(args.import_runs)
+    asyncio.run(main(args))
@@ -1,4 +1,8 @@
+import time
+PROCESS_STARTED = time.perf_counter()  # до тяжёлых импортов, для замеров старта
+
 import asyncio
+import functools
 import logging
 from os import getenv
 import json
@@ -7,6 +11,7 @@ from aiogram import Bot, Dispatcher, F, types
 from aiogram.types import BotCommand
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from dotenv import load_dotenv
@@ -14,8 +19,24 @@ from aiogram.filters import CommandStart, Command
 
 # --- ИМПОРТЫ ---
 from app.utils.google_sheets import RegistrationGSheet, UniversitiesGSheet, CoursesGSheet, ProfessionsGSheet
+from app.utils.exode_state_cache import ExodeStateCache
+from app.utils.reconciliation import SheetsExodeReconciler
+from app.utils.catalog import CatalogRegistry
+from app.utils.message_cleanup import drain_cleanups
+from app.utils.broadcast import Broadcaster
+from app.utils.university_catalog import UniversityCatalog, new_search_index
+from app.utils.content_catalog import ContentCatalog
+from app.utils.inline_search import InlineSearch
+from app.utils.ai_helpers import RecommendationService, create_backend
+from app.utils.profession_matcher import ProfessionMatcher
+from app.utils.professions_tree import ProfessionsNavigator
+from app.utils.test_attempts import TestAttemptStore
+from app.core.webhook import run_webhook
+from app.core.storage import SQLiteStorage
+from app.core.metrics_server import MetricsServer
+from app.core.startup import StartupTimer, BackendInitializer
 from app.core.config import (
-    REGISTRATION_SHEET_ID, COURSES_SHEET_ID, PRIVATE_UNIVERSITIES_SHEET_ID, 
+    BOT_MODE, FSM_STORAGE, FSM_DB_PATH, REGISTRATION_SHEET_ID, COURSES_SHEET_ID, PRIVATE_UNIVERSITIES_SHEET_ID, 
     FOREIGN_UNIVERSITIES_SHEET_ID, PROFESSIONS_SHEET_ID, STATE_UNIVERSITIES_BY_CITY
 )
 
@@ -32,6 +53,13 @@ from app.handlers import stem_navigator as stem_navigator_router_module
 from app.handlers import main_menu as main_menu_router_module
 from app.handlers import support as support_router_module
 from app.handlers import professions as professions_router_module
+from app.handlers import errors as errors_router_module
+from app.handlers import admin as admin_router_module
+from app.handlers import inline_search as inline_search_router_module
+from app.middlewares.serialization import UserSerializationMiddleware
+from app.middlewares.recommendation_streams import RecommendationStreamMiddleware
+from app.middlewares.metrics import setup_metrics_middlewares
+from app.middlewares.backend_ready import setup_backend_ready_middleware
 
 async def set_main_menu(bot: Bot, lexicon: dict):
     """Создает и устанавливает меню быстрых команд (slash commands)."""
@@ -39,6 +67,7 @@ async def set_main_menu(bot: Bot, lexicon: dict):
         BotCommand(command="/start", description="🚀 Перезапустить / Главное меню"),
         BotCommand(command="/menu", description="🏠 Главное меню"),
         BotCommand(command="/profile", description="👤 Мой профиль"),
+        BotCommand(command="/search", description="🔎 Поиск вузов и программ"),
         BotCommand(command="/support", description="💬 Поддержка")
     ]
     await bot.set_my_commands(commands_ru, language_code="ru")
@@ -46,41 +75,60 @@ async def set_main_menu(bot: Bot, lexicon: dict):
         BotCommand(command="/start", description="🚀 Qayta boshlash / Bosh menyu"),
         BotCommand(command="/menu", description="🏠 Bosh menyu"),
         BotCommand(command="/profile", description=lexicon['uz'].get('button-student-main-menu-profile', '👤 Profil')),
+        BotCommand(command="/search", description="🔎 OTM va dasturlarni qidirish"),
         BotCommand(command="/support", description=lexicon['uz'].get('button-student-main-menu-support', '💬 Qo\'llab-quvvatlash'))
     ]
     await bot.set_my_commands(commands_uz, language_code="uz")
 
-async def main() -> None:
-    load_dotenv()
-    TOKEN = getenv("BOT_TOKEN")
-    if not TOKEN:
-        logging.critical("Токен бота не найден!")
-        return
-
-    storage = MemoryStorage()
+def build_dispatcher(
+    bot: Bot,
+    storage: BaseStorage,
+    lexicon: dict,
+    registration_manager: RegistrationGSheet,
+    universities_manager: UniversitiesGSheet,
+    courses_manager: CoursesGSheet,
+    professions_manager: ProfessionsGSheet,
+    state_uni_ids_by_city: dict = STATE_UNIVERSITIES_BY_CITY
+) -> Dispatcher:
+    """
+    Собирает диспетчер: middleware, зависимости обработчиков и все роутеры.
+    Используется и ботом, и нагрузочным тестом (benchmarks/load_test.py).
+    Роутеры модулей подключаются один раз за процесс.
+    """
     dp = Dispatcher(storage=storage)
-    bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    with open('texts.json', 'r', encoding='utf-8') as f:
-        lexicon = json.load(f)
+    # Замеры времени апдейтов, обработчиков и запросов к Bot API
+    setup_metrics_middlewares(dp, bot)
+    # Советы ИИ пишутся в фоне; следующее действие пользователя их останавливает,
+    # даже если само действие ещё ждёт своей очереди
+    dp['recommendations'] = RecommendationService(create_backend())
+    dp.update.outer_middleware(RecommendationStreamMiddleware(dp['recommendations']))
+    # Апдейты одного пользователя обрабатываются по очереди
+    dp.update.outer_middleware(UserSerializationMiddleware())
+
     dp['lexicon'] = lexicon
-    await set_main_menu(bot, lexicon)
-    try:
-        registration_manager = RegistrationGSheet(REGISTRATION_SHEET_ID)
-        courses_manager = CoursesGSheet(COURSES_SHEET_ID)
-        professions_manager = ProfessionsGSheet(PROFESSIONS_SHEET_ID)
-        universities_manager = UniversitiesGSheet(REGISTRATION_SHEET_ID)
-
-        dp['registration_manager'] = registration_manager
-        dp['universities_manager'] = universities_manager
-        dp['courses_manager'] = courses_manager
-        dp['professions_manager'] = professions_manager
-        dp['state_uni_ids_by_city'] = STATE_UNIVERSITIES_BY_CITY
-        
-        logging.info("Менеджеры Google Sheets успешно инициализированы.")
-        
-    except Exception as e:
-        logging.critical(f"КРИТИЧЕСКАЯ ОШИБКА при подключении к Google Sheets: {e}", exc_info=True)
-        return 
+    # Общие снимки каталогов: в FSM хранятся только их ID и индексы
+    dp['catalog_registry'] = CatalogRegistry()
+    dp['registration_manager'] = registration_manager
+    dp['universities_manager'] = universities_manager
+    dp['courses_manager'] = courses_manager
+    dp['professions_manager'] = professions_manager
+    dp['state_uni_ids_by_city'] = state_uni_ids_by_city
+    # Все таблицы вузов в памяти и поисковый индекс по ним; загружаются после старта
+    dp['university_catalog'] = UniversityCatalog(universities_manager, state_uni_ids_by_city, new_search_index())
+    # Профессии и курсы в памяти; по ним и по каталогу вузов работает inline-режим
+    dp['content_catalog'] = ContentCatalog(professions_manager, courses_manager)
+    dp['inline_search'] = InlineSearch(dp['content_catalog'], dp['university_catalog'])
+    # Подбор профессий по результатам теста; матрица пересобирается при изменении каталога
+    dp['profession_matcher'] = ProfessionMatcher(dp['content_catalog'])
+    # Дерево шкала -> направление -> профессии для меню профессий; без обращений к таблице на клик
+    dp['professions_navigator'] = ProfessionsNavigator(dp['content_catalog'])
+    # Советы ИИ на экране результатов теста: пул воркеров и кэш по ответам
+    dp.shutdown.register(dp['recommendations'].stop)
+    # Журнал прохождений теста и агрегаты по городам, возрастам и ролям
+    dp['test_attempts'] = TestAttemptStore()
+    dp.startup.register(dp['test_attempts'].start)
+    dp.shutdown.register(dp['test_attempts'].stop)
+    dp.shutdown.register(drain_cleanups)
 
     # --- Устанавливаем ПРАВИЛЬНЫЙ ПОРЯДОК ПОДКЛЮЧЕНИЯ ---
     
@@ -109,7 +157,7 @@ async def main() -> None:
         role = user_data.get('role')
         if menu_msg_id := user_data.get('main_menu_message_id'):
             try:
-                await bot.delete_message(message.chat.id, menu_msg_id)
+                await message.bot.delete_message(message.chat.id, menu_msg_id)
             except Exception:
                 pass
         is_parent = role == 'parent'
@@ -167,6 +215,7 @@ async def main() -> None:
                 text=text,
                 reply_markup=get_student_welcome_keyboard(lexicon=lexicon, lang=lang)
             )
+    dp.include_router(admin_router_module.router)
     dp.include_router(student_router_module.router)
     dp.include_router(parent_router_module.router)
     dp.include_router(parent_actions_router_module.router)
@@ -176,9 +225,96 @@ async def main() -> None:
     dp.include_router(stem_navigator_router_module.router)
     dp.include_router(support_router_module.router)
     dp.include_router(professions_router_module.router)
+    dp.include_router(inline_search_router_module.router)
     dp.include_router(main_menu_router_module.router)
+    dp.include_router(errors_router_module.router)
     
-    await bot.delete_webhook(drop_pending_updates=True)
+    return dp
+
+
+async def main() -> None:
+    timer = StartupTimer(PROCESS_STARTED)
+    timer.mark('imports')
+    load_dotenv()
+    TOKEN = getenv("BOT_TOKEN")
+    if not TOKEN:
+        logging.critical("Токен бота не найден!")
+        return
+
+    # Состояния переживают перезапуск; FSM_STORAGE=memory возвращает MemoryStorage
+    storage = SQLiteStorage(FSM_DB_PATH) if FSM_STORAGE == 'sqlite' else MemoryStorage()
+    bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    with open('texts.json', 'r', encoding='utf-8') as f:
+        lexicon = json.load(f)
+    timer.mark('config')
+
+    # Таблицы открываются в фоне после старта: бот принимает апдейты сразу,
+    # а обработчики, которым нужен ещё не подключённый менеджер, ждут его
+    registration_manager = RegistrationGSheet(REGISTRATION_SHEET_ID, connect=False)
+    courses_manager = CoursesGSheet(COURSES_SHEET_ID, connect=False)
+    professions_manager = ProfessionsGSheet(PROFESSIONS_SHEET_ID, connect=False)
+    universities_manager = UniversitiesGSheet(REGISTRATION_SHEET_ID, connect=False)
+    initializer = BackendInitializer(timer)
+    initializer.add('registration_manager', registration_manager)
+    initializer.add('courses_manager', courses_manager)
+    initializer.add('professions_manager', professions_manager)
+    initializer.add('universities_manager', universities_manager)
+
+    dp = build_dispatcher(
+        bot, storage, lexicon,
+        registration_manager=registration_manager,
+        universities_manager=universities_manager,
+        courses_manager=courses_manager,
+        professions_manager=professions_manager
+    )
+    setup_backend_ready_middleware(dp, initializer)
+    dp.startup.register(initializer.start)
+    dp.shutdown.register(initializer.stop)
+    # Команды меню меняются редко — не задерживаем ими старт
+    dp.startup.register(initializer.defer(functools.partial(set_main_menu, bot, lexicon)))
+    timer.mark('dispatcher')
+
+    metrics_server = MetricsServer()
+    dp.startup.register(metrics_server.start)
+    dp.shutdown.register(metrics_server.stop)
+
+    exode_state_cache = ExodeStateCache()
+    dp['exode_state_cache'] = exode_state_cache
+    dp.shutdown.register(exode_state_cache.close)
+
+    # Фоновая сверка Exode ID детей в таблице с Exode
+    reconciler = SheetsExodeReconciler(registration_manager)
+    dp.startup.register(initializer.defer(reconciler.start, 'registration_manager'))
+    dp.shutdown.register(reconciler.stop)
+
+    # Рассылки администраторов; незавершённая рассылка продолжается после перезапуска
+    broadcaster = Broadcaster(bot, registration_manager)
+    dp['broadcaster'] = broadcaster
+    dp.startup.register(initializer.defer(broadcaster.resume, 'registration_manager'))
+    dp.shutdown.register(broadcaster.stop)
+
+    # Поиск по вузам и программам: индекс строится, когда подключена таблица вузов
+    university_catalog = dp['university_catalog']
+    dp.startup.register(initializer.defer(university_catalog.start, 'universities_manager'))
+    dp.shutdown.register(university_catalog.stop)
+
+    # Inline-режим: профессии и курсы загружаются, когда подключены их таблицы
+    content_catalog = dp['content_catalog']
+    dp.startup.register(initializer.defer(content_catalog.start, 'professions_manager', 'courses_manager'))
+    dp.shutdown.register(content_catalog.stop)
+
+    async def accepting_updates():
+        timer.mark('accepting_updates')
+    # Регистрируется последним: срабатывает после остальных startup-хуков
+    dp.startup.register(accepting_updates)
+
+    if BOT_MODE == 'webhook':
+        if await run_webhook(dp, bot):
+            return
+        logging.warning("Не удалось запустить webhook, переключаемся на polling.")
+
+    # Обновления, накопившиеся за время перезапуска, не сбрасываем
+    await bot.delete_webhook(drop_pending_updates=False)
     await dp.start_polling(bot)
 
 